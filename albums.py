@@ -0,0 +1,78 @@
+"""
+Альбомы (несколько фото) в анонсах.
+
+Альбом приходит в бота отдельными сообщениями с общим media_group_id - по
+апдейту на каждое фото. AlbumBuffer копит их, пока части приходят чаще
+ALBUM_WINDOW_SECONDS, и передает обработчику разом: альбом записывается
+в таблицу event_photos одной транзакцией, а не перезаписывает фото анонса
+на каждой части. Первое фото альбома - обложка (events.photo_file_id):
+с ней работают дайджест, поиск дубликатов и прежние посты с одним фото.
+
+Telegram не позволяет прикрепить кнопки к альбому, поэтому в предпросмотре
+и на модерации альбом отправляется отдельно, а за ним - текст с кнопками.
+В канале текст анонса - подпись к первому фото, кнопок «Иду» у такого поста нет.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from config import ALBUM_WINDOW_SECONDS, MAX_ALBUM_PHOTOS
+from media import send_photo_group
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class AlbumBuffer:
+    """Сборка альбома из апдейтов с общим media_group_id"""
+
+    def __init__(self, window: float = ALBUM_WINDOW_SECONDS, max_photos: int = MAX_ALBUM_PHOTOS):
+        self.window = window
+        self.max_photos = max_photos
+        self._parts: Dict[str, list] = {}
+        self._last_part: Dict[str, float] = {}
+        # Ссылки на задачи сборки, чтобы они не были собраны сборщиком мусора
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, update, on_complete: Callable[[list], Awaitable[None]]):
+        """
+        Часть альбома. on_complete вызывается один раз на альбом со списком
+        апдейтов по порядку сообщений (не больше max_photos).
+        """
+        key = update.message.media_group_id
+        self._last_part[key] = asyncio.get_running_loop().time()
+        parts = self._parts.get(key)
+        if parts is not None:
+            parts.append(update)
+            return
+        self._parts[key] = [update]
+        task = asyncio.create_task(self._collect(key, on_complete))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def pending(self) -> int:
+        return len(self._parts)
+
+    async def _collect(self, key: str, on_complete):
+        loop = asyncio.get_running_loop()
+        # Ждем, пока части альбома перестанут приходить
+        while True:
+            delay = self._last_part[key] + self.window - loop.time()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        updates = sorted(self._parts.pop(key), key=lambda update: update.message.message_id)
+        del self._last_part[key]
+        metrics.counter('albums.received_total').inc()
+        metrics.counter('albums.parts_total').inc(len(updates))
+        try:
+            await on_complete(updates[:self.max_photos])
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки альбома {key}: {e}", exc_info=True)
+
+buffer = AlbumBuffer()
+
+async def send_album(bot, chat_id, file_ids: List[str], destination: str,
+                     caption: Optional[str] = None, parse_mode: Optional[str] = None) -> list:
+    """Отправка альбома; подпись (если есть) - у первого фото. Возвращает сообщения альбома"""
+    items = [(file_id, caption if position == 0 else None) for position, file_id in enumerate(file_ids)]
+    return await send_photo_group(bot, chat_id, items, destination, parse_mode=parse_mode)
@@ -0,0 +1,115 @@
+"""
+Бенчмарк индекса дубликатов (duplicates.py).
+
+    python -m benchmarks.duplicates [--events 100000] [--queries 2000] [--budget-ms 1.0]
+
+Строит индекс из синтетических анонсов, затем ищет:
+- почти-дубликаты (анонс из индекса с несколькими измененными словами),
+- новые анонсы, которых в индексе нет.
+
+Отдельно измеряются подпись текста (MinHash) и поиск в индексе по готовой
+подписи. При превышении бюджета на p99 поиска скрипт завершается
+с ненулевым кодом.
+"""
+import sys
+import time
+import random
+import argparse
+import resource
+
+from duplicates import DuplicateIndex, announcement_text, signature
+
+WORDS = (
+    'прогулка парк набережная река кофе чай книги музей выставка лес озеро '
+    'велосипед пикник закат рассвет фотографии архитектура история город мост '
+    'площадь двор сквер собака концерт лекция экскурсия тропа холм поле сад '
+    'вечер утро выходные встреча знакомство разговор игры настолки бег йога '
+    'музыка гитара кино театр рынок старый новый тихий большой маленький '
+    'зеленый центральный северный южный берег остров пристань маяк фонтан'
+).split()
+
+def synthetic_event(rnd: random.Random, event_id: int) -> dict:
+    return {
+        'id': event_id,
+        'user_id': rnd.randrange(1, 20000),
+        'theme': ' '.join(rnd.choices(WORDS, k=rnd.randint(2, 5))),
+        'place': ' '.join(rnd.choices(WORDS, k=rnd.randint(1, 3))) + f' {rnd.randint(1, 200)}',
+        'description': ' '.join(rnd.choices(WORDS, k=rnd.randint(10, 40))),
+    }
+
+def mutate(rnd: random.Random, event: dict, changes: int) -> dict:
+    """Копия анонса с несколькими замененными словами в описании"""
+    words = event['description'].split()
+    for _ in range(changes):
+        words[rnd.randrange(len(words))] = rnd.choice(WORDS)
+    return dict(event, id=-1, description=' '.join(words))
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def report(name: str, seconds) -> float:
+    ms = [s * 1000 for s in seconds]
+    p99 = percentile(ms, 0.99)
+    print(f"  {name:22s} p50={percentile(ms, 0.5):.3f} p95={percentile(ms, 0.95):.3f} "
+          f"p99={p99:.3f} max={max(ms):.3f} ms")
+    return p99
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--changes', type=int, default=2, help='сколько слов менять в почти-дубликатах')
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--budget-ms', type=float, default=1.0, help='бюджет на p99 поиска (мс)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    events = [synthetic_event(rnd, event_id) for event_id in range(1, args.events + 1)]
+
+    index = DuplicateIndex()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started_at = time.perf_counter()
+    for event in events:
+        index.add(event)
+    build_seconds = time.perf_counter() - started_at
+    memory = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+    print(f"index: {len(index)} events, build {build_seconds:.1f} s "
+          f"({build_seconds / len(events) * 1e6:.0f} us/event), ~{memory / 2 ** 20:.0f} MiB")
+
+    originals = rnd.sample(events, min(args.queries, len(events)))
+    near = [mutate(rnd, event, args.changes) for event in originals]
+    fresh = [synthetic_event(rnd, -1) for _ in range(args.queries)]
+
+    sign_times, near_times, fresh_times = [], [], []
+    found = false_positives = 0
+    for original, query in zip(originals, near):
+        t = time.perf_counter()
+        sig = signature(announcement_text(query))
+        sign_times.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        matches = index.lookup(sig, args.threshold, exclude_id=query['id'])
+        near_times.append(time.perf_counter() - t)
+        found += any(match.event_id == original['id'] for match in matches)
+
+    for query in fresh:
+        sig = signature(announcement_text(query))
+        t = time.perf_counter()
+        matches = index.lookup(sig, args.threshold, exclude_id=query['id'])
+        fresh_times.append(time.perf_counter() - t)
+        false_positives += bool(matches)
+
+    print(f"queries: {len(near)} near-duplicates ({args.changes} words changed), {len(fresh)} fresh")
+    report('signature', sign_times)
+    p99 = max(report('lookup (near-dup)', near_times), report('lookup (fresh)', fresh_times))
+    print(f"  recall {found / len(near):.1%}, fresh texts flagged {false_positives / len(fresh):.1%}")
+
+    if p99 > args.budget_ms:
+        print(f"FAIL: lookup p99 {p99:.3f} ms exceeds budget {args.budget_ms} ms")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Проверка и микробенчмарк разбора времени прогулки (eventtime.py).
+
+    python -m benchmarks.eventtime [--rounds 20000]
+
+Сначала фразы из примеров мастера и известных ошибок разбираются
+относительно фиксированного «сейчас» и сверяются с ожидаемым временем:
+при расхождении скрипт печатает его и завершается с ненулевым кодом
+(ошибка во времени начала сдвигает архивирование, напоминания и подбор
+подписок). Затем измеряется время разбора одной фразы.
+"""
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from eventtime import TIMEZONE, parse_event_time
+
+# Понедельник, полдень
+NOW = datetime(2026, 10, 19, 12, 0, tzinfo=TIMEZONE)
+
+CASES = (
+    ('Сегодня в 7 вечера', datetime(2026, 10, 19, 19, 0)),
+    ('завтра в 8 вечера', datetime(2026, 10, 20, 20, 0)),
+    ('Завтра в 8 утра', datetime(2026, 10, 20, 8, 0)),
+    ('в 5', datetime(2026, 10, 19, 17, 0)),
+    ('в 3 часа дня', datetime(2026, 10, 19, 15, 0)),
+    ('7 вечера', datetime(2026, 10, 19, 19, 0)),
+    ('сегодня в 12 ночи', datetime(2026, 10, 20, 0, 0)),
+    ('в 12 дня', datetime(2026, 10, 19, 12, 0)),
+    ('в 7:30 вечера', datetime(2026, 10, 19, 19, 30)),
+    ('Сегодня в 5', datetime(2026, 10, 19, 17, 0)),
+    ('в 14', datetime(2026, 10, 19, 14, 0)),
+    ('Завтра в 18:00', datetime(2026, 10, 20, 18, 0)),
+    ('25 декабря, 12:30', datetime(2026, 12, 25, 12, 30)),
+    ('Суббота, 15 декабря в 14:00', datetime(2026, 12, 15, 14, 0)),
+    ('Суббота в 14:00', datetime(2026, 10, 24, 14, 0)),
+    ('25.12 19:30', datetime(2026, 12, 25, 19, 30)),
+    ('понедельник 10:00', datetime(2026, 10, 26, 10, 0)),
+)
+
+def check() -> int:
+    failures = 0
+    for text, expected in CASES:
+        expected = expected.replace(tzinfo=TIMEZONE)
+        got = parse_event_time(text, NOW)
+        status = 'ok' if got == expected else 'FAIL'
+        failures += got != expected
+        print(f"  {status:4} {text!r:34} {got:%Y-%m-%d %H:%M}" if got else f"  {status:4} {text!r:34} None")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"phrases relative to {NOW:%Y-%m-%d %H:%M %a}:")
+    failures = check()
+
+    texts = [text for text, _ in CASES]
+    started = time.perf_counter()
+    for number in range(args.rounds):
+        parse_event_time(texts[number % len(texts)], NOW)
+    print(f"\nparse_event_time: {(time.perf_counter() - started) / args.rounds * 1e6:.1f} us/phrase")
+
+    if failures:
+        print(f"❌ {failures} of {len(CASES)} phrases parsed wrong")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+Локальная замена Telegram Bot API для нагрузочных тестов.
+
+HTTP-сервер на asyncio отвечает на getUpdates, sendMessage, sendPhoto,
+editMessageText, answerCallbackQuery и другие методы, которые вызывает бот.
+Апдейты для getUpdates кладет сценарий (FakeTelegramServer.push_update),
+а все исходящие сообщения бота записываются, чтобы сценарий мог дождаться
+ответа и нажать кнопку из присланной клавиатуры.
+
+Можно добавить задержку ответа и случайные ответы 429 Too Many Requests.
+"""
+import json
+import time
+import random
+import asyncio
+import email.parser
+import email.policy
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from benchmarks.offline import fake_result
+
+class FakeTelegramServer:
+    """Фейковый сервер Bot API"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0, latency_jitter: float = 0.0,
+                 rate_limit_prob: float = 0.0, retry_after: int = 1,
+                 seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit_prob = rate_limit_prob
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._updates: List[Dict[str, Any]] = []
+        self._updates_event = asyncio.Event()
+        self._next_update_id = 1
+
+        # Статистика
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.rate_limited: Dict[str, int] = defaultdict(int)
+        self.sent_per_chat: Dict[int, int] = defaultdict(int)
+
+        # Исходящие сообщения бота
+        self.buttons: Dict[str, Tuple[int, int]] = {}
+        self.last_keyboard: Dict[int, Tuple[int, List[str]]] = {}
+        self._waiters: Dict[int, List[Tuple[Callable, asyncio.Future]]] = defaultdict(list)
+
+    # --- Жизненный цикл -------------------------------------------------------
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    @property
+    def base_url(self) -> str:
+        """Значение для ApplicationBuilder.base_url"""
+        return f'http://{self.host}:{self.port}/bot'
+
+    # --- API для сценариев ----------------------------------------------------
+
+    def next_update_id(self) -> int:
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        return update_id
+
+    def push_update(self, update: Dict[str, Any]) -> int:
+        """Добавление апдейта в очередь getUpdates"""
+        update_id = self.next_update_id()
+        self._updates.append(dict(update, update_id=update_id))
+        self._updates_event.set()
+        return update_id
+
+    def expect(self, chat_id: int, predicate: Callable[[str, Dict], bool] = None) -> asyncio.Future:
+        """
+        Future, который завершится при следующем вызове API, адресованном chat_id
+        (и удовлетворяющем predicate(method, params)). Регистрировать до push_update.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[int(chat_id)].append((predicate, future))
+        return future
+
+    def find_button(self, prefix: str, chat_id: int) -> Optional[Tuple[str, int]]:
+        """Поиск кнопки по префиксу callback_data в последней клавиатуре чата"""
+        message_id, callbacks = self.last_keyboard.get(int(chat_id), (None, []))
+        for data in callbacks:
+            if data.startswith(prefix):
+                return data, message_id
+        return None
+
+    def button_message(self, callback_data: str) -> Optional[Tuple[int, int]]:
+        """Чат и сообщение, в котором бот прислал кнопку с точным callback_data"""
+        return self.buttons.get(callback_data)
+
+    # --- HTTP -----------------------------------------------------------------
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, value = line.decode('latin-1').split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                body = b''
+                if 'content-length' in headers:
+                    body = await reader.readexactly(int(headers['content-length']))
+
+                status, payload = await self._dispatch(path, headers.get('content-type', ''), body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                    f'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(data)}\r\n'
+                    f'Connection: keep-alive\r\n\r\n'.encode() + data
+                )
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError, BrokenPipeError, asyncio.CancelledError):
+            # Клиент закрыл соединение или сервер останавливается
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_body(content_type: str, body: bytes) -> Dict[str, Any]:
+        if not body:
+            return {}
+        if content_type.startswith('application/json'):
+            return json.loads(body)
+        if content_type.startswith('multipart/form-data'):
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+            )
+            params = {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                if part.get_filename():
+                    params[name] = f'<upload {part.get_filename()}>'
+                else:
+                    params[name] = part.get_content()
+            return params
+        return dict(parse_qsl(body.decode()))
+
+    @staticmethod
+    def _decode_values(params: Dict[str, Any]) -> Dict[str, Any]:
+        """PTB кодирует сложные значения (клавиатуры, media) как JSON-строки"""
+        decoded = {}
+        for key, value in params.items():
+            if isinstance(value, str) and value[:1] in ('{', '['):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            decoded[key] = value
+        return decoded
+
+    async def _dispatch(self, path: str, content_type: str, body: bytes) -> Tuple[int, Dict]:
+        method = path.rsplit('/', 1)[-1]
+        params = self._decode_values(self._parse_body(content_type, body))
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': await self._get_updates(params)}
+
+        delay = self.latency + (self._random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.rate_limit_prob and self._random.random() < self.rate_limit_prob:
+            self.rate_limited[method] += 1
+            return 429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }
+
+        result = fake_result(method, params)
+        self._record(method, params, result)
+        return 200, {'ok': True, 'result': result}
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        # Подтвержденные апдейты больше не отдаем
+        if offset:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+
+        if not self._updates and timeout:
+            self._updates_event.clear()
+            try:
+                await asyncio.wait_for(self._updates_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _record(self, method: str, params: Dict[str, Any], result: Any):
+        chat_id = params.get('chat_id')
+        if chat_id is None:
+            return
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            return
+
+        if method.startswith('send'):
+            self.sent_per_chat[chat_id] += 1
+
+        message_id = result.get('message_id') if isinstance(result, dict) else params.get('message_id')
+        markup = params.get('reply_markup')
+        if isinstance(markup, dict) and 'inline_keyboard' in markup:
+            callbacks = [
+                button['callback_data']
+                for row in markup['inline_keyboard'] for button in row
+                if 'callback_data' in button
+            ]
+            self.last_keyboard[chat_id] = (int(message_id or 0), callbacks)
+            for data in callbacks:
+                self.buttons[data] = (chat_id, int(message_id or 0))
+
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        for entry in list(waiters):
+            predicate, future = entry
+            if future.done():
+                waiters.remove(entry)
+            elif predicate is None or predicate(method, params):
+                waiters.remove(entry)
+                future.set_result((method, params, time.perf_counter()))
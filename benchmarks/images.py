@@ -0,0 +1,81 @@
+"""
+Проверка и бенчмарк обработки изображений (media.process_image).
+
+    python -m benchmarks.images [--rounds 20]
+
+Сначала набор файлов, которые пользователи присылают в мастер, прогоняется
+через process_image: годные изображения должны пройти, негодные - вызвать
+ImageValidationError (любое другое исключение оборвало бы шаг мастера).
+Среди них - «бомба»: PNG в сотню байт с заголовком на сотни миллионов
+пикселей, который проходит лимит MAX_PHOTO_SIZE по байтам. При расхождении
+скрипт завершается с ненулевым кодом. Затем измеряется нормализация
+фото-документа.
+"""
+import io
+import sys
+import time
+import zlib
+import struct
+import argparse
+
+from PIL import Image
+
+from media import ImageValidationError, process_image
+
+def encode(image: Image.Image, fmt: str = 'PNG') -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=fmt)
+    return output.getvalue()
+
+def png_header_only(width: int, height: int) -> bytes:
+    """PNG с заголовком на width×height пикселей и пустыми данными"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(b'')) + chunk(b'IEND', b'')
+
+# (название, байты файла, True - изображение должно быть принято)
+CASES = (
+    ('photo 1600x1200 jpeg', encode(Image.new('RGB', (1600, 1200), (90, 140, 200)), 'JPEG'), True),
+    ('document 4000x3000 png', encode(Image.new('RGBA', (4000, 3000), (255, 0, 0, 128))), True),
+    ('too small 100x100', encode(Image.new('RGB', (100, 100))), False),
+    ('too elongated 8000x250', encode(Image.new('L', (8000, 250))), False),
+    ('not an image', b'GIF89a but not really', False),
+    ('decompression bomb 20000x20000', png_header_only(20000, 20000), False),
+)
+
+def check() -> int:
+    failures = 0
+    for name, data, accepted in CASES:
+        try:
+            process_image(data, normalize=True)
+            outcome = 'accepted'
+        except ImageValidationError as e:
+            outcome = f'rejected: {e}'
+        except Exception as e:
+            outcome = f'CRASH {type(e).__name__}: {e}'
+        ok = outcome == 'accepted' if accepted else outcome.startswith('rejected')
+        failures += not ok
+        print(f"  {'ok' if ok else 'FAIL':4} {name:32} {len(data):>9} B  {outcome}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    print("process_image on user uploads:")
+    failures = check()
+
+    document = CASES[1][1]
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        process_image(document, normalize=True)
+    print(f"\nnormalize 4000x3000 png: {(time.perf_counter() - started) / args.rounds * 1000:.1f} ms/image")
+
+    if failures:
+        print(f"❌ {failures} of {len(CASES)} images handled wrong")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
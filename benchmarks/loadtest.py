@@ -0,0 +1,326 @@
+"""
+Нагрузочный тест: тысячи симулированных пользователей проходят мастер
+создания анонса и модерацию через фейковый Telegram Bot API.
+
+    python -m benchmarks.loadtest [--users 1000] [--concurrency 100]
+                                  [--latency-ms 0] [--rate-limit 0.0]
+                                  [--scenarios wizard,edit,moderation]
+                                  [--workers 0]
+
+Бот запускается целиком (create_application + polling), апдейты приходят
+через getUpdates, ответы бота перехватываются фейковым сервером.
+Сценарии выполняются фазами, поэтому для каждого считаются свои
+пропускная способность, перцентили задержки, вызовы API и операции с БД.
+
+С --workers N бот запускается в режиме кластера (cluster.py): апдейты
+идут через WebhookIngress в N процессов, работающих с одной базой.
+Операции с БД в этом режиме не считаются (они выполняются в других процессах).
+
+Сценарии:
+  wizard      - меню → тема → место → контакт → время → пропуск фото → описание → предпросмотр
+  edit        - изменение темы из предпросмотра
+  moderation  - отправка на модерацию и одобрение; второй администратор
+                одновременно нажимает ту же кнопку, в канал должен уйти один пост
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import itertools
+from collections import Counter
+from typing import Dict, List, Optional
+
+ADMIN_CHAT_ID = -1001000000001
+CHANNEL_ID = -1001000000002
+USER_ID_BASE = 10_000_000
+
+class OpCounter:
+    """Обертка над объектом БД, считающая вызовы методов"""
+
+    def __init__(self, target):
+        self._target = target
+        self.counts: Counter = Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        def counted(*args, **kwargs):
+            self.counts[name] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+class SimUser:
+    """Состояние одного симулированного пользователя"""
+
+    _message_ids = itertools.count(1)
+
+    def __init__(self, index: int):
+        self.user_id = USER_ID_BASE + index
+        self.event_id: Optional[int] = None
+        self.failed = False
+
+    def user_dict(self) -> Dict:
+        return {'id': self.user_id, 'is_bot': False, 'first_name': f'Sim{self.user_id}', 'username': f'sim{self.user_id}'}
+
+    def text_update(self, text: str) -> Dict:
+        return {'message': {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': self.user_id, 'type': 'private'},
+            'from': self.user_dict(),
+            'text': text,
+        }}
+
+    def callback_update(self, data: str, chat_id: int, message_id: int, from_user: Dict = None) -> Dict:
+        return {'callback_query': {
+            'id': str(next(self._message_ids)),
+            'chat_instance': str(chat_id),
+            'data': data,
+            'from': from_user or self.user_dict(),
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+                'text': '…',
+            },
+        }}
+
+ADMIN_USER = {'id': 1, 'is_bot': False, 'first_name': 'Admin'}
+SECOND_ADMIN_USER = {'id': 2, 'is_bot': False, 'first_name': 'Admin2'}
+
+class Scenario:
+    """Результаты одной фазы нагрузочного теста"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.duration = 0.0
+        self.api_calls: Dict[str, int] = {}
+        self.rate_limited = 0
+        self.db_ops: Dict[str, int] = {}
+        self.notes: List[str] = []
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def report(self) -> str:
+        steps = len(self.latencies)
+        throughput = steps / self.duration if self.duration else 0
+        lines = [
+            f"[{self.name}] steps={steps} errors={self.errors} duration={self.duration:.2f}s "
+            f"throughput={throughput:.1f} upd/s",
+            "  latency ms: " + " ".join(
+                f"{label}={self._percentile(self.latencies, q) * 1000:.1f}"
+                for label, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))
+            ),
+            "  api calls: " + ", ".join(f"{k}={v}" for k, v in sorted(self.api_calls.items())),
+            f"  429 responses: {self.rate_limited}",
+            "  db ops: " + ", ".join(f"{k}={v}" for k, v in sorted(self.db_ops.items())),
+        ]
+        if steps and self.db_ops:
+            lines.append(f"  db ops per update: {sum(self.db_ops.values()) / steps:.2f}")
+        lines.extend(f"  {note}" for note in self.notes)
+        return "\n".join(lines)
+
+class LoadTest:
+    def __init__(self, server, users: List[SimUser], timeout: float, deliver=None):
+        self.server = server
+        self.users = users
+        self.timeout = timeout
+        # Доставка апдейта боту: через getUpdates фейкового сервера или через webhook-вход
+        self.deliver = deliver or server.push_update
+
+    async def step(self, scenario: Scenario, user: SimUser, update: Dict,
+                   wait_chat: int = None, predicate=None) -> bool:
+        """Отправка апдейта и ожидание ответа бота"""
+        if user.failed:
+            return False
+        future = self.server.expect(wait_chat or user.user_id, predicate)
+        start = time.perf_counter()
+        self.deliver(update)
+        try:
+            _, _, finished = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            scenario.errors += 1
+            user.failed = True
+            return False
+        scenario.latencies.append(finished - start)
+        return True
+
+    async def click(self, scenario: Scenario, user: SimUser, prefix: str, predicate=None) -> bool:
+        button = self.server.find_button(prefix, user.user_id)
+        if not button:
+            scenario.errors += 1
+            user.failed = True
+            return False
+        data, message_id = button
+        return await self.step(scenario, user, user.callback_update(data, user.user_id, message_id), predicate=predicate)
+
+    # --- Сценарии -----------------------------------------------------------
+
+    async def wizard(self, scenario: Scenario, user: SimUser):
+        for text in ('📣 Пригласить на прогулку', f'Прогулка {user.user_id}', 'Парк Дунавски\nhttps://maps.google.com/?q=45.25,19.85',
+                     f'@sim{user.user_id}', 'Суббота, 15 декабря в 14:00'):
+            if not await self.step(scenario, user, user.text_update(text)):
+                return
+        if not await self.click(scenario, user, 'skip_photo'):
+            return
+        if not await self.step(scenario, user, user.text_update('Погуляем по набережной и выпьем кофе'),
+                               predicate=lambda method, params: 'reply_markup' in params):
+            return
+        button = self.server.find_button('submit_', user.user_id)
+        if button:
+            user.event_id = int(button[0].split('_')[1])
+
+    async def edit(self, scenario: Scenario, user: SimUser):
+        if not await self.click(scenario, user, 'edit_theme_'):
+            return
+        await self.step(scenario, user, user.text_update(f'Новая тема {user.user_id}'),
+                        predicate=lambda method, params: 'reply_markup' in params)
+
+    async def moderation(self, scenario: Scenario, user: SimUser):
+        if user.event_id is None:
+            scenario.errors += 1
+            return
+        if not await self.click(scenario, user, 'submit_',
+                                predicate=lambda method, params: method == 'sendMessage'):
+            return
+        location = self.server.button_message(f'approve_{user.event_id}')
+        if not location:
+            scenario.errors += 1
+            return
+        chat_id, message_id = location
+        # Второй администратор нажимает ту же кнопку одновременно с первым
+        self.deliver(user.callback_update(f'approve_{user.event_id}', chat_id, message_id, SECOND_ADMIN_USER))
+        # Ждем уведомления автору о публикации
+        await self.step(
+            scenario, user,
+            user.callback_update(f'approve_{user.event_id}', chat_id, message_id, ADMIN_USER),
+            wait_chat=user.user_id
+        )
+
+async def run(args):
+    os.environ['DATABASE_URL'] = os.path.join(args.tmpdir, 'loadtest.db')
+    os.environ['ADMIN_CHAT_ID'] = str(ADMIN_CHAT_ID)
+    os.environ['CHANNEL_ID'] = str(CHANNEL_ID)
+    # Общий лимит отправок на модерацию рассчитан на живых пользователей, а не на тысячи симулированных
+    os.environ.setdefault('GLOBAL_SUBMIT_LIMIT', '0')
+
+    import logging
+    import bot
+    from database import db
+    from benchmarks.fake_telegram import FakeTelegramServer
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = await FakeTelegramServer(
+        latency=args.latency_ms / 1000, latency_jitter=args.jitter_ms / 1000,
+        rate_limit_prob=args.rate_limit, seed=args.seed
+    ).start()
+    token = '123456:LOADTEST'
+
+    application = None
+    if args.workers:
+        import cluster
+
+        # Схема создается заранее, чтобы воркеры не мигрировали одновременно
+        db.get()
+        counter = OpCounter(None)
+        queues, processes = cluster.start_workers(args.workers, token, base_url=server.base_url)
+        ingress = cluster.WebhookIngress(queues)
+
+        def deliver(update):
+            body = json.dumps(dict(update, update_id=server.next_update_id())).encode()
+            if not ingress.dispatch(body):
+                raise RuntimeError('worker queue is full')
+        await asyncio.sleep(args.worker_startup)
+    else:
+        application = bot.create_application(token=token, base_url=server.base_url)
+        await application.initialize()
+        await application.post_init(application)
+        counter = db.instrument(OpCounter)
+        await application.start()
+        await application.updater.start_polling(poll_interval=0.0, timeout=5, drop_pending_updates=False)
+        deliver = None
+
+    users = [SimUser(i) for i in range(args.users)]
+    test = LoadTest(server, users, args.timeout, deliver)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_user(method, scenario, user):
+        async with semaphore:
+            await method(scenario, user)
+
+    results = []
+    try:
+        for name in args.scenarios:
+            scenario = Scenario(name)
+            method = getattr(test, name)
+            api_before = dict(server.calls)
+            limited_before = sum(server.rate_limited.values())
+            db_before = dict(counter.counts)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(run_user(method, scenario, user) for user in users))
+            scenario.duration = time.perf_counter() - start
+
+            scenario.api_calls = {
+                k: v - api_before.get(k, 0) for k, v in server.calls.items()
+                if k != 'getUpdates' and v - api_before.get(k, 0)
+            }
+            scenario.rate_limited = sum(server.rate_limited.values()) - limited_before
+            scenario.db_ops = {
+                k: v - db_before.get(k, 0) for k, v in counter.counts.items() if v - db_before.get(k, 0)
+            }
+            if name == 'moderation':
+                # Даем обработаться повторным нажатиям, затем проверяем отсутствие дублей
+                await asyncio.sleep(0.5)
+                events = sum(1 for user in users if user.event_id is not None)
+                posts = server.sent_per_chat.get(CHANNEL_ID, 0)
+                scenario.notes.append(f"channel posts: {posts} for {events} events")
+                if posts > events:
+                    scenario.errors += posts - events
+            results.append(scenario)
+            print(scenario.report(), flush=True)
+    finally:
+        if application is not None:
+            await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, cluster.stop_workers, queues, processes)
+        await server.stop()
+
+    return 1 if any(s.errors for s in results) else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='задержка ответа фейкового API')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='случайная добавка к задержке')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--timeout', type=float, default=30.0, help='ожидание ответа на шаг (с)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=0, help='число процессов-воркеров (режим кластера)')
+    parser.add_argument('--worker-startup', type=float, default=3.0, help='ожидание запуска воркеров (с)')
+    parser.add_argument('--scenarios', default='wizard,edit,moderation',
+                        type=lambda value: [s for s in value.split(',') if s])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        args.tmpdir = tmpdir
+        return asyncio.run(run(args))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Бенчмарк накладных расходов логирования на один апдейт.
+
+    python -m benchmarks.logging_overhead [--updates 20000] [--sample-rate 0.1]
+
+Каждый апдейт воспроизводит записи, которые бот делает при нажатии кнопки
+модерации: маршрутизация в callbacks, обновление события в БД, запросы httpx
+к Bot API. Сравниваются конфигурации:
+
+  before  - прежняя: basicConfig (StreamHandler в вызывающем потоке),
+            текстовый формат, сообщения собираются f-строками
+  queue   - QueueHandler/QueueListener, JSON, аргументы %s (строка собирается
+            в вызывающем потоке, вывод - в потоке очереди), без выборки
+  after   - то же с выборкой INFO шумных модулей (как в logs.setup_logging)
+
+Для каждой конфигурации печатается время в вызывающем потоке (то, что ждет
+event loop) и полное время вместе с выводом остатка очереди. Записи пишутся
+во временный файл, чтобы вывод стоил реального системного вызова.
+"""
+import time
+import queue
+import logging
+import argparse
+import tempfile
+from logging.handlers import QueueListener
+
+import logs
+
+SAMPLED = ('callbacks', 'database_railway', 'httpx')
+
+callbacks_log = logging.getLogger('callbacks')
+database_log = logging.getLogger('database_railway')
+httpx_log = logging.getLogger('httpx')
+
+def update_eager(update_id: int):
+    """Записи одного апдейта в прежнем стиле: строки собираются до вызова логгера"""
+    data, user_id, chat_id, event_id = f'approve_{update_id}', 1000 + update_id, -100100, update_id
+    callbacks_log.info(f"Callback received: data='{data}', user_id={user_id}, chat_id={chat_id}")
+    callbacks_log.info(f"Routing to approve handler")
+    callbacks_log.info(f"Approve callback received from chat {chat_id}, admin chat: {chat_id}")
+    callbacks_log.info(f"Processing approve for event {event_id}")
+    changes = {'status': 'published', 'channel_message_id': update_id, 'expires_at': 1760000000.0}
+    database_log.info(f"✅ Событие {event_id} обновлено: {changes}")
+    for method in ('answerCallbackQuery', 'sendMessage', 'editMessageText'):
+        url = f'https://api.telegram.org/bot<token>/{method}'
+        httpx_log.info(f'HTTP Request: POST {url} "HTTP/1.1 200 OK"')
+
+def update_lazy(update_id: int):
+    """Те же записи с аргументами %s: строка собирается, только если запись прошла фильтры"""
+    data, user_id, chat_id, event_id = f'approve_{update_id}', 1000 + update_id, -100100, update_id
+    callbacks_log.info("Callback received: data='%s', user_id=%s, chat_id=%s", data, user_id, chat_id)
+    callbacks_log.info("Routing to approve handler")
+    callbacks_log.info("Approve callback received from chat %s, admin chat: %s", chat_id, chat_id)
+    callbacks_log.info("Processing approve for event %s", event_id)
+    changes = {'status': 'published', 'channel_message_id': update_id, 'expires_at': 1760000000.0}
+    database_log.info("✅ Событие %s обновлено: %s", event_id, changes)
+    for method in ('answerCallbackQuery', 'sendMessage', 'editMessageText'):
+        # httpx пишет запросы именно так: формат и аргументы отдельно
+        httpx_log.info('HTTP Request: %s %s "%s %d %s"', 'POST',
+                       f'https://api.telegram.org/bot<token>/{method}', 'HTTP/1.1', 200, 'OK')
+
+def configure(name: str, stream, sample_rate: float):
+    """Корневой логгер для конфигурации; возвращает QueueListener или None"""
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.setLevel(logging.INFO)
+
+    output = logging.StreamHandler(stream)
+    if name == 'before':
+        output.setFormatter(logging.Formatter(logs.TEXT_FORMAT))
+        root.addHandler(output)
+        return None
+
+    output.setFormatter(logs.JsonFormatter())
+    records = queue.SimpleQueue()
+    handler = logs.SnapshotQueueHandler(records)
+    handler.addFilter(logs.ContextFilter(sample_rate if name == 'after' else 1.0, SAMPLED))
+    root.addHandler(handler)
+    listener = QueueListener(records, output)
+    listener.start()
+    return listener
+
+def run(name: str, updates: int, sample_rate: float) -> dict:
+    emit = update_eager if name == 'before' else update_lazy
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as stream:
+        listener = configure(name, stream, sample_rate)
+        started = time.perf_counter()
+        for update_id in range(updates):
+            logs._update_id.set(update_id)
+            logs._user_id.set(1000 + update_id)
+            emit(update_id)
+        caller = time.perf_counter() - started
+        if listener is not None:
+            listener.stop()
+        total = time.perf_counter() - started
+        stream.flush()
+        stream.seek(0)
+        lines = sum(1 for _ in stream)
+    return {'caller_us': caller / updates * 1e6, 'total_us': total / updates * 1e6, 'lines': lines}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--sample-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = {name: run(name, args.updates, args.sample_rate) for name in ('before', 'queue', 'after')}
+    logging.getLogger().handlers.clear()
+
+    base = results['before']['caller_us']
+    print(f"{args.updates} апдейтов, 8 записей на апдейт, выборка {args.sample_rate:g}")
+    print(f"{'config':<8} {'caller us/upd':>14} {'total us/upd':>13} {'lines':>8} {'speedup':>8}")
+    for name, result in results.items():
+        print(f"{name:<8} {result['caller_us']:>14.1f} {result['total_us']:>13.1f} "
+              f"{result['lines']:>8} {base / result['caller_us']:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Офлайн-транспорт для PTB: отвечает на вызовы Bot API без сети.
+
+Используется бенчмарками, чтобы измерять работу самого бота,
+а не задержки api.telegram.org.
+"""
+import json
+import time
+import itertools
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {
+    'id': 100000,
+    'is_bot': True,
+    'first_name': 'BenchBot',
+    'username': 'bench_bot',
+    'can_join_groups': True,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+_message_ids = itertools.count(1)
+
+def fake_message(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Сообщение, которое вернул бы Telegram в ответ на send*/edit*"""
+    chat_id = params.get('chat_id', 1)
+    try:
+        chat_id = int(chat_id)
+    except (TypeError, ValueError):
+        pass
+    message = {
+        'message_id': params.get('message_id') or next(_message_ids),
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': BOT_USER,
+    }
+    if 'text' in params:
+        message['text'] = params['text']
+    if 'caption' in params:
+        message['caption'] = params['caption']
+    if 'photo' in params or 'media' in params:
+        unique = f"bench{message['message_id']}"
+        message['photo'] = [{
+            'file_id': f'AgAC{unique}',
+            'file_unique_id': unique,
+            'width': 1280,
+            'height': 960,
+        }]
+    return message
+
+def fake_result(method: str, params: Dict[str, Any]) -> Any:
+    """Результат вызова метода Bot API"""
+    if method == 'getMe':
+        return BOT_USER
+    if method == 'getUpdates':
+        return []
+    if method in ('answerCallbackQuery', 'deleteMessage', 'setWebhook', 'deleteWebhook', 'close', 'logOut'):
+        return True
+    if method == 'getChatMember':
+        # Все, кто нажимает кнопки в чате администраторов, - его владельцы
+        user = {'id': int(params.get('user_id', 1)), 'is_bot': False, 'first_name': 'Admin'}
+        return {'status': 'creator', 'user': user, 'is_anonymous': False}
+    if method == 'sendMediaGroup':
+        media = params.get('media') or []
+        return [fake_message({**params, 'media': item}) for item in media]
+    if method.startswith(('send', 'edit', 'copy', 'forward')):
+        return fake_message(params)
+    return True
+
+class OfflineRequest(BaseRequest):
+    """HTTP-транспорт PTB, отвечающий на все запросы локально"""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+        payload = {'ok': True, 'result': fake_result(api_method, params)}
+        return 200, json.dumps(payload).encode()
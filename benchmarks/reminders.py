@@ -0,0 +1,109 @@
+"""
+Бенчмарк напоминаний (reminders.py) на временной SQLite.
+
+    python -m benchmarks.reminders [--users 1000] [--events 2] [--rate 100] [--latency-ms 30]
+
+Тысячи пользователей отмечаются под несколькими прогулками, которые начинаются
+одновременно, поэтому все напоминания наступают в одну и ту же секунду.
+ReminderEngine отправляет их через BulkSender с лимитом --rate в секунду;
+бот-заглушка отвечает через --latency-ms и запоминает время отправки.
+
+Печатается число транзакций захвата, наибольшая длина очереди рассылки
+(ограничена порцией, а не числом напоминаний), достигнутая скорость,
+наибольшее число отправок за секунду (не больше лимита) и задержка
+отправки относительно времени напоминания.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from bisect import bisect_left
+
+from config import REMINDER_BATCH_SIZE
+from database import Database
+from broadcast import BulkSender
+from reminders import ReminderEngine
+
+REMIND_BEFORE = 2 * 3600
+
+class FakeBot:
+    """Бот, который отвечает через latency секунд и запоминает время отправки"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent_at = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent_at.append(time.time())
+        await asyncio.sleep(self.latency)
+
+class CountingDatabase:
+    """Обертка над БД, которая считает транзакции захвата"""
+
+    def __init__(self, database):
+        self.database = database
+        self.claims = 0
+
+    def claim_reminders(self, keys, now):
+        self.claims += 1
+        return self.database.claim_reminders(keys, now)
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def measure(database, messages: int, rate: float, latency: float, batch_size: int):
+    bot = FakeBot(latency)
+    sender = BulkSender(rate=rate)
+    engine = ReminderEngine(sender=sender, window=60, poll_interval=1, batch_size=batch_size)
+    tasks = [asyncio.create_task(sender.run(bot)), asyncio.create_task(engine.run(database))]
+    deepest = 0
+    while len(bot.sent_at) < messages:
+        deepest = max(deepest, sender.pending())
+        await asyncio.sleep(0.01)
+    for task in tasks:
+        task.cancel()
+    return bot.sent_at, deepest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=2)
+    parser.add_argument('--rate', type=float, default=100.0, help='лимит отправок в секунду')
+    parser.add_argument('--latency-ms', type=float, default=30.0)
+    parser.add_argument('--batch', type=int, default=REMINDER_BATCH_SIZE)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    db = Database(os.path.join(tmpdir.name, 'reminders.db'))
+    # Все прогулки начинаются одновременно: напоминания наступят через секунду
+    due_at = time.time() + 1.0
+    for _ in range(args.events):
+        event_id = db.create_event(1)
+        db.update_event(event_id, status='published', theme='Прогулка', starts_at=due_at + REMIND_BEFORE)
+        db.save_rsvps([(event_id, user_id, 'going') for user_id in range(args.users)], REMIND_BEFORE)
+    messages = args.events * args.users
+
+    database = CountingDatabase(db)
+    sent_at, deepest = asyncio.run(measure(database, messages, args.rate, args.latency_ms / 1000, args.batch))
+    elapsed = sent_at[-1] - sent_at[0]
+    # Наибольшее число отправок в окне [t, t + 1) для каждого t из моментов отправки
+    busiest = max(bisect_left(sent_at, start + 1.0) - i for i, start in enumerate(sent_at))
+    lags = [at - due_at for at in sent_at]
+
+    print(f"{messages} reminders due in the same second ({args.events} walks x {args.users} users)")
+    print(f"  claims: {database.claims} transactions of up to {args.batch}, "
+          f"deepest send queue {deepest}")
+    print(f"  sender: achieved {(messages - 1) / elapsed:.1f}/s, busiest second {busiest} "
+          f"(limit {int(args.rate)})")
+    print(f"  lag after due time: p50 {percentile(lags, 0.5):.1f} s, max {max(lags):.1f} s")
+    if busiest > int(args.rate):
+        print("  WARNING: rate limit exceeded")
+    tmpdir.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Бенчмарк отметок «Иду» / «Может быть» (rsvp.py) на временной SQLite.
+
+    python -m benchmarks.rsvp [--taps 20000] [--events 5] [--users 2000] [--seconds 10]
+
+Поток нажатий под несколькими популярными постами обрабатывается двумя способами:
+- счетчики в памяти с записью пачкой (RsvpBoard.tap + flush раз в секунду),
+- запись каждого нажатия отдельной транзакцией (прежний подход «нажал - записали»).
+
+Нажатия равномерно распределены по --seconds секундам модельного времени:
+для оценки правок кнопок считается, сколько раз поменялись бы кнопки постов
+без отложенной перерисовки и сколько правок будет при RSVP_RENDER_SECONDS.
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from config import RSVP_RENDER_SECONDS
+from database import Database
+from rsvp import RsvpBoard
+
+CHANNEL_ID = -1001000000002
+
+def synthetic_taps(rnd: random.Random, taps: int, events: int, users: int):
+    return [
+        (rnd.randrange(1, events + 1), rnd.randrange(users), rnd.choice(('going', 'going', 'maybe')))
+        for _ in range(taps)
+    ]
+
+async def run_board(database, taps, flush_every: int) -> float:
+    board = RsvpBoard()
+    started = time.perf_counter()
+    for number, (event_id, user_id, status) in enumerate(taps, start=1):
+        await board.tap(database, event_id, user_id, status, chat_id=CHANNEL_ID, message_id=event_id)
+        if number % flush_every == 0:
+            await board.flush(database)
+    await board.flush(database)
+    return time.perf_counter() - started
+
+def run_per_tap(database, taps) -> float:
+    votes = {}
+    started = time.perf_counter()
+    for event_id, user_id, status in taps:
+        current = None if votes.get((event_id, user_id)) == status else status
+        votes[(event_id, user_id)] = current
+        database.save_rsvps([(event_id, user_id, current)])
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--taps', type=int, default=20000)
+    parser.add_argument('--events', type=int, default=5)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=10.0, help='модельное время, за которое приходят нажатия')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    db = Database(os.path.join(tmpdir.name, 'rsvp.db'))
+    for _ in range(args.events):
+        event_id = db.create_event(1)
+        db.update_event(event_id, status='published', theme='Прогулка')
+
+    taps = synthetic_taps(random.Random(args.seed), args.taps, args.events, args.users)
+    taps_per_second = max(1, int(args.taps / args.seconds))
+
+    batched = asyncio.run(run_board(db, taps, flush_every=taps_per_second))
+    flushes = -(-args.taps // taps_per_second)
+    db.save_rsvps([(event_id, user_id, None) for event_id, user_id, _ in taps])
+    per_tap = run_per_tap(db, taps)
+
+    print(f"{args.taps} taps on {args.events} posts over {args.seconds:g} s of model time")
+    print(f"  {'in-memory + batch flush':26s} {args.taps / batched:>10.0f} taps/s  {flushes} transactions")
+    print(f"  {'transaction per tap':26s} {args.taps / per_tap:>10.0f} taps/s  {args.taps} transactions")
+    renders = args.events * int(args.seconds // RSVP_RENDER_SECONDS + 1)
+    print(f"  keyboard edits: {args.taps} without debounce, at most {renders} "
+          f"with RSVP_RENDER_SECONDS={RSVP_RENDER_SECONDS:g}")
+    tmpdir.cleanup()
+
+if __name__ == '__main__':
+    main()
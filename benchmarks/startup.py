@@ -0,0 +1,125 @@
+"""
+Бенчмарк холодного старта бота.
+
+    python -m benchmarks.startup [--budget-ms 1000] [--runs 3]
+
+1. Профиль импорта (`python -X importtime -c "import bot"`): суммарное время
+   импорта bot и самые тяжелые модули. При превышении бюджета скрипт
+   завершается с ненулевым кодом, поэтому его можно запускать в CI.
+2. Время от запуска процесса до обработки первого апдейта (/start)
+   с офлайн-транспортом вместо Telegram Bot API и временной SQLite-базой.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import asyncio
+import tempfile
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+START_UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 1,
+        'date': 0,
+        'chat': {'id': 1, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'Bench'},
+        'text': '/start',
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+    },
+}
+
+def parse_importtime(stderr: str):
+    """Разбор вывода -X importtime: {модуль: (self_us, cumulative_us)}"""
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        result[name.strip()] = (int(self_us), int(cumulative_us))
+    return result
+
+def measure_import(env) -> dict:
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import bot'],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return parse_importtime(proc.stderr)
+
+def measure_cold_start(env) -> dict:
+    env = dict(env, BENCH_T0=repr(time.time()))
+    proc = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup', '--child'],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+async def _child():
+    t0 = float(os.environ['BENCH_T0'])
+    timings = {'spawn_ms': (time.time() - t0) * 1000}
+
+    t = time.perf_counter()
+    import bot
+    from telegram import Update
+    from benchmarks.offline import OfflineRequest
+    timings['import_ms'] = (time.perf_counter() - t) * 1000
+
+    t = time.perf_counter()
+    application = bot.create_application(token='123456:BENCH', request=OfflineRequest())
+    await application.initialize()
+    await application.post_init(application)
+    timings['init_ms'] = (time.perf_counter() - t) * 1000
+
+    t = time.perf_counter()
+    await application.process_update(Update.de_json(START_UPDATE, application.bot))
+    timings['first_update_ms'] = (time.perf_counter() - t) * 1000
+
+    timings['total_ms'] = (time.time() - t0) * 1000
+    await application.shutdown()
+    print(json.dumps(timings))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=1000.0,
+                        help='бюджет на импорт bot (мс)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(_child())
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=os.path.join(tmp, 'bench.db'), BOT_TOKEN='123456:BENCH')
+
+        # Профиль импорта: берем лучший из нескольких запусков, чтобы убрать шум
+        best = None
+        for _ in range(args.runs):
+            profile = measure_import(env)
+            if best is None or profile['bot'][1] < best['bot'][1]:
+                best = profile
+        import_ms = best['bot'][1] / 1000
+
+        print(f"import bot: {import_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+        print(f"top {args.top} modules by self time:")
+        for name, (self_us, _) in sorted(best.items(), key=lambda item: -item[1][0])[:args.top]:
+            print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+        runs = [measure_cold_start(env) for _ in range(args.runs)]
+        print("cold start to first update (median of runs):")
+        for key in ('spawn_ms', 'import_ms', 'init_ms', 'first_update_ms', 'total_ms'):
+            values = sorted(run[key] for run in runs)
+            print(f"  {key:16s} {values[len(values) // 2]:8.1f} ms")
+
+    if import_ms > args.budget_ms:
+        print(f"FAIL: import time {import_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
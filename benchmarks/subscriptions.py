@@ -0,0 +1,167 @@
+"""
+Бенчмарк подбора подписчиков (subscriptions.py) и темпа рассылки (broadcast.py).
+
+    python -m benchmarks.subscriptions [--subscribers 50000] [--events 500] [--messages 300] [--rate 25]
+
+Индекс строится из синтетических подписок: ключевые слова, районы вокруг
+Нови-Сада, только время и смешанные. Для каждого синтетического анонса
+получатели подбираются через индекс и для сравнения полным перебором
+(результаты обязаны совпасть).
+
+Рассылка проверяется на фейковом боте с задержкой ответа: измеряется
+достигнутая скорость и наибольшее число отправок за любую секунду
+(должно быть не больше --rate с округлением вверх).
+"""
+import sys
+import time
+import math
+import random
+import asyncio
+import argparse
+from bisect import bisect_left
+
+import subscriptions
+from subscriptions import Subscription, SubscriptionIndex, event_key, matches
+from broadcast import BulkSender
+import geo
+
+WORDS = (
+    'прогулка парк набережная река кофе чай книги музей выставка лес озеро '
+    'велосипед пикник закат рассвет фотографии архитектура история город мост '
+    'площадь двор сквер собака концерт лекция экскурсия тропа холм поле сад '
+    'вечер утро встреча знакомство разговор игры настолки бег йога '
+    'музыка гитара кино театр рынок старый новый тихий большой маленький '
+    'зеленый центральный северный южный берег остров пристань маяк фонтан'
+).split()
+# Словарь анонсов больше десятков слов: добавляем псевдослова (названия мест, улиц)
+SYLLABLES = 'ба ве го да жи ко лу ми но па ро су ти фа ха це ша ю'.split()
+VOCABULARY = WORDS + sorted({
+    a + b + c for a in SYLLABLES for b in SYLLABLES for c in ('ска', 'ово', 'ица', 'ан')
+})
+# Центр Нови-Сада и разброс точек (градусы)
+CENTER = (45.2671, 19.8335)
+SPREAD = 0.08
+
+def random_point(rnd: random.Random):
+    return CENTER[0] + rnd.uniform(-SPREAD, SPREAD), CENTER[1] + rnd.uniform(-SPREAD, SPREAD)
+
+def synthetic_subscription(rnd: random.Random, subscription_id: int) -> Subscription:
+    kind = rnd.random()
+    words = rnd.sample(VOCABULARY, rnd.randint(1, 3)) if kind < 0.7 else []
+    columns = subscriptions.parse_query(' '.join(words))
+    lat = lng = radius_km = None
+    if 0.5 <= kind < 0.9:
+        (lat, lng), radius_km = random_point(rnd), rnd.choice((1.0, 2.0, 3.0, 5.0))
+    days, hours = frozenset(), (None, None)
+    if kind >= 0.6:
+        days = rnd.choice((frozenset(), frozenset({5, 6}), frozenset({0, 1, 2, 3, 4}), frozenset({4})))
+        hours = rnd.choice(((None, None), (6, 12), (12, 17), (17, 24)))
+    return Subscription(
+        id=subscription_id, user_id=subscription_id, query=' '.join(words),
+        terms=frozenset((columns['keywords'] or '').split()),
+        lat=lat, lng=lng, radius_km=radius_km, days=days, hour_from=hours[0], hour_to=hours[1],
+    )
+
+def synthetic_event(rnd: random.Random, event_id: int) -> dict:
+    lat, lng = random_point(rnd) if rnd.random() < 0.6 else (None, None)
+    return {
+        'id': event_id,
+        'user_id': 0,
+        'theme': ' '.join(rnd.choices(WORDS, k=rnd.randint(2, 5))),
+        'place': ' '.join(rnd.choices(VOCABULARY, k=rnd.randint(1, 3))),
+        'description': ' '.join(rnd.choices(VOCABULARY, k=rnd.randint(10, 40))),
+        'lat': lat, 'lng': lng, 'geohash': geo.geohash_encode(lat, lng) if lat is not None else None,
+        'starts_at': time.time() + rnd.randint(0, 14 * 86400),
+    }
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def report(name: str, seconds) -> float:
+    us = [s * 1e6 for s in seconds]
+    p99 = percentile(us, 0.99)
+    print(f"  {name:22s} p50={percentile(us, 0.5):.0f} p95={percentile(us, 0.95):.0f} "
+          f"p99={p99:.0f} max={max(us):.0f} µs")
+    return p99
+
+class FakeBot:
+    """Бот, который отвечает через latency секунд и запоминает время отправки"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent_at = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent_at.append(asyncio.get_running_loop().time())
+        await asyncio.sleep(self.latency)
+
+async def measure_sender(messages: int, rate: float, latency: float):
+    bot = FakeBot(latency)
+    sender = BulkSender(rate=rate)
+    for chat_id in range(messages):
+        sender.enqueue(chat_id, 'text')
+    task = asyncio.create_task(sender.run(bot))
+    while len(bot.sent_at) < messages:
+        await asyncio.sleep(0.05)
+    task.cancel()
+
+    sent_at = bot.sent_at
+    elapsed = sent_at[-1] - sent_at[0]
+    # Наибольшее число отправок в окне [t, t + 1) для каждого t из моментов отправки
+    busiest = max(bisect_left(sent_at, start + 1.0) - i for i, start in enumerate(sent_at))
+    return (messages - 1) / elapsed if elapsed else float('inf'), busiest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=50000)
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=300, help='сообщений в проверке темпа рассылки')
+    parser.add_argument('--rate', type=float, default=25.0)
+    parser.add_argument('--latency-ms', type=float, default=80.0, help='задержка ответа фейкового Bot API')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rnd = random.Random(args.seed)
+
+    subs = [synthetic_subscription(rnd, i) for i in range(1, args.subscribers + 1)]
+    index = SubscriptionIndex()
+    started = time.perf_counter()
+    for sub in subs:
+        index.add(sub)
+    build = time.perf_counter() - started
+    print(f"index: {len(index)} subscriptions, built in {build:.2f} s, "
+          f"{len(index.by_term)} terms, {len(index.by_cell)} cells, {len(index.by_slot)} time slots")
+
+    events = [synthetic_event(rnd, i) for i in range(args.events)]
+    indexed, scanned, certain, candidates, recipients = [], [], [], [], []
+    for event in events:
+        started = time.perf_counter()
+        users = index.match(event)
+        indexed.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        key = event_key(event)
+        expected = {sub.user_id for sub in subs if matches(sub, key)}
+        scanned.append(time.perf_counter() - started)
+
+        if users != expected:
+            print(f"mismatch for event {event['id']}: index {len(users)}, scan {len(expected)}")
+            sys.exit(1)
+        certain.append(len(index.certain(key)))
+        candidates.append(len(index.candidates(key)))
+        recipients.append(len(users))
+
+    print(f"match per event ({args.events} events; median {percentile(certain, 0.5)} time-only, "
+          f"{percentile(candidates, 0.5)} checked candidates, {percentile(recipients, 0.5)} recipients):")
+    report('inverted index', indexed)
+    report('linear scan', scanned)
+
+    rate, busiest = asyncio.run(measure_sender(args.messages, args.rate, args.latency_ms / 1000))
+    limit = math.ceil(args.rate)
+    print(f"sender: {args.messages} messages at rate {args.rate:g}/s, latency {args.latency_ms:g} ms: "
+          f"achieved {rate:.1f}/s, busiest second {busiest} (limit {limit})")
+    if busiest > limit:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Бенчмарк фильтра ругательств и ссылок (textfilter.py) на большом корпусе текстов.
+
+    python -m benchmarks.textfilter [--fields 10000] [--terms 2000] [--dirty 0.05] [--baseline 500]
+
+Корпус - синтетические описания прогулок; доля --dirty содержит запрещенное
+слово, записанное латиницей и цифрами, или чужую ссылку. К словам из
+banned_terms.txt добавляется --terms случайных слов, чтобы показать, как
+стоимость проверки зависит от длины списка.
+
+Сравниваются три способа найти слово в нормализованном тексте:
+- автомат Ахо-Корасик (один проход по тексту на поле),
+- перебор слов списка через `in` (без проверки границ слов - нижняя оценка),
+- одно регулярное выражение с альтернативой из всех слов (с границами слов).
+Медленные способы для сравнения прогоняются на первых --baseline полях.
+Отдельно измеряются сборка автомата (цена перечитывания файла) и проверка ссылок.
+"""
+import re
+import time
+import random
+import argparse
+
+import textfilter
+
+WORDS = (
+    'прогулка парк набережная река кофе чай книги музей выставка лес озеро '
+    'велосипед пикник закат рассвет фотографии архитектура история город мост '
+    'площадь двор сквер собака концерт лекция экскурсия тропа холм поле сад '
+    'вечер утро выходные встреча знакомство разговор игры настолки бег йога '
+    'музыка гитара кино театр рынок старый новый тихий большой маленький '
+    'зеленый центральный северный южный берег остров пристань маяк фонтан'
+).split()
+LETTERS = 'абвгдежзиклмнопрстуфхцчшщыэюя'
+# Как спамеры прячут слова: латинские двойники и цифры вместо букв
+DISGUISE = str.maketrans('аеокрсху', 'aeokpcxy')
+
+def synthetic_terms(rnd: random.Random, count: int):
+    lines = []
+    for _ in range(count):
+        word = ''.join(rnd.choices(LETTERS, k=rnd.randint(4, 10)))
+        lines.append(rnd.choice((word, word + '*', '*' + word + '*')))
+    return lines
+
+def synthetic_field(rnd: random.Random, dirty: float, banned) -> str:
+    words = rnd.choices(WORDS, k=rnd.randint(10, 60))
+    if rnd.random() < dirty:
+        if rnd.random() < 0.5:
+            words[rnd.randrange(len(words))] = rnd.choice(banned).strip('*').translate(DISGUISE).replace('о', '0')
+        else:
+            words.append(f"https://{''.join(rnd.choices('abcdefgh', k=6))}.xyz/promo")
+    return ' '.join(words)
+
+def measure(func, fields):
+    """Секунды на весь корпус и число полей, для которых func вернула не None/False"""
+    started = time.perf_counter()
+    hits = sum(1 for text in fields if func(text))
+    return time.perf_counter() - started, hits
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fields', type=int, default=10000)
+    parser.add_argument('--terms', type=int, default=2000, help='сколько случайных слов добавить к banned_terms.txt')
+    parser.add_argument('--dirty', type=float, default=0.05, help='доля полей с запрещенным словом или ссылкой')
+    parser.add_argument('--baseline', type=int, default=500, help='на скольких полях измерять перебор и regex')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    with open(textfilter.screen.terms_path, encoding='utf-8') as file:
+        shipped = [line for line in file.read().splitlines() if textfilter.parse_term(line)]
+    with open(textfilter.screen.allowlist_path, encoding='utf-8') as file:
+        allowed = file.read().splitlines()
+    lines = shipped + synthetic_terms(rnd, args.terms)
+    fields = [synthetic_field(rnd, args.dirty, shipped) for _ in range(args.fields)]
+
+    started = time.perf_counter()
+    automaton, allowlist = textfilter.screen.load(lines, allowed)
+    build = time.perf_counter() - started
+    print(f"terms: {automaton.size}, automaton states: {len(automaton.goto)}, build {build * 1000:.1f} ms")
+    print(f"corpus: {len(fields)} fields, {sum(map(len, fields)) / 2 ** 20:.1f} M characters\n")
+
+    parsed = list(filter(None, map(textfilter.parse_term, lines)))
+    keys = [key for key, _ in parsed]
+    pattern = re.compile('|'.join(
+        ('' if term.open_left else r'(?<!\w)') + re.escape(key) + ('' if term.open_right else r'(?!\w)')
+        for key, term in parsed
+    ))
+    normalized = [textfilter.normalize(text) for text in fields]
+
+    sample = normalized[:args.baseline]
+    print(f"{'method':<32} {'fields':>7} {'MiB/s':>8} {'us/field':>9} {'hits':>6}")
+    rows = (
+        ('normalize', lambda text: textfilter.normalize(text) is None, fields),
+        ('aho-corasick', automaton.find, normalized),
+        ('aho-corasick', automaton.find, sample),
+        ('naive `in` per term', lambda text: any(key in text for key in keys), sample),
+        ('regex alternation', pattern.search, sample),
+        ('links', lambda text: textfilter.find_link(text, allowlist), fields),
+        ('screen.check (full field)', textfilter.screen.check, fields),
+    )
+    for name, func, corpus in rows:
+        seconds, hits = measure(func, corpus)
+        mib = sum(len(text.encode('utf-8')) for text in corpus) / 2 ** 20
+        print(f"{name:<32} {len(corpus):>7} {mib / seconds:>8.1f} {seconds / len(corpus) * 1e6:>9.1f} {hits:>6}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Микробенчмарк переходов мастера (wizard.py) без БД и Telegram.
+
+    python -m benchmarks.wizard [--rounds 200000]
+
+Для каждого шага мастера и каждой правки выполняется поиск поля, проверка
+значения и определение следующего шага. Для сравнения измеряется прежняя
+цепочка if/elif с импортом валидатора внутри ветки (как было в
+callbacks.handle_editing_input). Фильтр текста (textfilter.py) в сравнение
+не входит: его цена - отдельной строкой, проход мастера с фильтром.
+"""
+import time
+import argparse
+
+from config import STATES
+import textfilter
+import wizard
+
+INPUTS = {
+    'theme': 'Прогулка по центру города',
+    'place': 'Парк Горького, главный вход',
+    'contact': '@username',
+    'time': 'Завтра в 18:00',
+    'description': 'Погуляем по набережной, возьмите воду',
+}
+
+def table_edit(field_name: str, text: str):
+    field = wizard.BY_NAME[field_name]
+    return field.column, wizard.accept(field, text, editing=True)
+
+def ladder_edit(field: str, text: str):
+    """Прежний вариант: цепочка сравнений и импорт внутри ветки"""
+    if field == 'theme':
+        from utils import validate_theme
+        return 'theme', validate_theme(text)
+    elif field == 'place':
+        from utils import validate_place
+        return 'place', validate_place(text)
+    elif field == 'contact':
+        from utils import validate_contact
+        return 'contact', validate_contact(text)
+    elif field == 'time':
+        from utils import validate_time
+        return 'event_time', validate_time(text)
+    elif field == 'description':
+        from utils import validate_description
+        if text.lower() == 'удалить':
+            return 'description', True
+        return 'description', validate_description(text)
+    return None, False
+
+def wizard_pass():
+    """Один проход мастера по всем текстовым шагам"""
+    field = wizard.FIRST
+    while field is not None:
+        if field.validator is not None:
+            wizard.accept(field, INPUTS[field.name])
+        field = wizard.NEXT[field.state]
+
+def measure(func, rounds: int, *args) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(*args)
+    return (time.perf_counter() - started) / rounds * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"{'operation':<28} {'ns/op':>10}")
+    print(f"{'wizard pass + textfilter':<28} {measure(wizard_pass, args.rounds):>10.0f}")
+    textfilter.screen.load(None, None)
+    print(f"{'wizard pass (6 steps)':<28} {measure(wizard_pass, args.rounds):>10.0f}")
+    for name in ('theme', 'description'):
+        text = INPUTS[name]
+        print(f"{'edit ' + name + ' (table)':<28} {measure(table_edit, args.rounds, name, text):>10.0f}")
+        print(f"{'edit ' + name + ' (if/elif)':<28} {measure(ladder_edit, args.rounds, name, text):>10.0f}")
+    state = STATES['WAITING_TIME']
+    print(f"{'next step lookup':<28} {measure(wizard.NEXT.__getitem__, args.rounds, state):>10.0f}")
+
+if __name__ == '__main__':
+    main()
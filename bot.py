@@ -1,38 +1,182 @@
 import logging
 import asyncio
 import os
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, WEBHOOK_URL, WEBHOOK_SECRET, BOT_WORKERS, WORKER_QUEUE_SIZE, RATE_LIMIT_FLUSH_SECONDS,
+    ARCHIVE_INTERVAL_SECONDS, DIGEST_MODE, DIGEST_INTERVAL_SECONDS, SUBSCRIPTION_REFRESH_SECONDS,
+    RSVP_FLUSH_SECONDS, REMINDER_HOURS, TENANT_REFRESH_SECONDS, TEXT_FILTER_REFRESH_SECONDS,
+    DUPLICATE_REFRESH_SECONDS
+)
 from handlers import (
-    start_command, help_command, cancel_command,
-    handle_text_message, handle_photo_input, handle_invalid_media
+    start_command, help_command, cancel_command, search_command, nearby_command,
+    subscribe_command, subscriptions_command, city_command,
+    handle_text_message, handle_photo_input, handle_invalid_media, handle_location
 )
 from callbacks import handle_callback_query, handle_photo_editing, handle_editing_input
 from health import start_health_server
+from pipeline import Pipeline
+import duplicates
+import lifecycle
+import digest
+import subscriptions
+import rsvp
+import reminders
+import tenants
+import textfilter
+from broadcast import sender
+from ratelimit import limiter
+from recovery import recovery
+from logs import setup_logging, bind_update_handler
+from persistence import DatabasePersistence
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Настройка логирования (в воркерах кластера уже выполнена в cluster.run_worker)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-def create_application():
+async def post_init(application: Application):
+    """Подключение к БД после сборки приложения, но до получения первых апдейтов"""
+    from database import db
+    
+    # Подключение и проверка схемы блокируют поток, поэтому уводим их из event loop
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, db.get)
+    logger.info("✅ База данных готова")
+    
+    # Сообщества (каналы и чаты администраторов) нужны до первых апдейтов и до загрузки лимитов
+    loaded = await loop.run_in_executor(None, tenants.registry.load, db)
+    logger.info(f"✅ Загружено сообществ: {loaded}")
+    application.bot_data['tenants'] = asyncio.create_task(tenants.registry.run(db, TENANT_REFRESH_SECONDS))
+    
+    # Фильтр ругательств и ссылок собирается до первого ввода и перечитывается при изменении файлов
+    await loop.run_in_executor(None, textfilter.screen.reload)
+    application.bot_data['text_filter'] = asyncio.create_task(textfilter.screen.run(TEXT_FILTER_REFRESH_SECONDS))
+    
+    # Счетчики лимитов переживают перезапуск: загружаем еще не пополнившиеся корзины
+    rows = await loop.run_in_executor(None, db.load_rate_limits, limiter.clock() - limiter.max_period())
+    limiter.load(rows)
+    application.bot_data['ratelimit_flusher'] = asyncio.create_task(
+        limiter.run_flusher(db, RATE_LIMIT_FLUSH_SECONDS)
+    )
+    
+    # Индекс дубликатов строится в фоне: до его готовности проверяются только новые анонсы.
+    # Затем он подтягивает анонсы, отправленные через другие воркеры кластера
+    application.bot_data['duplicates_index'] = asyncio.create_task(
+        duplicates.index.run(db, application.bot_data['pipeline'], DUPLICATE_REFRESH_SECONDS)
+    )
+    
+    # Номер воркера кластера и число воркеров (cluster.py); в одном процессе - (0, 1).
+    # Задачи выше и ниже, кроме архивирования, напоминаний и дайджеста, работают в каждом
+    # воркере: они обслуживают апдейты этого воркера (сообщества, фильтр, лимиты, индексы
+    # дубликатов и подписок для его заявок и одобрений, очередь рассылки его публикаций,
+    # отметки под постами, распределенными в него по event_id)
+    index, workers = application.bot_data.get('worker', (0, 1))
+    
+    # Пользователям с незаконченными анонсами бот напомнит шаг при следующем сообщении
+    # (каждый воркер - своим пользователям, user_id % workers)
+    application.bot_data['draft_recovery'] = asyncio.create_task(recovery.scan(db, shard=(index, workers)))
+    
+    # Подписки: индекс в памяти и рассылка уведомлений с ограничением скорости
+    def on_blocked(user_id: int):
+        # Заблокировавшему бота пользователю больше не пишем
+        subscriptions.index.remove_user(user_id)
+        loop.run_in_executor(None, db.deactivate_user_subscriptions, user_id)
+    
+    sender.on_blocked = on_blocked
+    application.bot_data['broadcast_sender'] = asyncio.create_task(sender.run(application.bot))
+    application.bot_data['subscriptions_index'] = asyncio.create_task(
+        subscriptions.index.run(db, SUBSCRIPTION_REFRESH_SECONDS)
+    )
+    
+    # Отметки под постами копятся в памяти: запись в БД и перерисовка кнопок - фоновыми задачами
+    application.bot_data['rsvp_flusher'] = asyncio.create_task(rsvp.board.run_flusher(db, RSVP_FLUSH_SECONDS))
+    application.bot_data['rsvp_renderer'] = asyncio.create_task(rsvp.board.run_renderer(application.bot))
+    
+    if index != 0:
+        return
+    # Задачи по расписанию над общей базой - только в воркере 0: иначе каждый воркер
+    # опрашивал бы БД ради одной и той же работы
+    
+    # Прошедшие прогулки периодически переносятся в архив
+    application.bot_data['archiver'] = asyncio.create_task(
+        lifecycle.run_archiver(application.bot, db, ARCHIVE_INTERVAL_SECONDS)
+    )
+    
+    if REMINDER_HOURS > 0:
+        # Напоминания отметившимся уходят через ту же очередь рассылки, что и уведомления подписок
+        application.bot_data['reminders'] = asyncio.create_task(reminders.engine.run(db))
+    
+    if DIGEST_MODE:
+        # Одобренные анонсы публикуются пачкой: по интервалу или при наборе полной порции
+        wakeup = application.bot_data['digest_wakeup'] = asyncio.Event()
+        application.bot_data['digest_publisher'] = asyncio.create_task(
+            digest.run_digest(application.bot, db, wakeup, DIGEST_INTERVAL_SECONDS)
+        )
+
+async def post_shutdown(application: Application):
+    """Освобождение ресурсов при остановке бота"""
+    from database import db
+    
+    for name in ('draft_recovery', 'archiver', 'digest_publisher', 'broadcast_sender', 'subscriptions_index',
+                 'rsvp_renderer', 'reminders', 'tenants', 'text_filter', 'duplicates_index'):
+        task = application.bot_data.get(name)
+        if task is not None:
+            task.cancel()
+    
+    rsvp_flusher = application.bot_data.get('rsvp_flusher')
+    if rsvp_flusher is not None:
+        rsvp_flusher.cancel()
+        await rsvp.board.flush(db)
+    
+    flusher = application.bot_data.get('ratelimit_flusher')
+    if flusher is not None:
+        flusher.cancel()
+        limiter.flush(db)
+    application.bot_data['pipeline'].shutdown()
+
+def create_application(token: str = None, request=None, base_url: str = None):
     """Создание и настройка приложения бота"""
     # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    from database import db
+    
+    builder = Application.builder().token(token or BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    # context.user_data и chat_data хранятся в БД и записываются пачками
+    builder = builder.persistence(DatabasePersistence(db))
+    if request is not None:
+        # Подмена HTTP-транспорта (используется в бенчмарках)
+        builder = builder.request(request).get_updates_request(request)
+    if base_url is not None:
+        # Альтернативный сервер Bot API (например, локальный фейк в нагрузочных тестах)
+        builder = builder.base_url(base_url)
+    application = builder.build()
+    
+    # Стадии для CPU-тяжелой работы (изображения, рендеринг) в пуле процессов
+    application.bot_data['pipeline'] = Pipeline()
+    
+    # ID апдейта и пользователя для записей лога (группа -1 выполняется первой)
+    application.add_handler(TypeHandler(Update, bind_update_handler), group=-1)
     
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("cancel", cancel_command))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("nearby", nearby_command))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("subscriptions", subscriptions_command))
+    application.add_handler(CommandHandler("city", city_command))
     
     # Обработчик callback-кнопок
     application.add_handler(CallbackQueryHandler(handle_callback_query))
     
-    # Обработчик фотографий
+    # Обработчик фотографий (в том числе изображений, отправленных файлом)
     application.add_handler(MessageHandler(filters.PHOTO, handle_photo_messages))
+    application.add_handler(MessageHandler(filters.Document.IMAGE, handle_photo_messages))
+    
+    # Геопозиция: поиск прогулок рядом
+    application.add_handler(MessageHandler(filters.LOCATION, handle_location))
     
     # Обработчики неподходящих типов медиа
     application.add_handler(MessageHandler(filters.VIDEO, handle_invalid_media_messages))
@@ -46,15 +190,17 @@ def create_application():
     # Обработчик текстовых сообщений (должен быть последним)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     
+    # Добавляем обработчик ошибок
+    application.add_error_handler(error_handler)
+    
     return application
 
 async def handle_photo_messages(update, context):
     """Маршрутизация фото-сообщений"""
-    from database import db
+    import drafts
     from config import STATES
     
-    user_id = update.effective_user.id
-    user_state = db.get_user_state(user_id)
+    user_state = drafts.current(context)
     
     if not user_state:
         return
@@ -70,7 +216,9 @@ async def handle_invalid_media_messages(update, context):
 
 async def error_handler(update, context):
     """Обработчик ошибок"""
-    logger.error(f'Update {update} caused error {context.error}')
+    # Полный repr апдейта не пишем: update_id и user_id уже есть в записи
+    update_id = update.update_id if isinstance(update, Update) else None
+    logger.error("Update %s caused error: %s", update_id, context.error, exc_info=context.error)
 
 def main():
     """Главная функция запуска бота"""
@@ -79,17 +227,23 @@ def main():
         return
     
     logger.info("Starting Event Announcement Bot...")
+    port = int(os.getenv('PORT', 8080))
+    
+    if WEBHOOK_URL:
+        # Режим кластера: webhook-вход (он же health check) и несколько воркеров
+        from cluster import run_cluster
+        
+        logger.info(f"Running in webhook mode with {BOT_WORKERS} workers")
+        run_cluster(BOT_TOKEN, WEBHOOK_URL, port, BOT_WORKERS,
+                    secret_token=WEBHOOK_SECRET, queue_size=WORKER_QUEUE_SIZE)
+        return
     
     # Запускаем health check сервер для Railway
-    port = int(os.getenv('PORT', 8080))
     start_health_server(port)
     
     # Создаем приложение
     application = create_application()
     
-    # Добавляем обработчик ошибок
-    application.add_error_handler(error_handler)
-    
     # Запускаем бота
     logger.info("Bot is running...")
     application.run_polling(allowed_updates=['message', 'callback_query'])
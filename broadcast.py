@@ -0,0 +1,102 @@
+"""
+Массовая рассылка личных сообщений с ограничением скорости.
+
+Telegram допускает около 30 сообщений в секунду на бота в целом, поэтому
+уведомления (подписки, напоминания) не отправляются сразу, а ставятся в очередь.
+Фоновая задача отправляет их не чаще rate в секунду; несколько отправок
+могут идти одновременно, чтобы задержка Bot API не снижала скорость.
+RetryAfter возвращает сообщение в очередь и приостанавливает всю рассылку.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+from config import BROADCAST_RATE, BROADCAST_QUEUE_LIMIT
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Одновременных запросов к Bot API
+MAX_IN_FLIGHT = 10
+
+class BulkSender:
+    """Очередь личных сообщений с отправкой не чаще rate в секунду"""
+
+    def __init__(self, rate: float = BROADCAST_RATE, queue_limit: int = BROADCAST_QUEUE_LIMIT):
+        self.rate = rate
+        self.queue_limit = queue_limit
+        self._queue: Deque[Tuple[int, str, Dict[str, Any]]] = deque()
+        # Создается в run(): событие привязывается к event loop, в котором идет рассылка
+        self._ready: Optional[asyncio.Event] = None
+        # До этого момента (loop.time()) Telegram просил не отправлять сообщения
+        self._paused_until = 0.0
+        # Вызывается для пользователей, заблокировавших бота
+        self.on_blocked: Optional[Callable[[int], None]] = None
+
+    def enqueue(self, chat_id: int, text: str, **kwargs) -> bool:
+        """Постановка сообщения в очередь; False - очередь переполнена и сообщение отброшено"""
+        if len(self._queue) >= self.queue_limit:
+            metrics.counter('broadcast.dropped_total').inc()
+            return False
+        self._queue.append((chat_id, text, kwargs))
+        metrics.gauge('broadcast.queue_depth').set(len(self._queue))
+        if self._ready is not None:
+            self._ready.set()
+        return True
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    async def run(self, bot):
+        """Фоновая отправка сообщений из очереди"""
+        loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        interval = 1.0 / self.rate
+        in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        # Ссылки на отправки, чтобы задачи не были собраны сборщиком мусора
+        sending = set()
+        next_at = loop.time()
+        while True:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await in_flight.acquire()
+
+            item = self._queue.popleft()
+            metrics.gauge('broadcast.queue_depth').set(len(self._queue))
+            task = asyncio.create_task(self._send(bot, item))
+            sending.add(task)
+            task.add_done_callback(sending.discard)
+            task.add_done_callback(lambda _: in_flight.release())
+            # Отправки идут не чаще interval, даже если ожидание слота затянулось
+            next_at = max(next_at, loop.time()) + interval
+            next_at = max(next_at, self._paused_until)
+
+    async def _send(self, bot, item: Tuple[int, str, Dict[str, Any]]):
+        chat_id, text, kwargs = item
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            metrics.counter('broadcast.sent_total').inc()
+        except RetryAfter as e:
+            # Превысили лимит: сообщение возвращается в начало очереди, рассылка ждет
+            logger.warning(f"Broadcast throttled by Telegram, pausing for {e.retry_after}s")
+            self._paused_until = asyncio.get_running_loop().time() + e.retry_after
+            self._queue.appendleft(item)
+            self._ready.set()
+        except Forbidden:
+            # Пользователь заблокировал бота
+            metrics.counter('broadcast.blocked_total').inc()
+            if self.on_blocked is not None:
+                self.on_blocked(chat_id)
+        except TelegramError as e:
+            metrics.counter('broadcast.failed_total').inc()
+            logger.warning(f"Could not deliver message to {chat_id}: {e}")
+
+sender = BulkSender()
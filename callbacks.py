@@ -1,54 +1,100 @@
+import time
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
 from database import db
-from config import STATES, ADMIN_CHAT_ID, CHANNEL_ID
-from keyboards import get_main_menu_keyboard, get_admin_moderation_keyboard
-from utils import format_event_announcement, format_admin_preview, get_user_info_string
-from handlers import show_event_preview
+from config import (
+    STATES, DUPLICATE_FLAG_THRESHOLD, DUPLICATE_REJECT_THRESHOLD,
+    DIGEST_MODE, DIGEST_MAX_EVENTS, SUBSCRIPTION_RADIUS_KM, MODERATION_CLAIM_SECONDS
+)
+from keyboards import (
+    get_main_menu_keyboard, get_admin_moderation_keyboard, get_unpublish_confirm_keyboard,
+    get_subscriptions_keyboard, get_rsvp_keyboard
+)
+from utils import (
+    format_event_announcement, format_admin_preview, format_duplicate_warning, format_revision_preview,
+    format_subscriptions, get_user_info_string
+)
+from handlers import (
+    show_event_preview, receive_photo, receive_album, build_search_page, enforce_rate_limit, add_subscription
+)
+from media import send_photo
+import albums
+from pipeline import render, event_record
+import drafts
+import duplicates
+import eventtime
+import lifecycle
+import metrics
+import moderation
+import rsvp
+import subscriptions
+import tenants
+import wizard
 
 logger = logging.getLogger(__name__)
 
+# Кнопки модерации отвечают на нажатие сами: отказ показывается всплывающим сообщением
+MODERATION_CALLBACKS = ('approve_', 'reject_', 'claim_')
+
 async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Основной обработчик callback-запросов"""
     query = update.callback_query
-    await query.answer()
-    
     data = query.data
+    if data.startswith('rsvp_'):
+        # Кнопки под постом в канале отвечают всплывающим сообщением
+        await handle_rsvp_callback(update, context, data)
+        return
+    if not data.startswith(MODERATION_CALLBACKS):
+        await query.answer()
+    
     user_id = query.from_user.id
     
-    logger.info(f"Callback received: data='{data}', user_id={user_id}, chat_id={query.message.chat.id}")
+    logger.info("Callback received: data='%s', user_id=%s, chat_id=%s", data, user_id, query.message.chat.id)
     
     try:
         if data.startswith('edit_'):
-            logger.info(f"Routing to edit handler")
+            logger.info("Routing to edit handler")
             await handle_edit_callback(update, context, data)
         elif data.startswith('submit_'):
-            logger.info(f"Routing to submit handler")
+            logger.info("Routing to submit handler")
             await handle_submit_callback(update, context, data)
         elif data.startswith('cancel_'):
-            logger.info(f"Routing to cancel handler")
+            logger.info("Routing to cancel handler")
             await handle_cancel_callback(update, context, data)
         elif data.startswith('approve_'):
-            logger.info(f"Routing to approve handler")
+            logger.info("Routing to approve handler")
             await handle_approve_callback(update, context, data)
+        elif data.startswith('claim_'):
+            logger.info("Routing to claim handler")
+            await handle_claim_callback(update, context, data)
         elif data.startswith('reject_'):
-            logger.info(f"Routing to reject handler")
+            logger.info("Routing to reject handler")
             await handle_reject_callback(update, context, data)
         elif data == 'skip_photo':
-            logger.info(f"Routing to skip photo handler")
+            logger.info("Routing to skip photo handler")
             await handle_skip_photo_callback(update, context)
         elif data == 'cancel_creation':
-            logger.info(f"Routing to cancel creation handler")
+            logger.info("Routing to cancel creation handler")
             await handle_cancel_creation_callback(update, context)
+        elif data.startswith('search_page_'):
+            await handle_search_page_callback(update, context, data)
+        elif data.startswith('revise_'):
+            await handle_revise_callback(update, context, data)
+        elif data.startswith('unpublish_'):
+            await handle_unpublish_callback(update, context, data)
+        elif data.startswith('subscribe_area_'):
+            await handle_subscribe_area_callback(update, context, data)
+        elif data.startswith('unsubscribe_'):
+            await handle_unsubscribe_callback(update, context, data)
+        elif data.startswith('tenant_'):
+            await handle_tenant_callback(update, context, data)
         else:
             logger.warning(f"Unknown callback data: {data}")
     except Exception as e:
-        logger.error(f"Error handling callback {data}: {e}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error(f"Error handling callback {data}: {e}", exc_info=True)
         await query.edit_message_text("❌ Произошла ошибка. Попробуйте еще раз.")
 
 async def handle_edit_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
@@ -58,8 +104,14 @@ async def handle_edit_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     
     # Парсим данные: edit_{field}_{event_id}
     parts = data.split('_')
-    field = parts[1]
+    field = wizard.BY_NAME.get(parts[1])
     event_id = int(parts[2])
+    if field is None:
+        logger.warning(f"Unknown field in edit callback: {data}")
+        return
+    
+    if not await enforce_rate_limit(update, context, 'edit'):
+        return
     
     # Проверяем права доступа
     event = db.get_event(event_id)
@@ -67,49 +119,26 @@ async def handle_edit_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("❌ Событие не найдено или у вас нет прав доступа")
         return
     
-    # Устанавливаем состояние редактирования
-    edit_data = {'field': field, 'event_id': event_id}
-    db.set_user_state(user_id, STATES['EDITING'], event_id, edit_data)
-    
-    # Отправляем запрос на ввод
-    field_names = {
-        'theme': 'тему события',
-        'place': 'место проведения',
-        'contact': 'контакт для связи',
-        'time': 'время проведения',
-        'photo': 'фото события',
-        'description': 'описание события'
+    # Устанавливаем состояние редактирования и запоминаем сообщение предпросмотра,
+    # чтобы после ввода обновить его на месте
+    edit_data = {
+        'field': field.name,
+        'event_id': event_id,
+        'preview_message_id': query.message.message_id,
+        'preview_photo': event['photo_file_id'] if query.message.photo else None
     }
+    drafts.enter(context, user_id, STATES['EDITING'], event_id, edit_data)
     
-    field_name = field_names.get(field, field)
-    
-    # Проверяем, есть ли фото в сообщении для всех полей
+    # Отправляем запрос на ввод; у сообщений с фото меняется подпись
     if query.message.photo:
-        # Для сообщений с фото используем edit_message_caption
-        if field == 'photo':
-            await query.edit_message_caption(
-                caption="📝 Отправь новое фото для события или напиши 'удалить' чтобы убрать фото"
-            )
-        else:
-            await query.edit_message_caption(
-                caption=f"📝 Введи новое значение для поля '{field_name}':"
-            )
+        await query.edit_message_caption(caption=wizard.edit_prompt(field))
     else:
-        # Для обычных текстовых сообщений
-        if field == 'photo':
-            await query.edit_message_text(
-                "📝 Отправь новое фото для события или напиши 'удалить' чтобы убрать фото"
-            )
-        else:
-            await query.edit_message_text(
-                f"📝 Введи новое значение для поля '{field_name}':"
-            )
+        await query.edit_message_text(wizard.edit_prompt(field))
 
 async def handle_editing_input(update: Update, context: ContextTypes.DEFAULT_TYPE, user_state: dict, text: str):
     """Обработка ввода при редактировании"""
-    user_id = update.effective_user.id
     edit_data = user_state.get('data', {})
-    field = edit_data.get('field')
+    field = wizard.BY_NAME.get(edit_data.get('field'))
     event_id = edit_data.get('event_id')
     
     if not field or not event_id:
@@ -117,48 +146,18 @@ async def handle_editing_input(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     
     # Валидация и сохранение
-    success = False
-    
-    if field == 'theme':
-        from utils import validate_theme
-        if validate_theme(text):
-            db.update_event(event_id, theme=text)
-            success = True
-    elif field == 'place':
-        from utils import validate_place
-        if validate_place(text):
-            db.update_event(event_id, place=text)
-            success = True
-    elif field == 'contact':
-        from utils import validate_contact
-        if validate_contact(text):
-            db.update_event(event_id, contact=text)
-            success = True
-    elif field == 'time':
-        from utils import validate_time
-        if validate_time(text):
-            db.update_event(event_id, event_time=text)
-            success = True
-    elif field == 'description':
-        from utils import validate_description
-        if text.lower() == 'удалить':
-            db.update_event(event_id, description=None)
-            success = True
-        elif validate_description(text):
-            db.update_event(event_id, description=text)
-            success = True
-    
-    if success:
-        await update.message.reply_text("✅ Изменения сохранены!")
-        # Показываем обновленный предпросмотр
-        await show_event_preview(update, context, event_id)
-    else:
-        await update.message.reply_text("❌ Некорректное значение. Попробуйте еще раз.")
+    result = wizard.accept(field, text, editing=True)
+    if result.error:
+        await update.message.reply_text(result.error)
+        return
+    
+    db.update_event(event_id, **{field.column: result.value})
+    # Обновляем предпросмотр на месте вместо отправки новых сообщений
+    await show_event_preview(update, context, event_id, edit_data, notice="✅ Изменения сохранены!")
 
 async def handle_photo_editing(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка редактирования фото"""
-    user_id = update.effective_user.id
-    user_state = db.get_user_state(user_id)
+    user_state = drafts.current(context)
     
     if not user_state or user_state['state'] != STATES['EDITING']:
         return
@@ -167,33 +166,59 @@ async def handle_photo_editing(update: Update, context: ContextTypes.DEFAULT_TYP
     if edit_data.get('field') != 'photo':
         return
     
-    # Проверяем, что это именно фото
-    if not update.message.photo:
-        await update.message.reply_text(
-            "❌ Пожалуйста, отправьте именно фото.\n\n"
-            "Поддерживаемые форматы: .png, .jpeg, .jpg"
-        )
+    if update.message.media_group_id:
+        # Части альбома приходят отдельными апдейтами - обрабатываем их разом
+        albums.buffer.add(update, lambda updates: handle_album_editing(updates, context))
         return
     
     event_id = edit_data.get('event_id')
-    photo = update.message.photo[-1]
     
-    # Сохраняем новое фото
-    db.update_event(event_id, photo_file_id=photo.file_id)
+    # Проверяем, обрабатываем и дедуплицируем изображение
+    file_id = await receive_photo(update, context)
+    if not file_id:
+        return
+    
+    # Сохраняем новое фото; прежний альбом, если был, заменяется им
+    db.set_event_photos(event_id, [file_id])
+    db.update_event(event_id, photo_file_id=file_id)
     
-    await update.message.reply_text("✅ Фото обновлено!")
-    await show_event_preview(update, context, event_id)
+    await show_event_preview(update, context, event_id, edit_data, notice="✅ Фото обновлено!")
+
+async def handle_album_editing(updates: list, context: ContextTypes.DEFAULT_TYPE):
+    """Замена фото анонса альбомом"""
+    update = updates[0]
+    user_state = drafts.current(context)
+    if not user_state or user_state['state'] != STATES['EDITING']:
+        return
+    
+    edit_data = user_state.get('data', {})
+    if edit_data.get('field') != 'photo':
+        return
+    
+    event_id = edit_data.get('event_id')
+    file_ids = await receive_album(updates, context)
+    if not file_ids:
+        return
+    
+    # Весь альбом - одной транзакцией; первое фото - обложка анонса
+    db.set_event_photos(event_id, file_ids)
+    db.update_event(event_id, photo_file_id=file_ids[0])
+    
+    await show_event_preview(update, context, event_id, edit_data, notice="✅ Фото обновлено!")
 
 async def handle_submit_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
     """Обработка отправки на модерацию"""
     query = update.callback_query
     user_id = query.from_user.id
     
-    logger.info(f"Submit callback: data={data}, user_id={user_id}")
+    logger.info("Submit callback: data=%s, user_id=%s", data, user_id)
     
     # Парсим event_id
     event_id = int(data.split('_')[1])
-    logger.info(f"Parsed event_id: {event_id}")
+    logger.info("Parsed event_id: %s", event_id)
+    
+    if not await enforce_rate_limit(update, context, 'submit'):
+        return
     
     # Проверяем права доступа
     event = db.get_event(event_id)
@@ -207,25 +232,96 @@ async def handle_submit_callback(update: Update, context: ContextTypes.DEFAULT_T
         await query.edit_message_text("❌ У вас нет прав доступа")
         return
     
-    logger.info(f"Starting moderation process for event {event_id}")
+    logger.info("Starting moderation process for event %s", event_id)
     # Отправляем на модерацию
     await send_to_moderation(query, context, event)
 
+def find_resubmitted_event(event, matches):
+    """Почти такой же анонс того же автора, который еще ждет модерации"""
+    for match in matches:
+        if match.similarity < DUPLICATE_REJECT_THRESHOLD:
+            break
+        if match.user_id != event['user_id']:
+            continue
+        original = db.get_event(match.event_id)
+        if original and original['status'] == 'pending':
+            return original
+    return None
+
+async def reject_resubmission(query, context, event, original):
+    """Автоотклонение повторной отправки без передачи администратору"""
+    logger.info("Event %s duplicates pending event %s, rejecting", event['id'], original['id'])
+    metrics.counter('duplicates.rejected_total').inc()
+    db.update_event(event['id'], status='rejected')
+    drafts.clear(context, query.from_user.id)
+    
+    text = (f"⚠️ Такой анонс уже ждет модерации (#{original['id']}).\n\n"
+            "Повторно отправлять его не нужно - администратор скоро рассмотрит заявку.")
+    if query.message.photo:
+        await query.edit_message_caption(caption=text, reply_markup=None)
+    else:
+        await query.edit_message_text(text, reply_markup=None)
+    
+    await context.bot.send_message(
+        chat_id=query.from_user.id,
+        text="Главное меню:",
+        reply_markup=get_main_menu_keyboard()
+    )
+
+async def notify_empty_revision(query, context):
+    """Правка без изменений на модерацию не отправляется"""
+    text = "🤔 В анонсе ничего не изменилось. Измени нужные поля и отправь правку снова."
+    if query.message.photo:
+        await query.edit_message_caption(caption=text, reply_markup=query.message.reply_markup)
+    else:
+        await query.edit_message_text(text, reply_markup=query.message.reply_markup)
+
 async def send_to_moderation(query, context, event):
     """Отправка события на модерацию администратору"""
     try:
-        logger.info(f"Preparing admin message for event {event['id']}")
+        logger.info("Preparing admin message for event %s", event['id'])
+        
         user_info = get_user_info_string(query.from_user)
-        admin_text = format_admin_preview(event, user_info)
+        if event['revision_of']:
+            # Правка опубликованного анонса: администратор видит только изменения
+            original = db.get_event(event['revision_of'])
+            changes = lifecycle.revision_changes(
+                original, event, (db.get_event_photos(original['id']), db.get_event_photos(event['id']))
+            ) if original else {}
+            if not changes:
+                await notify_empty_revision(query, context)
+                return
+            matches = []
+            admin_text = await render(
+                context, format_revision_preview, event, event_record(original), changes, user_info,
+                tenants.registry.channel_of(original)
+            )
+        else:
+            # Повторные отправки и копии чужих анонсов
+            matches = duplicates.index.find_similar(event, DUPLICATE_FLAG_THRESHOLD)
+            if matches:
+                original = find_resubmitted_event(event, matches)
+                if original:
+                    await reject_resubmission(query, context, event, original)
+                    return
+            admin_text = await render(context, format_admin_preview, event, user_info)
+        if matches:
+            metrics.counter('duplicates.flagged_total').inc()
+            admin_text = format_duplicate_warning(matches) + "\n\n" + admin_text
         
-        logger.info(f"Sending to admin chat {ADMIN_CHAT_ID}")
+        # Анонс модерирует чат администраторов его сообщества
+        admin_chat_id = tenants.registry.admin_chat_of(event)
+        logger.info("Sending to admin chat %s", admin_chat_id)
         
-        # Отправляем администратору
-        if event['photo_file_id']:
+        # Отправляем администратору; к альбому нельзя прикрепить кнопки - они в сообщении под ним
+        album = db.get_event_photos(event['id'])
+        if album:
+            logger.info("Sending admin album with %s photos", len(album))
+            await albums.send_album(context.bot, admin_chat_id, album, 'moderation')
+        if event['photo_file_id'] and not album:
             logger.info("Sending admin message with photo")
-            admin_message = await context.bot.send_photo(
-                chat_id=ADMIN_CHAT_ID,
-                photo=event['photo_file_id'],
+            admin_message = await send_photo(
+                context.bot, admin_chat_id, event['photo_file_id'], 'moderation',
                 caption=admin_text,
                 parse_mode='HTML',
                 reply_markup=get_admin_moderation_keyboard(event['id'])
@@ -233,21 +329,24 @@ async def send_to_moderation(query, context, event):
         else:
             logger.info("Sending admin message without photo")
             admin_message = await context.bot.send_message(
-                chat_id=ADMIN_CHAT_ID,
+                chat_id=admin_chat_id,
                 text=admin_text,
                 parse_mode='HTML',
                 reply_markup=get_admin_moderation_keyboard(event['id'])
             )
         
-        logger.info(f"Admin message sent successfully, message_id: {admin_message.message_id}")
+        logger.info("Admin message sent successfully, message_id: %s", admin_message.message_id)
         
         # Сохраняем ID сообщения администратора
         db.update_event(event['id'], 
                        status='pending', 
-                       admin_message_id=admin_message.message_id)
+                       admin_message_id=admin_message.message_id,
+                       submitted_at=time.time())
+        if not event['revision_of']:
+            duplicates.index.add(event)
         
         # Очищаем состояние пользователя
-        db.clear_user_state(query.from_user.id)
+        drafts.clear(context, query.from_user.id)
         
         # Уведомляем пользователя
         if query.message.photo:
@@ -271,9 +370,7 @@ async def send_to_moderation(query, context, event):
         )
         
     except Exception as e:
-        logger.error(f"Error sending to moderation: {e}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error(f"Error sending to moderation: {e}", exc_info=True)
         
         # Правильно показываем ошибку в зависимости от типа сообщения
         if query.message.photo:
@@ -284,47 +381,109 @@ async def send_to_moderation(query, context, event):
         else:
             await query.edit_message_text("❌ Ошибка при отправке на модерацию")
 
-async def handle_approve_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
-    """Обработка одобрения анонса администратором"""
+async def authorize_moderator(query, context, event) -> bool:
+    """Проверка, что нажавший - администратор чата модерации анонса; при отказе - всплывающее сообщение"""
+    chat_id = query.message.chat.id
+    admin_chat_id = tenants.registry.admin_chat_of(event)
+    logger.info("Moderation callback received from chat %s, admin chat: %s", chat_id, admin_chat_id)
+    
+    # Проверяем, что сообщение пришло из админ-чата сообщества анонса
+    if str(chat_id) != str(admin_chat_id):
+        logger.warning(f"Access denied for chat {chat_id}")
+        await query.answer("❌ У вас нет прав администратора")
+        return False
+    # Кнопки видят все участники чата, решения принимают только его администраторы
+    if not await moderation.roster.is_moderator(context.bot, chat_id, query.from_user.id):
+        logger.warning(f"Access denied for user {query.from_user.id} in admin chat {chat_id}")
+        await query.answer("❌ Решения по анонсам принимают только администраторы чата", show_alert=True)
+        return False
+    return True
+
+async def claim_for_decision(query, event_id: int) -> bool:
+    """Захват анонса перед решением: два администратора не решают его одновременно"""
+    refusal = moderation.claim(db, event_id, query.from_user)
+    if refusal:
+        await query.answer(refusal, show_alert=True)
+        return False
+    await query.answer()
+    return True
+
+async def handle_claim_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Администратор берет анонс на рассмотрение"""
     query = update.callback_query
-    logger.info(f"Approve callback received from chat {query.message.chat.id}, admin chat: {ADMIN_CHAT_ID}")
+    event_id = int(data.split('_')[1])
+    event = db.get_event(event_id)
+    if not await authorize_moderator(query, context, event):
+        return
     
-    # Проверяем, что сообщение пришло из админ-чата
-    if str(query.message.chat.id) != str(ADMIN_CHAT_ID):
-        logger.warning(f"Access denied for chat {query.message.chat.id}")
-        await query.answer("❌ У вас нет прав администратора")
+    if not event or event['status'] != 'pending':
+        await query.answer("Решение по этому анонсу уже принято")
+        return
+    refusal = moderation.claim(db, event_id, query.from_user)
+    if refusal:
+        await query.answer(refusal, show_alert=True)
         return
     
+    await query.answer(f"👀 Анонс за тобой на {MODERATION_CLAIM_SECONDS // 60} мин")
+    try:
+        # Остальные администраторы видят, кто рассматривает анонс
+        await query.edit_message_reply_markup(
+            reply_markup=get_admin_moderation_keyboard(event_id, moderation.admin_name(query.from_user))
+        )
+    except TelegramError as e:
+        logger.info(f"Could not mark claim on moderation message of event {event_id}: {e}")
+
+async def handle_approve_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Обработка одобрения анонса администратором"""
+    query = update.callback_query
     event_id = int(data.split('_')[1])
     event = db.get_event(event_id)
-    logger.info(f"Processing approve for event {event_id}")
+    if not await authorize_moderator(query, context, event):
+        return
+    
+    logger.info("Processing approve for event %s", event_id)
     
     if not event:
+        await query.answer()
         await query.edit_message_text("❌ Событие не найдено")
         return
     
+    if not await claim_for_decision(query, event_id):
+        return
+    
+    # Атомарно захватываем событие: повторное нажатие или решение другого
+    # администратора (в том числе в другом процессе) не опубликует его дважды
+    if not db.transition_event_status(event_id, 'pending', 'publishing'):
+        logger.info("Event %s already processed (status: %s)", event_id, event['status'])
+        moderation.release(db, event_id)
+        return
+    
+    if event['revision_of']:
+        await approve_revision(query, context, event)
+        return
+    if DIGEST_MODE:
+        await queue_for_digest(query, context, event)
+        return
+    
     try:
         # Публикуем в канал
-        announcement_text = format_event_announcement(event)
+        announcement_text = await render(context, format_event_announcement, event)
         
-        if event['photo_file_id']:
-            channel_message = await context.bot.send_photo(
-                chat_id=CHANNEL_ID,
-                photo=event['photo_file_id'],
-                caption=announcement_text,
-                parse_mode='HTML'
-            )
-        else:
-            channel_message = await context.bot.send_message(
-                chat_id=CHANNEL_ID,
-                text=announcement_text,
-                parse_mode='HTML'
-            )
+        album = db.get_event_photos(event_id)
+        message_ids = await lifecycle.send_channel_post(
+            context.bot, tenants.registry.channel_of(event), event['photo_file_id'], album, announcement_text,
+            get_rsvp_keyboard(event_id)
+        )
         
         # Обновляем статус события
         db.update_event(event_id, 
                        status='published', 
-                       channel_message_id=channel_message.message_id)
+                       channel_message_id=message_ids[0],
+                       expires_at=eventtime.expires_at(event['starts_at'], time.time()))
+        if album:
+            db.set_album_messages(event_id, message_ids)
+        moderation.decided(db, event, 'approved')
+        subscriptions.announce(dict(event, channel_message_id=message_ids[0]))
         
         # Уведомляем администратора
         await query.edit_message_text(
@@ -345,29 +504,99 @@ async def handle_approve_callback(update: Update, context: ContextTypes.DEFAULT_
         
     except Exception as e:
         logger.error(f"Error approving event: {e}")
+        # Возвращаем событие на модерацию, чтобы его можно было опубликовать повторно
+        db.transition_event_status(event_id, 'publishing', 'pending')
+        moderation.release(db, event_id)
         await query.edit_message_text("❌ Ошибка при публикации")
 
-async def handle_reject_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
-    """Обработка отклонения анонса администратором"""
-    query = update.callback_query
-    logger.info(f"Reject callback received from chat {query.message.chat.id}, admin chat: {ADMIN_CHAT_ID}")
+async def queue_for_digest(query, context, event):
+    """Одобренный анонс в режиме дайджеста ждет публикации вместе с другими"""
+    db.update_event(event['id'], status='queued', expires_at=eventtime.expires_at(event['starts_at'], time.time()))
+    moderation.decided(db, event, 'approved')
     
-    # Проверяем, что сообщение пришло из админ-чата
-    if str(query.message.chat.id) != str(ADMIN_CHAT_ID):
-        logger.warning(f"Access denied for chat {query.message.chat.id}")
-        await query.answer("❌ У вас нет прав администратора")
+    # Набралась полная порция - публикуем дайджест, не дожидаясь интервала
+    wakeup = context.bot_data.get('digest_wakeup')
+    if wakeup is not None and db.count_queued_events(event['tenant_id']) >= DIGEST_MAX_EVENTS:
+        wakeup.set()
+    
+    await query.edit_message_text(
+        f"🗓 <b>АНОНС ОДОБРЕН</b>\n\n"
+        f"Событие #{event['id']} будет опубликовано в ближайшем дайджесте.",
+        parse_mode='HTML',
+        reply_markup=None
+    )
+    await context.bot.send_message(
+        chat_id=event['user_id'],
+        text=f"🎉 <b>Отличные новости!</b>\n\n"
+             f"Твой анонс '{event['theme']}' одобрен и скоро появится в канале "
+             f"в подборке прогулок!\n\n"
+             f"Спасибо за участие! 🙌",
+        parse_mode='HTML'
+    )
+
+async def approve_revision(query, context, revision):
+    """Применение одобренной правки к опубликованному анонсу и его посту в канале"""
+    try:
+        updated = await lifecycle.apply_revision(
+            context.bot, db, revision, lambda func, event: render(context, func, event)
+        )
+    except Exception as e:
+        logger.error(f"Error applying revision {revision['id']}: {e}")
+        # Возвращаем правку на модерацию, чтобы ее можно было применить повторно
+        db.transition_event_status(revision['id'], 'publishing', 'pending')
+        moderation.release(db, revision['id'])
+        await query.edit_message_text("❌ Ошибка при обновлении поста в канале")
         return
     
+    if updated is None:
+        # Анонс успели снять с публикации или перенести в архив
+        db.transition_event_status(revision['id'], 'publishing', 'rejected')
+        moderation.release(db, revision['id'])
+        await query.edit_message_text(
+            f"⚠️ Анонс #{revision['revision_of']} уже не опубликован, правка #{revision['id']} не применена.",
+            reply_markup=None
+        )
+        return
+    
+    db.transition_event_status(revision['id'], 'publishing', 'applied')
+    moderation.decided(db, revision, 'approved')
+    duplicates.index.add(updated)
+    
+    await query.edit_message_text(
+        f"✅ <b>ПРАВКА ПРИМЕНЕНА</b>\n\n"
+        f"Пост анонса #{updated['id']} в канале обновлен.",
+        parse_mode='HTML',
+        reply_markup=None
+    )
+    await context.bot.send_message(
+        chat_id=revision['user_id'],
+        text=f"✅ Изменения в анонсе '{updated['theme']}' одобрены, пост в канале обновлен!"
+    )
+
+async def handle_reject_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Обработка отклонения анонса администратором"""
+    query = update.callback_query
     event_id = int(data.split('_')[1])
     event = db.get_event(event_id)
-    logger.info(f"Processing reject for event {event_id}")
+    if not await authorize_moderator(query, context, event):
+        return
+    
+    logger.info("Processing reject for event %s", event_id)
     
     if not event:
+        await query.answer()
         await query.edit_message_text("❌ Событие не найдено")
         return
     
-    # Обновляем статус
-    db.update_event(event_id, status='rejected')
+    if not await claim_for_decision(query, event_id):
+        return
+    
+    # Обновляем статус (только если событие еще не обработано другим администратором)
+    if not db.transition_event_status(event_id, 'pending', 'rejected'):
+        logger.info("Event %s already processed (status: %s)", event_id, event['status'])
+        moderation.release(db, event_id)
+        return
+    moderation.decided(db, event, 'rejected')
     
     # Уведомляем администратора
     await query.edit_message_text(
@@ -378,17 +607,19 @@ async def handle_reject_callback(update: Update, context: ContextTypes.DEFAULT_T
     )
     
     # Уведомляем автора
-    await context.bot.send_message(
-        chat_id=event['user_id'],
-        text=f"😔 К сожалению, твой анонс '{event['theme']}' не прошел модерацию.\n\n"
-             f"Ты можешь создать новый анонс, исправив замечания."
-    )
+    if event['revision_of']:
+        text = (f"😔 Изменения в анонсе '{event['theme']}' не прошли модерацию.\n\n"
+                f"В канале остается прежняя версия анонса.")
+    else:
+        text = (f"😔 К сожалению, твой анонс '{event['theme']}' не прошел модерацию.\n\n"
+                f"Ты можешь создать новый анонс, исправив замечания.")
+    await context.bot.send_message(chat_id=event['user_id'], text=text)
 
 async def handle_skip_photo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка пропуска фото"""
     query = update.callback_query
     user_id = query.from_user.id
-    user_state = db.get_user_state(user_id)
+    user_state = drafts.current(context)
     
     if not user_state or user_state['state'] != STATES['WAITING_PHOTO']:
         await query.answer("❌ Неверное состояние")
@@ -396,13 +627,11 @@ async def handle_skip_photo_callback(update: Update, context: ContextTypes.DEFAU
     
     event_id = user_state['event_id']
     
-    # Переходим к описанию
-    db.set_user_state(user_id, STATES['WAITING_DESCRIPTION'], event_id)
+    # Переходим к следующему шагу без фото
+    next_field = wizard.NEXT[STATES['WAITING_PHOTO']]
+    drafts.enter(context, user_id, next_field.state, event_id)
     
-    await query.edit_message_text(
-        "6️⃣ Добавьте короткое описание прогулки\n"
-        "Расскажите, что планируете делать, что взять с собой (максимум 500 символов):"
-    )
+    await query.edit_message_text(wizard.step_message(next_field))
 
 async def handle_cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
     """Обработка отмены создания конкретного события"""
@@ -410,7 +639,7 @@ async def handle_cancel_callback(update: Update, context: ContextTypes.DEFAULT_T
     user_id = query.from_user.id
     
     # Очищаем состояние
-    db.clear_user_state(user_id)
+    drafts.clear(context, user_id)
     
     # Правильно редактируем сообщение в зависимости от типа
     if query.message.photo:
@@ -437,7 +666,7 @@ async def handle_cancel_creation_callback(update: Update, context: ContextTypes.
     user_id = query.from_user.id
     
     # Очищаем состояние
-    db.clear_user_state(user_id)
+    drafts.clear(context, user_id)
     
     # Правильно редактируем сообщение в зависимости от типа
     if query.message.photo:
@@ -456,4 +685,156 @@ async def handle_cancel_creation_callback(update: Update, context: ContextTypes.
         chat_id=user_id,
         text="Главное меню:",
         reply_markup=get_main_menu_keyboard()
-    ) 
\ No newline at end of file
+    )
+
+async def handle_search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Листание результатов поиска"""
+    query = update.callback_query
+    page = int(data.split('_')[2])
+    
+    query_text = context.user_data.get('search_query')
+    if not query_text:
+        await query.edit_message_text("🔎 Поиск устарел. Повтори команду /search", reply_markup=None)
+        return
+    
+    text, keyboard = build_search_page(context, query_text, page)
+    await query.edit_message_text(
+        text, parse_mode='HTML', reply_markup=keyboard, disable_web_page_preview=True
+    )
+
+
+async def handle_revise_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Начало правки опубликованного анонса"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    event_id = int(data.split('_')[1])
+    
+    if not await enforce_rate_limit(update, context, 'edit'):
+        return
+    
+    event = db.get_event(event_id)
+    if not event or event['user_id'] != user_id:
+        await query.edit_message_text("❌ Событие не найдено или у вас нет прав доступа")
+        return
+    if event['status'] != 'published':
+        await context.bot.send_message(chat_id=user_id, text="❌ Этот анонс уже не опубликован")
+        return
+    
+    # Одна незавершенная правка на анонс: черновик продолжаем, на модерации - ждем решения
+    revision = db.get_open_revision(event_id)
+    if revision and revision['status'] == 'pending':
+        await context.bot.send_message(
+            chat_id=user_id,
+            text="⏳ Правка этого анонса уже на модерации. Дождись решения администратора."
+        )
+        return
+    revision_id = revision['id'] if revision else db.create_revision(event_id)
+    
+    await show_event_preview(
+        update, context, revision_id,
+        notice="✏️ Правка опубликованного анонса. Измени нужные поля и отправь на модерацию - "
+               "после одобрения пост в канале обновится."
+    )
+
+async def handle_unpublish_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Снятие опубликованного анонса автором (с подтверждением)"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    
+    if data == 'unpublish_keep':
+        await query.edit_message_text("👌 Анонс остается опубликованным.", reply_markup=None)
+        return
+    
+    confirmed = data.startswith('unpublish_confirm_')
+    event_id = int(data.split('_')[-1])
+    event = db.get_event(event_id)
+    if not event or event['user_id'] != user_id:
+        await context.bot.send_message(chat_id=user_id, text="❌ Событие не найдено или у вас нет прав доступа")
+        return
+    
+    if not confirmed:
+        await context.bot.send_message(
+            chat_id=user_id,
+            text=f"🗑 Снять анонс '{event['theme']}' с публикации? Пост в канале будет удален.",
+            reply_markup=get_unpublish_confirm_keyboard(event_id)
+        )
+        return
+    
+    if not db.transition_event_status(event_id, 'published', 'unpublished'):
+        await query.edit_message_text("❌ Этот анонс уже не опубликован", reply_markup=None)
+        return
+    
+    await lifecycle.unpublish_post(context.bot, db, event)
+    logger.info("Event %s unpublished by author %s", event_id, user_id)
+    await query.edit_message_text(f"🗑 Анонс '{event['theme']}' снят с публикации.", reply_markup=None)
+
+async def handle_subscribe_area_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Подписка на новые прогулки рядом с отправленной геопозицией"""
+    query = update.callback_query
+    lat, lng = (float(value) for value in data.split('_')[2:4])
+    text = await add_subscription(update, context, lat=lat, lng=lng, radius_km=SUBSCRIPTION_RADIUS_KM)
+    if text:
+        await context.bot.send_message(chat_id=query.from_user.id, text=text, parse_mode='HTML')
+
+async def handle_unsubscribe_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Отписка из списка /subscriptions"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    subscription_id = int(data.split('_')[1])
+    
+    if db.deactivate_subscription(subscription_id, user_id):
+        subscriptions.index.remove(subscription_id)
+        logger.info("Subscription %s removed by user %s", subscription_id, user_id)
+    
+    remaining = db.get_user_subscriptions(user_id)
+    await query.edit_message_text(
+        format_subscriptions(remaining),
+        parse_mode='HTML',
+        reply_markup=get_subscriptions_keyboard(remaining)
+    )
+
+async def handle_tenant_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Выбор сообщества (города) из /city"""
+    query = update.callback_query
+    tenant = tenants.registry.get(int(data.split('_')[1]))
+    if tenant is None:
+        await query.edit_message_text("❌ Этот город больше не доступен. Выбери другой: /city", reply_markup=None)
+        return
+    
+    context.user_data['tenant_id'] = tenant.id
+    await query.edit_message_text(
+        f"🏙 Город выбран: {tenant.title}. Анонсы, поиск и подписки - в его канале.",
+        reply_markup=None
+    )
+    await context.bot.send_message(
+        chat_id=query.from_user.id,
+        text="Главное меню:",
+        reply_markup=get_main_menu_keyboard()
+    )
+
+RSVP_ANSWERS = {
+    'going': "🙋 Отметили: ты идешь! Увидимся на прогулке",
+    'maybe': "🤔 Отметили: может быть",
+    None: "Отметка снята",
+}
+
+async def handle_rsvp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Кнопки «Иду» / «Может быть» под постом в канале"""
+    query = update.callback_query
+    _, status, event_id = data.split('_')
+    if status not in rsvp.STATUSES or query.message is None:
+        await query.answer()
+        return
+    
+    try:
+        current = await rsvp.board.tap(
+            db, int(event_id), query.from_user.id, status, query.message.chat.id, query.message.message_id
+        )
+    except rsvp.RsvpClosed:
+        await query.answer("Эта прогулка уже прошла или отменена")
+        return
+    except Exception as e:
+        logger.error(f"Error handling RSVP {data}: {e}", exc_info=True)
+        await query.answer("❌ Не получилось, попробуй еще раз")
+        return
+    await query.answer(RSVP_ANSWERS[current])
@@ -0,0 +1,196 @@
+"""
+Горизонтальное масштабирование: один вход (webhook) и N процессов-обработчиков.
+
+Telegram присылает апдейты на webhook, входной процесс определяет пользователя
+и передает апдейт в очередь воркера user_id % N. Так все апдейты одного
+пользователя обрабатываются по порядку одним процессом, а состояние мастера
+хранится в общей базе данных. Решения модераторов защищены атомарной сменой
+статуса события в БД, поэтому два воркера не опубликуют одно событие дважды.
+
+Исключение - нажатия «Иду» / «Может быть» под постами: они распределяются по
+ID анонса, чтобы счетчики поста вел и перерисовывал один воркер (rsvp.py).
+"""
+import json
+import queue
+import asyncio
+import logging
+import multiprocessing
+from http.server import ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from health import HealthHandler
+from logs import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Типы апдейтов, в которых есть отправитель
+UPDATE_TYPES = (
+    'message', 'edited_message', 'callback_query', 'channel_post', 'edited_channel_post',
+    'inline_query', 'chosen_inline_result', 'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+# Кнопки отметок под постом: callback_data rsvp_<статус>_<event_id>
+RSVP_PREFIX = 'rsvp_'
+
+def partition_key(update: Dict) -> int:
+    """Ключ распределения апдейта: ID анонса для отметок, иначе ID пользователя, чата или апдейта"""
+    data = (update.get('callback_query') or {}).get('data') or ''
+    if data.startswith(RSVP_PREFIX):
+        event_id = data.rsplit('_', 1)[-1]
+        if event_id.isdigit():
+            return int(event_id)
+    for update_type in UPDATE_TYPES:
+        payload = update.get(update_type)
+        if not payload:
+            continue
+        sender = payload.get('from') or {}
+        if 'id' in sender:
+            return int(sender['id'])
+        chat = payload.get('chat') or {}
+        if 'id' in chat:
+            return int(chat['id'])
+    return int(update.get('update_id', 0))
+
+def partition(update: Dict, workers: int) -> int:
+    """Номер воркера для апдейта"""
+    return partition_key(update) % workers
+
+class WebhookIngress:
+    """Прием апдейтов и распределение по очередям воркеров"""
+
+    def __init__(self, queues: List, secret_token: Optional[str] = None):
+        self.queues = queues
+        self.secret_token = secret_token
+
+    def dispatch(self, body: bytes) -> bool:
+        """Постановка апдейта в очередь. False - очередь воркера переполнена"""
+        update = json.loads(body)
+        index = partition(update, len(self.queues))
+        try:
+            self.queues[index].put_nowait(body)
+        except queue.Full:
+            logger.warning(f"Worker {index} queue is full, rejecting update {update.get('update_id')}")
+            return False
+        return True
+
+def make_webhook_handler(ingress: WebhookIngress, path: str):
+    """HTTP-обработчик webhook, который заодно отвечает на /health и /metrics"""
+
+    class WebhookHandler(HealthHandler):
+        def do_POST(self):
+            if self.path != path:
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            if ingress.secret_token and \
+                    self.headers.get('X-Telegram-Bot-Api-Secret-Token') != ingress.secret_token:
+                self.send_response(403)
+                self.end_headers()
+                return
+
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                accepted = ingress.dispatch(body)
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            # 503 заставит Telegram повторить доставку позже
+            self.send_response(200 if accepted else 503)
+            self.end_headers()
+
+    return WebhookHandler
+
+def run_worker(index: int, updates_queue, token: str, base_url: Optional[str] = None, workers: int = 1):
+    """Точка входа процесса-воркера"""
+    setup_logging(worker=index)
+    try:
+        asyncio.run(_worker_main(index, updates_queue, token, base_url, workers))
+    except KeyboardInterrupt:
+        pass
+
+async def _worker_main(index: int, updates_queue, token: str, base_url: Optional[str], workers: int):
+    from telegram import Update
+    from bot import create_application
+    from ratelimit import limiter
+
+    # Общие лимиты делятся между воркерами до загрузки сохраненных корзин в post_init
+    limiter.set_shard(index, workers)
+
+    application = create_application(token=token, base_url=base_url)
+    # post_init запускает задачи по расписанию только в воркере 0
+    application.bot_data['worker'] = (index, workers)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    logger.info(f"✅ Worker {index} started")
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            body = await loop.run_in_executor(None, updates_queue.get)
+            if body is None:
+                break
+            update = Update.de_json(json.loads(body), application.bot)
+            await application.update_queue.put(update)
+    finally:
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        logger.info(f"Worker {index} stopped")
+
+def start_workers(workers: int, token: str, base_url: Optional[str] = None, queue_size: int = 1000):
+    """Запуск процессов-воркеров. Возвращает (очереди, процессы)"""
+    # spawn: у каждого воркера свое соединение с БД и свой event loop
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue(maxsize=queue_size) for _ in range(workers)]
+    processes = [
+        context.Process(target=run_worker, args=(index, queues[index], token, base_url, workers),
+                        name=f'bot-worker-{index}', daemon=True)
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    return queues, processes
+
+def stop_workers(queues, processes, timeout: float = 10.0):
+    """Корректная остановка воркеров"""
+    for updates_queue in queues:
+        updates_queue.put(None)
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+
+async def _set_webhook(token: str, url: str, secret_token: Optional[str]):
+    from telegram import Bot
+
+    async with Bot(token) as bot:
+        await bot.set_webhook(
+            url=url,
+            secret_token=secret_token,
+            allowed_updates=['message', 'callback_query'],
+        )
+
+def run_cluster(token: str, webhook_url: str, port: int, workers: int,
+                secret_token: Optional[str] = None, queue_size: int = 1000):
+    """Запуск входного webhook-сервера и воркеров"""
+    path = '/webhook'
+    queues, processes = start_workers(workers, token, queue_size=queue_size)
+    ingress = WebhookIngress(queues, secret_token)
+
+    asyncio.run(_set_webhook(token, webhook_url.rstrip('/') + path, secret_token))
+    logger.info(f"✅ Webhook set, {workers} workers started")
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), make_webhook_handler(ingress, path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        stop_workers(queues, processes)
@@ -8,13 +8,75 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')  # ID чата администраторов
 CHANNEL_ID = os.getenv('CHANNEL_ID')  # ID канала для публикации
 
+# Сообщества (tenants.py): ADMIN_CHAT_ID и CHANNEL_ID задают сообщество 1,
+# остальные города добавляются строками таблицы tenants
+DEFAULT_TENANT_ID = 1
+DEFAULT_TENANT_SLUG = os.getenv('DEFAULT_TENANT_SLUG', 'main')
+DEFAULT_TENANT_TITLE = os.getenv('DEFAULT_TENANT_TITLE', 'Прогулки')
+TENANT_REFRESH_SECONDS = 30  # Как часто подтягивать изменения таблицы tenants
+
+# Режим webhook с несколькими воркерами (если WEBHOOK_URL не задан - long polling)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный адрес сервиса, например https://bot.up.railway.app
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', 2))
+WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', 1000))
+
 # Конфигурация базы данных
 DATABASE_URL = os.getenv('DATABASE_URL', 'events.db')
+# PostgreSQL: отдельные соединения для многошаговых транзакций (общее работает в autocommit)
+DB_TRANSACTION_POOL_SIZE = int(os.getenv('DB_TRANSACTION_POOL_SIZE', 4))
 
 # Максимальные размеры
 MAX_PHOTO_SIZE = 10 * 1024 * 1024  # 10MB
 MAX_TEXT_LENGTH = 2000
 
+# Обработка фотографий
+MIN_PHOTO_SIDE = 200  # Минимальная сторона изображения в пикселях
+PHOTO_MAX_SIDE = 1280  # Размер, до которого уменьшаются изображения-документы
+PHOTO_JPEG_QUALITY = 85
+# Альбомы: части альбома приходят отдельными апдейтами с общим media_group_id
+MAX_ALBUM_PHOTOS = 10  # Больше фото в одном альбоме Telegram не принимает
+ALBUM_WINDOW_SECONDS = 1.0  # Сколько ждать следующую часть альбома
+
+# Пул процессов для CPU-тяжелых стадий обработки
+CPU_POOL_WORKERS = int(os.getenv('CPU_POOL_WORKERS', 2))
+# Стадии: (одновременных задач, максимальная очередь ожидания)
+PIPELINE_STAGES = {
+    'images': (CPU_POOL_WORKERS, 20),
+    'render': (CPU_POOL_WORKERS, 50),
+    'index': (1, 4),  # Построение индекса дубликатов при старте
+}
+# Описания длиннее этого порога рендерятся в пуле процессов
+RENDER_OFFLOAD_THRESHOLD = int(os.getenv('RENDER_OFFLOAD_THRESHOLD', 400))
+
+# Поиск дубликатов: оценка сходства анонсов (0..1)
+DUPLICATE_FLAG_THRESHOLD = float(os.getenv('DUPLICATE_FLAG_THRESHOLD', 0.6))  # Предупреждение администратору
+DUPLICATE_REJECT_THRESHOLD = float(os.getenv('DUPLICATE_REJECT_THRESHOLD', 0.9))  # Автоотклонение повторной отправки
+DUPLICATE_REFRESH_SECONDS = 10  # Как часто подтягивать анонсы, отправленные через другие процессы
+
+# Поиск по опубликованным анонсам
+SEARCH_PAGE_SIZE = 5
+
+# Прогулки рядом с присланной геопозицией
+NEARBY_RADIUS_KM = float(os.getenv('NEARBY_RADIUS_KM', 3))
+NEARBY_LIMIT = 5
+
+# Сколько анонсов показывать в разделе «Мои анонсы»
+USER_EVENTS_LIMIT = 10
+
+# Ограничения частоты действий: (сколько раз, за сколько секунд); 0 - без ограничения
+RATE_LIMITS = {
+    'create': (int(os.getenv('CREATE_LIMIT', 5)), 3600),
+    'submit': (int(os.getenv('SUBMIT_LIMIT', 3)), 3600),
+    'edit': (int(os.getenv('EDIT_LIMIT', 30)), 600),
+    'subscribe': (int(os.getenv('SUBSCRIBE_LIMIT', 20)), 3600),
+}
+# Общий лимит на всех пользователей (защищает админ-чат от потока заявок)
+GLOBAL_RATE_LIMITS = {
+    'submit': (int(os.getenv('GLOBAL_SUBMIT_LIMIT', 120)), 3600),
+}
+RATE_LIMIT_FLUSH_SECONDS = 30  # Как часто счетчики сохраняются в БД
+
 # Состояния для FSM
 STATES = {
     'WAITING_THEME': 'waiting_theme',
@@ -25,4 +87,60 @@ STATES = {
     'WAITING_DESCRIPTION': 'waiting_description',
     'PREVIEW': 'preview',
     'EDITING': 'editing'
-} 
\ No newline at end of file
+} 
+# Время прогулок и архивирование прошедших анонсов
+EVENT_TIMEZONE = os.getenv('EVENT_TIMEZONE', 'Europe/Belgrade')  # Часовой пояс, в котором вводится время
+ARCHIVE_GRACE_HOURS = 3  # Через сколько часов после начала прогулка считается прошедшей
+ARCHIVE_UNDATED_DAYS = 14  # Анонсы без разобранной даты архивируются через столько дней после публикации
+ARCHIVE_INTERVAL_SECONDS = 600  # Как часто искать прошедшие анонсы
+ARCHIVE_BATCH_SIZE = 50
+CHANNEL_EDIT_INTERVAL = 3.0  # Пауза между правками постов канала (Telegram: ~20 в минуту на чат)
+
+# Дайджест: одобренные анонсы копятся и публикуются одним постом (альбомом)
+DIGEST_MODE = os.getenv('DIGEST_MODE', 'false').lower() == 'true'
+DIGEST_INTERVAL_SECONDS = int(os.getenv('DIGEST_INTERVAL_SECONDS', 3600))  # Как часто публиковать дайджест
+DIGEST_MAX_EVENTS = min(int(os.getenv('DIGEST_MAX_EVENTS', 10)), 10)  # Дайджест публикуется сразу при наборе; в альбоме до 10 фото
+
+# Незаконченные анонсы после перезапуска: состояния проверяются порциями при старте
+RESUME_BATCH_SIZE = 500
+
+# Сохранение context.user_data / chat_data в БД (persistence.py)
+PERSISTENCE_FLUSH_SECONDS = int(os.getenv('PERSISTENCE_FLUSH_SECONDS', 60))  # Как часто записывать изменения
+
+# Подписки на новые прогулки (subscriptions.py) и рассылка уведомлений (broadcast.py)
+MAX_SUBSCRIPTIONS = 10  # Активных подписок на пользователя
+SUBSCRIPTION_RADIUS_KM = 3.0  # Радиус подписки на район
+SUBSCRIPTION_REFRESH_SECONDS = 30  # Как часто подтягивать подписки, измененные другими процессами
+SUBSCRIPTION_LOAD_BATCH = 5000
+# Telegram: ~30 личных сообщений в секунду на бота; в кластере лимит делится между воркерами
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25)) / (BOT_WORKERS if WEBHOOK_URL else 1)
+BROADCAST_QUEUE_LIMIT = 100000  # Сверх этого уведомления отбрасываются
+
+# Отметки «Иду» / «Может быть» под постами (rsvp.py)
+RSVP_FLUSH_SECONDS = 10  # Как часто отметки записываются в БД
+RSVP_RENDER_SECONDS = 5  # Кнопки одного поста перерисовываются не чаще
+
+# Напоминания о прогулке отметившимся (reminders.py); рассылка - через broadcast.py
+REMINDER_HOURS = float(os.getenv('REMINDER_HOURS', 2))  # За сколько часов до начала напоминать; 0 - не напоминать
+REMINDER_WINDOW_SECONDS = 900  # Напоминания на ближайшие 15 минут держатся в памяти
+REMINDER_POLL_SECONDS = 60  # Как часто подгружать новые напоминания в окно
+REMINDER_BATCH_SIZE = 200  # Сколько наступивших напоминаний захватывается одной транзакцией
+REMINDER_WINDOW_LIMIT = 20000  # Больше напоминаний за раз в память не загружается
+
+# Модерация несколькими администраторами (moderation.py)
+# Статусы участника чата администраторов, которым можно принимать решения (через запятую)
+MODERATOR_STATUSES = tuple(os.getenv('MODERATOR_STATUSES', 'creator,administrator').split(','))
+MODERATOR_CACHE_SECONDS = 300  # Сколько помнить статус участника (get_chat_member)
+MODERATION_CLAIM_SECONDS = 300  # На сколько администратор захватывает анонс
+
+# Фильтр ругательств и ссылок в тексте анонса (textfilter.py)
+# Файлы перечитываются при изменении, без перезапуска бота
+BANNED_TERMS_FILE = os.getenv('BANNED_TERMS_FILE', 'banned_terms.txt')  # Запрещенные слова, по одному в строке
+LINK_ALLOWLIST_FILE = os.getenv('LINK_ALLOWLIST_FILE', 'allowed_links.txt')  # Домены, на которые можно ссылаться
+TEXT_FILTER_REFRESH_SECONDS = 60  # Как часто проверять, не изменились ли файлы
+
+# Логирование (logs.py)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()  # json или text
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.1))  # Доля апдейтов, для которых пишутся INFO/DEBUG шумных модулей
+LOG_SAMPLED_LOGGERS = ('callbacks', 'handlers', 'database', 'database_railway', 'httpx')
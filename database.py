@@ -1,8 +1,23 @@
 import sqlite3
 import json
-from datetime import datetime
-from typing import Optional, Dict, Any
-from config import DATABASE_URL
+import time
+import threading
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+from config import DATABASE_URL, DEFAULT_TENANT_ID
+import schema
+import search
+import geo
+import eventtime
+import duplicates
+
+# Миграция, создающая таблицу полнотекстового поиска events_fts
+SEARCH_MIGRATION = 4
+# Миграция, добавляющая координаты места (lat, lng, geohash)
+GEO_MIGRATION = 5
+# Миграция, добавляющая время начала и архивирования (starts_at, expires_at)
+LIFECYCLE_MIGRATION = 7
 
 class Database:
     def __init__(self, db_path: str = DATABASE_URL):
@@ -10,55 +25,166 @@ class Database:
         self.init_db()
     
     def init_db(self):
-        """Инициализация базы данных"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    username TEXT,
-                    theme TEXT,
-                    place TEXT,
-                    contact TEXT,
-                    event_time TEXT,
-                    photo_file_id TEXT,
-                    description TEXT,
-                    status TEXT DEFAULT 'creating',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    admin_message_id INTEGER,
-                    channel_message_id INTEGER
-                )
-            ''')
+        """Инициализация базы данных (применение миграций схемы)"""
+        with closing(sqlite3.connect(self.db_path, isolation_level=None)) as conn:
+            # WAL позволяет нескольким процессам-воркерам читать во время записи
+            conn.execute('PRAGMA journal_mode=WAL')
+            version_before = schema.current_version(conn, 'sqlite')
+            schema.migrate(conn, 'sqlite')
             
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS user_states (
-                    user_id INTEGER PRIMARY KEY,
-                    state TEXT,
-                    event_id INTEGER,
-                    data TEXT,
-                    FOREIGN KEY (event_id) REFERENCES events (id)
+            # Стемминг выполняется в Python, поэтому уже опубликованные анонсы
+            # индексируются здесь, а не в SQL-миграции
+            if version_before < SEARCH_MIGRATION:
+                self._backfill_search_index(conn)
+            if version_before < GEO_MIGRATION:
+                self._backfill_geo(conn)
+            if version_before < LIFECYCLE_MIGRATION:
+                self._backfill_times(conn)
+    
+    def _backfill_geo(self, conn):
+        """Координаты для мест, сохраненных до появления колонок lat/lng"""
+        conn.execute('BEGIN')
+        cursor = conn.execute("SELECT id, place FROM events WHERE place LIKE '%http%'")
+        for event_id, place in cursor.fetchall():
+            columns = geo.place_columns(place)
+            if columns['geohash']:
+                conn.execute(
+                    'UPDATE events SET lat = ?, lng = ?, geohash = ? WHERE id = ?',
+                    (columns['lat'], columns['lng'], columns['geohash'], event_id)
                 )
-            ''')
+        conn.execute('COMMIT')
+    
+    def _backfill_times(self, conn):
+        """Время начала и архивирования для событий, созданных до появления колонок"""
+        conn.execute('BEGIN')
+        cursor = conn.execute(
+            'SELECT id, event_time, status, created_at FROM events WHERE event_time IS NOT NULL'
+        )
+        for event_id, event_time, status, created_at in cursor.fetchall():
+            # Относительные даты ("завтра") отсчитываются от создания анонса (CURRENT_TIMESTAMP - UTC)
+            created = datetime.fromisoformat(created_at).replace(tzinfo=timezone.utc)
+            starts_at = eventtime.time_columns(event_time, created)['starts_at']
+            expires_at = eventtime.expires_at(starts_at, created.timestamp()) if status == 'published' else None
+            conn.execute(
+                'UPDATE events SET starts_at = ?, expires_at = ? WHERE id = ?', (starts_at, expires_at, event_id)
+            )
+        conn.execute('COMMIT')
     
-    def create_event(self, user_id: int, username: str = None) -> int:
-        """Создание нового события"""
+    def _backfill_search_index(self, conn):
+        """Индексация всех опубликованных анонсов"""
+        conn.execute('BEGIN')
+        cursor = conn.execute(
+            "SELECT id, theme, place, description FROM events WHERE status = 'published'"
+        )
+        for row in cursor.fetchall():
+            self._index_event(conn, row[0], dict(zip(search.SEARCH_FIELDS, row[1:])))
+        conn.execute('COMMIT')
+    
+    @staticmethod
+    def _index_event(conn, event_id: int, event: Optional[Dict[str, Any]]):
+        """Обновление строки поискового индекса (None - убрать событие из поиска)"""
+        conn.execute('DELETE FROM events_fts WHERE rowid = ?', (event_id,))
+        if event is not None:
+            document = search.fts_document(event)
+            conn.execute(
+                'INSERT INTO events_fts (rowid, theme, place, description) VALUES (?, ?, ?, ?)',
+                (event_id, document['theme'], document['place'], document['description'])
+            )
+    
+    @classmethod
+    def _sync_search_index(cls, conn, event_id: int):
+        """Синхронизация поискового индекса с текущим состоянием события"""
+        row = conn.execute(
+            'SELECT status, theme, place, description FROM events WHERE id = ?', (event_id,)
+        ).fetchone()
+        if row and row[0] == 'published':
+            cls._index_event(conn, event_id, dict(zip(search.SEARCH_FIELDS, row[1:])))
+        else:
+            cls._index_event(conn, event_id, None)
+    
+    def create_event(self, user_id: int, username: str = None, tenant_id: int = DEFAULT_TENANT_ID) -> int:
+        """Создание нового события в сообществе tenant_id"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.execute(
-                'INSERT INTO events (user_id, username, status) VALUES (?, ?, ?)',
-                (user_id, username, 'creating')
+                'INSERT INTO events (user_id, username, status, tenant_id) VALUES (?, ?, ?, ?)',
+                (user_id, username, 'creating', tenant_id)
             )
             return cursor.lastrowid
     
+    def create_revision(self, event_id: int) -> int:
+        """Правка опубликованного события: черновик-копия с revision_of"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                'INSERT INTO events (user_id, username, theme, place, contact, event_time, photo_file_id, '
+                'description, lat, lng, geohash, starts_at, status, revision_of, tenant_id) '
+                'SELECT user_id, username, theme, place, contact, event_time, photo_file_id, '
+                'description, lat, lng, geohash, starts_at, ?, id, tenant_id FROM events WHERE id = ?',
+                ('creating', event_id)
+            )
+            revision_id = cursor.lastrowid
+            # Альбом копируется вместе с анонсом (без сообщений в канале)
+            conn.execute(
+                'INSERT INTO event_photos (event_id, position, file_id) '
+                'SELECT ?, position, file_id FROM event_photos WHERE event_id = ?',
+                (revision_id, event_id)
+            )
+            return revision_id
+    
+    def set_event_photos(self, event_id: int, file_ids: List[str]):
+        """Замена альбома анонса одной транзакцией; одно фото (или ни одного) - альбома нет"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('DELETE FROM event_photos WHERE event_id = ?', (event_id,))
+            if len(file_ids) > 1:
+                conn.executemany(
+                    'INSERT INTO event_photos (event_id, position, file_id) VALUES (?, ?, ?)',
+                    [(event_id, position, file_id) for position, file_id in enumerate(file_ids)]
+                )
+    
+    def get_event_photos(self, event_id: int) -> List[str]:
+        """file_id фото альбома по порядку; пустой список - у анонса нет альбома"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                'SELECT file_id FROM event_photos WHERE event_id = ? ORDER BY position', (event_id,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def set_album_messages(self, event_id: int, message_ids: List[int]):
+        """Сообщения опубликованного в канале альбома (по порядку фото)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                'UPDATE event_photos SET message_id = ? WHERE event_id = ? AND position = ?',
+                [(message_id, event_id, position) for position, message_id in enumerate(message_ids)]
+            )
+    
+    def get_album_messages(self, event_id: int) -> List[int]:
+        """Сообщения альбома в канале, кроме первого (он хранится в channel_message_id)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                'SELECT message_id FROM event_photos '
+                'WHERE event_id = ? AND position > 0 AND message_id IS NOT NULL ORDER BY position',
+                (event_id,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
     def update_event(self, event_id: int, **kwargs):
         """Обновление события"""
         if not kwargs:
             return
         
+        # Координаты места и время начала всегда соответствуют их тексту
+        if 'place' in kwargs:
+            kwargs.update(geo.place_columns(kwargs['place']))
+        if 'event_time' in kwargs and 'starts_at' not in kwargs:
+            kwargs.update(eventtime.time_columns(kwargs['event_time']))
+        # Индексы дубликатов других процессов подтягивают анонс по content_updated_at
+        if 'status' in kwargs or any(field in kwargs for field in duplicates.TEXT_FIELDS):
+            kwargs['content_updated_at'] = time.time()
+        
         fields = []
         values = []
         for key, value in kwargs.items():
-            if key in ['theme', 'place', 'contact', 'event_time', 'photo_file_id', 'description', 'status', 'admin_message_id', 'channel_message_id']:
+            if key in ['theme', 'place', 'contact', 'event_time', 'photo_file_id', 'description', 'status', 'admin_message_id', 'channel_message_id',
+                       'lat', 'lng', 'geohash', 'starts_at', 'expires_at', 'submitted_at', 'content_updated_at']:
                 fields.append(f'{key} = ?')
                 values.append(value)
         
@@ -72,6 +198,24 @@ class Database:
                     f'UPDATE events SET {", ".join(fields)} WHERE id = ?',
                     values
                 )
+                # Поисковый индекс обновляется в той же транзакции
+                if 'status' in kwargs or any(field in kwargs for field in search.SEARCH_FIELDS):
+                    self._sync_search_index(conn, event_id)
+    
+    def transition_event_status(self, event_id: int, from_status: str, to_status: str) -> bool:
+        """
+        Атомарная смена статуса события, только если текущий статус равен from_status.
+        Возвращает True, если статус изменил именно этот вызов.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                'UPDATE events SET status = ?, updated_at = ? WHERE id = ? AND status = ?',
+                (to_status, datetime.now().isoformat(), event_id, from_status)
+            )
+            changed = cursor.rowcount == 1
+            if changed and 'published' in (from_status, to_status):
+                self._sync_search_index(conn, event_id)
+            return changed
     
     def get_event(self, event_id: int) -> Optional[Dict[str, Any]]:
         """Получение события по ID"""
@@ -92,6 +236,245 @@ class Database:
             row = cursor.fetchone()
             return dict(row) if row else None
     
+    def get_user_announcements(self, user_id: int, limit: int = 10,
+                               tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Анонсы пользователя в сообществе: на модерации, в очереди дайджеста и опубликованные (без правок)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                "SELECT * FROM events WHERE user_id = ? AND status IN ('pending', 'queued', 'published') "
+                'AND revision_of IS NULL AND tenant_id = ? ORDER BY created_at DESC, id DESC LIMIT ?',
+                (user_id, tenant_id, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_open_revision(self, event_id: int) -> Optional[Dict[str, Any]]:
+        """Незавершенная правка события (черновик или на модерации)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                "SELECT * FROM events WHERE revision_of = ? AND status IN ('creating', 'pending') "
+                'ORDER BY id DESC LIMIT 1',
+                (event_id,)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def get_expired_events(self, now: float, limit: int = 50) -> List[Dict[str, Any]]:
+        """Опубликованные события, которым пора в архив, самые давние первыми"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                "SELECT * FROM events WHERE status = 'published' AND expires_at < ? "
+                'ORDER BY expires_at LIMIT ?',
+                (now, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_queued_events(self, limit: int = 10, tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Одобренные анонсы сообщества, ожидающие дайджеста, в порядке одобрения"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                "SELECT * FROM events WHERE tenant_id = ? AND status = 'queued' ORDER BY updated_at, id LIMIT ?",
+                (tenant_id, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def count_queued_events(self, tenant_id: int = DEFAULT_TENANT_ID) -> int:
+        """Сколько одобренных анонсов сообщества ожидает дайджеста"""
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM events WHERE tenant_id = ? AND status = 'queued'", (tenant_id,)
+            ).fetchone()[0]
+    
+    def get_events_by_channel_message(self, message_id: int,
+                                      tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Анонсы, опубликованные одним постом канала сообщества (в порядке времени прогулок)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT * FROM events WHERE tenant_id = ? AND channel_message_id = ? AND revision_of IS NULL '
+                'ORDER BY starts_at IS NULL, starts_at, id',
+                (tenant_id, message_id)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_submitted_events(self, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Порция отправленных на модерацию событий с id > after_id (для построения индексов)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT id, user_id, theme, place, description, status FROM events '
+                'WHERE id > ? AND status != "creating" AND revision_of IS NULL ORDER BY id LIMIT ?',
+                (after_id, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_events_content_updated_since(self, since: float) -> List[Dict[str, Any]]:
+        """Отправленные анонсы, у которых с момента since менялись статус или текст (для индекса дубликатов)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT id, user_id, theme, place, description, status FROM events '
+                'WHERE content_updated_at >= ? AND status != "creating" AND revision_of IS NULL ORDER BY id',
+                (since,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def search_events(self, query: str, limit: int = 10, offset: int = 0,
+                      tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Поиск опубликованных анонсов сообщества, самые релевантные первыми"""
+        match = search.fts_query(query)
+        if match is None:
+            return []
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT events.* FROM events_fts JOIN events ON events.id = events_fts.rowid '
+                'WHERE events_fts MATCH ? AND events.tenant_id = ? '
+                'ORDER BY bm25(events_fts, ?, ?, ?), events.id DESC LIMIT ? OFFSET ?',
+                (match, tenant_id, *search.SEARCH_WEIGHTS, limit, offset)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_published_events_by_geohash(self, prefixes: List[str], limit: int = 500,
+                                        tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Опубликованные события сообщества, geohash которых начинается с одного из префиксов"""
+        if not prefixes:
+            return []
+        # Префикс p - это диапазон [p, p + '{'): '{' следует за 'z' в ASCII
+        conditions = ' OR '.join(['(geohash >= ? AND geohash < ?)'] * len(prefixes))
+        values = [bound for prefix in prefixes for bound in (prefix, prefix + '{')]
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                f"SELECT * FROM events WHERE tenant_id = ? AND status = 'published' AND ({conditions}) LIMIT ?",
+                (tenant_id, *values, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def load_rate_limits(self, updated_after: float) -> List[tuple]:
+        """Корзины лимитов, изменявшиеся после updated_after: [(ключ, токены, время)]"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                'SELECT key, tokens, updated_at FROM rate_limits WHERE updated_at > ?', (updated_after,)
+            )
+            return cursor.fetchall()
+    
+    def save_rate_limits(self, rows: List[tuple], expired_before: float = None):
+        """Сохранение корзин лимитов одной транзакцией; устаревшие строки удаляются"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO rate_limits (key, tokens, updated_at) VALUES (?, ?, ?)', rows
+            )
+            if expired_before is not None:
+                conn.execute('DELETE FROM rate_limits WHERE updated_at < ?', (expired_before,))
+    
+    def load_persistent_data(self, kind: str) -> Dict[str, str]:
+        """Сохраненные данные PTB одного вида: {ключ: JSON}"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute('SELECT key, data FROM persistence WHERE kind = ?', (kind,))
+            return dict(cursor.fetchall())
+    
+    def save_persistent_data(self, rows: List[tuple]):
+        """Запись данных PTB одной транзакцией: [(вид, ключ, JSON)], JSON None - удаление"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO persistence (kind, key, data, updated_at) '
+                'VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
+                [row for row in rows if row[2] is not None]
+            )
+            conn.executemany(
+                'DELETE FROM persistence WHERE kind = ? AND key = ?',
+                [(kind, key) for kind, key, data in rows if data is None]
+            )
+    
+    def get_rsvps(self, event_id: int) -> Dict[int, str]:
+        """Отметки под анонсом: {user_id: статус}"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute('SELECT user_id, status FROM rsvps WHERE event_id = ?', (event_id,))
+            return dict(cursor.fetchall())
+    
+    def get_rsvp_counts(self, event_ids: List[int]) -> Dict[int, Dict[str, int]]:
+        """Число отметок каждого статуса: {event_id: {статус: число}}"""
+        if not event_ids:
+            return {}
+        placeholders = ','.join('?' * len(event_ids))
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                f'SELECT event_id, status, COUNT(*) FROM rsvps WHERE event_id IN ({placeholders}) '
+                'GROUP BY event_id, status',
+                list(event_ids)
+            )
+            counts = {event_id: {} for event_id in event_ids}
+            for event_id, status, count in cursor.fetchall():
+                counts[event_id][status] = count
+            return counts
+    
+    def save_rsvps(self, rows: List[tuple], remind_before: float = None):
+        """
+        Запись отметок одной транзакцией: [(event_id, user_id, статус)], статус None - удаление.
+        С remind_before в той же транзакции создаются (удаляются) напоминания за столько секунд
+        до начала прогулки; напоминание, время которого уже прошло, не создается.
+        """
+        now = time.time()
+        marked = [(event_id, user_id) for event_id, user_id, status in rows if status is not None]
+        removed = [(event_id, user_id) for event_id, user_id, status in rows if status is None]
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO rsvps (event_id, user_id, status, updated_at) VALUES (?, ?, ?, ?)',
+                [(event_id, user_id, status, now) for event_id, user_id, status in rows if status is not None]
+            )
+            conn.executemany('DELETE FROM rsvps WHERE event_id = ? AND user_id = ?', removed)
+            if remind_before is not None:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO reminders (event_id, user_id, due_at) '
+                    'SELECT id, ?, starts_at - ? FROM events WHERE id = ? AND starts_at - ? > ?',
+                    [(user_id, remind_before, event_id, remind_before, now) for event_id, user_id in marked]
+                )
+                conn.executemany('DELETE FROM reminders WHERE event_id = ? AND user_id = ?', removed)
+    
+    def get_pending_reminders(self, until: float, limit: int) -> List[tuple]:
+        """Напоминания со временем отправки до until: [(время, event_id, user_id)] по времени"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                'SELECT due_at, event_id, user_id FROM reminders WHERE due_at <= ? ORDER BY due_at LIMIT ?',
+                (until, limit)
+            )
+            return cursor.fetchall()
+    
+    def claim_reminders(self, keys: List[tuple], now: float) -> List[tuple]:
+        """
+        Захват наступивших напоминаний [(event_id, user_id)] удалением строк одной транзакцией.
+        Возвращает захваченные: отмененные, перенесенные и захваченные другим воркером пропускаются.
+        """
+        claimed = []
+        with sqlite3.connect(self.db_path) as conn:
+            for event_id, user_id in keys:
+                cursor = conn.execute(
+                    'DELETE FROM reminders WHERE event_id = ? AND user_id = ? AND due_at <= ?',
+                    (event_id, user_id, now)
+                )
+                if cursor.rowcount:
+                    claimed.append((event_id, user_id))
+        return claimed
+    
+    def reschedule_reminders(self, event_id: int, starts_at: Optional[float], remind_before: float):
+        """Перенос напоминаний при смене времени прогулки (без времени - отмена)"""
+        with sqlite3.connect(self.db_path) as conn:
+            if starts_at is None:
+                conn.execute('DELETE FROM reminders WHERE event_id = ?', (event_id,))
+            else:
+                conn.execute(
+                    'UPDATE reminders SET due_at = ? WHERE event_id = ?', (starts_at - remind_before, event_id)
+                )
+    
+    def cancel_reminders(self, event_id: int):
+        """Отмена напоминаний о снятой прогулке"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('DELETE FROM reminders WHERE event_id = ?', (event_id,))
+    
     def set_user_state(self, user_id: int, state: str, event_id: int = None, data: Dict = None):
         """Установка состояния пользователя"""
         data_json = json.dumps(data) if data else None
@@ -118,6 +501,211 @@ class Database:
         """Очистка состояния пользователя"""
         with sqlite3.connect(self.db_path) as conn:
             conn.execute('DELETE FROM user_states WHERE user_id = ?', (user_id,))
+    
+    def get_user_states_after(self, user_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Порция состояний пользователей с user_id больше заданного и статус их события"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT s.user_id, s.state, s.event_id, e.status AS event_status FROM user_states s '
+                'LEFT JOIN events e ON e.id = s.event_id WHERE s.user_id > ? ORDER BY s.user_id LIMIT ?',
+                (user_id, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def clear_user_states(self, user_ids: List[int]):
+        """Очистка состояний нескольких пользователей одной транзакцией"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany('DELETE FROM user_states WHERE user_id = ?', [(user_id,) for user_id in user_ids])
+    
+    def ensure_default_tenant(self, slug: str, title: str, admin_chat_id: str, channel_id: str):
+        """Сообщество 1 из переменных окружения (обновляется, если они изменились)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                'INSERT INTO tenants (id, slug, title, admin_chat_id, channel_id, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET slug = excluded.slug, title = excluded.title, '
+                'admin_chat_id = excluded.admin_chat_id, channel_id = excluded.channel_id, '
+                'updated_at = excluded.updated_at '
+                'WHERE (tenants.slug, tenants.title, tenants.admin_chat_id, tenants.channel_id) '
+                'IS NOT (excluded.slug, excluded.title, excluded.admin_chat_id, excluded.channel_id)',
+                (DEFAULT_TENANT_ID, slug, title, str(admin_chat_id), str(channel_id), time.time())
+            )
+    
+    def get_tenants_updated_since(self, since: float) -> List[Dict[str, Any]]:
+        """Сообщества (в том числе выключенные), изменившиеся после since; since=0 - все"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute('SELECT * FROM tenants WHERE updated_at >= ? ORDER BY id', (since,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def claim_moderation(self, event_id: int, admin_id: int, admin_name: Optional[str],
+                         now: float, lease: float) -> Optional[Dict[str, Any]]:
+        """
+        Захват анонса администратором на lease секунд (продление, если он уже его).
+        Возвращает None при успехе, иначе - текущий захват другого администратора.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'INSERT INTO moderation_claims (event_id, admin_id, admin_name, expires_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(event_id) DO UPDATE SET admin_id = excluded.admin_id, '
+                'admin_name = excluded.admin_name, expires_at = excluded.expires_at '
+                'WHERE moderation_claims.admin_id = excluded.admin_id OR moderation_claims.expires_at <= ?',
+                (event_id, admin_id, admin_name, now + lease, now)
+            )
+            if cursor.rowcount == 1:
+                return None
+            row = conn.execute(
+                'SELECT admin_id, admin_name, expires_at FROM moderation_claims WHERE event_id = ?', (event_id,)
+            ).fetchone()
+            return dict(row) if row else None
+    
+    def release_moderation(self, event_id: int):
+        """Снятие захвата анонса (после решения или неудачной публикации)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('DELETE FROM moderation_claims WHERE event_id = ?', (event_id,))
+    
+    def create_subscription(self, user_id: int, **columns) -> int:
+        """Создание подписки (колонки: tenant_id, query, keywords, lat, lng, radius_km, days, hour_from, hour_to)"""
+        columns['updated_at'] = time.time()
+        names = ', '.join(columns)
+        placeholders = ', '.join('?' * len(columns))
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                f'INSERT INTO subscriptions (user_id, {names}) VALUES (?, {placeholders})',
+                (user_id, *columns.values())
+            )
+            return cursor.lastrowid
+    
+    def get_subscription(self, subscription_id: int) -> Optional[Dict[str, Any]]:
+        """Подписка по ID"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM subscriptions WHERE id = ?', (subscription_id,)).fetchone()
+            return dict(row) if row else None
+    
+    def get_user_subscriptions(self, user_id: int) -> List[Dict[str, Any]]:
+        """Активные подписки пользователя"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT * FROM subscriptions WHERE user_id = ? AND active = 1 ORDER BY id', (user_id,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_active_subscriptions(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Порция активных подписок с id больше after_id"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT * FROM subscriptions WHERE id > ? AND active = 1 ORDER BY id LIMIT ?', (after_id, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_subscriptions_updated_since(self, since: float) -> List[Dict[str, Any]]:
+        """Подписки (в том числе выключенные), изменившиеся после since"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute('SELECT * FROM subscriptions WHERE updated_at >= ? ORDER BY id', (since,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def deactivate_subscription(self, subscription_id: int, user_id: int) -> bool:
+        """Отписка; False - подписка не найдена или принадлежит другому пользователю"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                'UPDATE subscriptions SET active = 0, updated_at = ? WHERE id = ? AND user_id = ? AND active = 1',
+                (time.time(), subscription_id, user_id)
+            )
+            return cursor.rowcount == 1
+    
+    def deactivate_user_subscriptions(self, user_id: int):
+        """Отключение всех подписок пользователя (например, если он заблокировал бота)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                'UPDATE subscriptions SET active = 0, updated_at = ? WHERE user_id = ? AND active = 1',
+                (time.time(), user_id)
+            )
+    
+    def get_cached_photo(self, source_unique_id: str) -> Optional[Dict[str, Any]]:
+        """Поиск обработанного фото по file_unique_id исходного файла"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT * FROM photo_cache WHERE source_unique_id = ?', (source_unique_id,)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def find_photo_by_hash(self, phash: str) -> Optional[Dict[str, Any]]:
+        """Поиск уже загруженного фото с тем же перцептивным хешем (похожего, не обязательно того же)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT * FROM photo_cache WHERE phash = ? ORDER BY created_at LIMIT 1', (phash,)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def find_photo_by_content(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Поиск уже загруженного фото с тем же содержимым (sha256)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                'SELECT * FROM photo_cache WHERE content_hash = ? ORDER BY created_at LIMIT 1', (content_hash,)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def save_cached_photo(self, source_unique_id: str, phash: str, file_id: str,
+                          width: int = None, height: int = None, content_hash: str = None):
+        """Сохранение обработанного фото в кэш"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO photo_cache (source_unique_id, phash, file_id, width, height, content_hash) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (source_unique_id, phash, file_id, width, height, content_hash)
+            )
+
+class LazyDatabase:
+    """Отложенная инициализация БД: подключение и миграции при первом обращении"""
+    
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+    
+    def get(self):
+        """Получение (и при необходимости создание) экземпляра базы данных"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+    
+    def instrument(self, wrapper):
+        """Оборачивание экземпляра БД (например, счетчиком операций в бенчмарках)"""
+        self._instance = wrapper(self.get())
+        return self._instance
+    
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+    
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+def is_postgres_url(url: str) -> bool:
+    """Проверка, указывает ли DATABASE_URL на PostgreSQL"""
+    return bool(url) and url.startswith(('postgres://', 'postgresql://'))
+
+def create_database():
+    """Создание бэкенда БД по DATABASE_URL: PostgreSQL на Railway, иначе SQLite"""
+    if is_postgres_url(DATABASE_URL):
+        from database_railway import DatabaseManager
+        return DatabaseManager()
+    return Database()
 
-# Глобальный экземпляр базы данных
-db = Database() 
\ No newline at end of file
+# Глобальный экземпляр базы данных (подключается при первом использовании)
+db = LazyDatabase(create_database)
+ 
\ No newline at end of file
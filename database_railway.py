@@ -1,15 +1,35 @@
 import os
 import json
+import time
 import logging
+import threading
+from contextlib import contextmanager
+from datetime import timezone
 from typing import Dict, List, Optional, Any
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+import schema
+import geo
+import eventtime
+import duplicates
+from database import LazyDatabase
+from config import DEFAULT_TENANT_ID, DB_TRANSACTION_POOL_SIZE
 
 logger = logging.getLogger(__name__)
 
+# Поля с весами для вектора полнотекстового поиска (см. миграцию 0005_search)
+SEARCH_VECTOR_WEIGHTS = (('theme', 'A'), ('place', 'B'), ('description', 'C'))
+# Миграция, добавляющая координаты места (lat, lng, geohash)
+GEO_MIGRATION = 7
+# Миграция, добавляющая время начала и архивирования (starts_at, expires_at)
+LIFECYCLE_MIGRATION = 10
+
 class DatabaseManager:
     def __init__(self):
         self.connection = None
+        self.pool = None
         self.connect()
         self.create_tables()
     
@@ -19,85 +39,114 @@ class DatabaseManager:
             # Railway автоматически предоставляет переменную DATABASE_URL
             database_url = os.getenv('DATABASE_URL')
             if database_url:
-                self.connection = psycopg2.connect(database_url)
+                args, kwargs = (database_url,), {}
             else:
                 # Fallback на отдельные переменные
-                self.connection = psycopg2.connect(
+                args, kwargs = (), dict(
                     host=os.getenv('PGHOST', 'localhost'),
                     database=os.getenv('PGDATABASE', 'railway'),
                     user=os.getenv('PGUSER', 'postgres'),
                     password=os.getenv('PGPASSWORD', ''),
                     port=os.getenv('PGPORT', 5432)
                 )
-            
+            self.connection = psycopg2.connect(*args, **kwargs)
             self.connection.autocommit = True
+            # Многошаговые транзакции идут через свои соединения: запросы других потоков
+            # по общему соединению иначе попали бы внутрь чужой транзакции (и в ее ROLLBACK)
+            self.pool = ThreadedConnectionPool(0, DB_TRANSACTION_POOL_SIZE, *args, **kwargs)
+            # ThreadedConnectionPool не ждет свободного соединения, а бросает PoolError
+            self._pool_slots = threading.BoundedSemaphore(DB_TRANSACTION_POOL_SIZE)
             logger.info("✅ Подключение к PostgreSQL установлено")
             
         except Exception as e:
             logger.error(f"❌ Ошибка подключения к БД: {e}")
             raise
 
+    @contextmanager
+    def _transaction(self):
+        """Курсор транзакции на соединении из пула: COMMIT при выходе, ROLLBACK при ошибке"""
+        with self._pool_slots:
+            connection = self.pool.getconn()
+            try:
+                with connection.cursor() as cursor:
+                    yield cursor
+                connection.commit()
+            except Exception:
+                try:
+                    connection.rollback()
+                except psycopg2.Error as e:
+                    # Соединение оборвалось - исходная ошибка важнее
+                    logger.error(f"❌ Ошибка отката транзакции: {e}")
+                raise
+            finally:
+                self.pool.putconn(connection, close=bool(connection.closed))
+
     def create_tables(self):
-        """Создание таблиц в базе данных"""
-        cursor = self.connection.cursor()
-        
+        """Создание и обновление таблиц через версионированные миграции"""
         try:
-            # Таблица событий
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS events (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,
-                    theme VARCHAR(100) NOT NULL,
-                    place VARCHAR(500) NOT NULL,
-                    contact VARCHAR(100) NOT NULL,
-                    event_time VARCHAR(100) NOT NULL,
-                    photo_file_id VARCHAR(255),
-                    description TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status VARCHAR(20) DEFAULT 'draft',
-                    admin_message_id BIGINT,
-                    channel_message_id BIGINT
-                )
-            ''')
+            version_before = schema.current_version(self.connection, 'postgres')
+            version = schema.migrate(self.connection, 'postgres')
+            logger.info("✅ Схема базы данных актуальна (версия %s)", version)
             
-            # Таблица состояний пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_states (
-                    user_id BIGINT PRIMARY KEY,
-                    state VARCHAR(50) NOT NULL,
-                    event_id INTEGER REFERENCES events(id) ON DELETE CASCADE,
-                    data TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            # Ссылки разбираются в Python, поэтому координаты старых событий заполняются здесь
+            if version_before < GEO_MIGRATION:
+                self._backfill_geo()
+            if version_before < LIFECYCLE_MIGRATION:
+                self._backfill_times()
             
-            # Индексы для производительности
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_user_id ON events(user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_status ON events(status)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_states_user_id ON user_states(user_id)')
+        except Exception as e:
+            logger.error(f"❌ Ошибка миграции схемы: {e}")
+            raise
+
+    def _backfill_geo(self):
+        """Координаты для мест, сохраненных до появления колонок lat/lng"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT id, place FROM events WHERE place LIKE '%%http%%'")
+            for event_id, place in cursor.fetchall():
+                columns = geo.place_columns(place)
+                if columns['geohash']:
+                    cursor.execute(
+                        'UPDATE events SET lat = %s, lng = %s, geohash = %s WHERE id = %s',
+                        (columns['lat'], columns['lng'], columns['geohash'], event_id)
+                    )
             
-            logger.info("✅ Таблицы созданы успешно")
+        except Exception as e:
+            logger.error(f"❌ Ошибка заполнения координат мест: {e}")
+        finally:
+            cursor.close()
+
+    def _backfill_times(self):
+        """Время начала и архивирования для событий, созданных до появления колонок"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('SELECT id, event_time, status, created_at FROM events WHERE event_time IS NOT NULL')
+            for event_id, event_time, status, created_at in cursor.fetchall():
+                # Относительные даты ("завтра") отсчитываются от создания анонса
+                created = created_at.replace(tzinfo=timezone.utc)
+                starts_at = eventtime.time_columns(event_time, created)['starts_at']
+                expires_at = eventtime.expires_at(starts_at, created.timestamp()) if status == 'published' else None
+                cursor.execute(
+                    'UPDATE events SET starts_at = %s, expires_at = %s WHERE id = %s',
+                    (starts_at, expires_at, event_id)
+                )
             
         except Exception as e:
-            logger.error(f"❌ Ошибка создания таблиц: {e}")
-            raise
+            logger.error(f"❌ Ошибка заполнения времени событий: {e}")
         finally:
             cursor.close()
 
-    def create_event(self, user_id: int, theme: str, place: str, contact: str, 
-                    event_time: str, photo_file_id: str = None, description: str = None) -> int:
-        """Создание нового события"""
+    def create_event(self, user_id: int, username: str = None, tenant_id: int = DEFAULT_TENANT_ID) -> int:
+        """Создание нового события в сообществе tenant_id"""
         cursor = self.connection.cursor()
         try:
-            cursor.execute('''
-                INSERT INTO events (user_id, theme, place, contact, event_time, photo_file_id, description)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            ''', (user_id, theme, place, contact, event_time, photo_file_id, description))
+            cursor.execute(
+                'INSERT INTO events (user_id, username, status, tenant_id) VALUES (%s, %s, %s, %s) RETURNING id',
+                (user_id, username, 'creating', tenant_id)
+            )
             
             event_id = cursor.fetchone()[0]
-            logger.info(f"✅ Событие {event_id} создано для пользователя {user_id}")
+            logger.info("✅ Событие %s создано для пользователя %s", event_id, user_id)
             return event_id
             
         except Exception as e:
@@ -106,6 +155,95 @@ class DatabaseManager:
         finally:
             cursor.close()
 
+    def create_revision(self, event_id: int) -> int:
+        """Правка опубликованного события: черновик-копия с revision_of"""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO events (user_id, username, theme, place, contact, event_time, photo_file_id,
+                                        description, lat, lng, geohash, starts_at, status, revision_of, tenant_id)
+                    SELECT user_id, username, theme, place, contact, event_time, photo_file_id,
+                           description, lat, lng, geohash, starts_at, 'creating', id, tenant_id
+                    FROM events WHERE id = %s
+                    RETURNING id
+                ''', (event_id,))
+                revision_id = cursor.fetchone()[0]
+                # Альбом копируется вместе с анонсом (без сообщений в канале)
+                cursor.execute('''
+                    INSERT INTO event_photos (event_id, position, file_id)
+                    SELECT %s, position, file_id FROM event_photos WHERE event_id = %s
+                ''', (revision_id, event_id))
+            
+            logger.info("✅ Правка %s создана для события %s", revision_id, event_id)
+            return revision_id
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания правки события {event_id}: {e}")
+            raise
+
+    def set_event_photos(self, event_id: int, file_ids: List[str]):
+        """Замена альбома анонса одной транзакцией; одно фото (или ни одного) - альбома нет"""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute('DELETE FROM event_photos WHERE event_id = %s', (event_id,))
+                if len(file_ids) > 1:
+                    execute_values(
+                        cursor, 'INSERT INTO event_photos (event_id, position, file_id) VALUES %s',
+                        [(event_id, position, file_id) for position, file_id in enumerate(file_ids)]
+                    )
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения альбома события {event_id}: {e}")
+            raise
+
+    def get_event_photos(self, event_id: int) -> List[str]:
+        """file_id фото альбома по порядку; пустой список - у анонса нет альбома"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                'SELECT file_id FROM event_photos WHERE event_id = %s ORDER BY position', (event_id,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения альбома события {event_id}: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def set_album_messages(self, event_id: int, message_ids: List[int]):
+        """Сообщения опубликованного в канале альбома (по порядку фото)"""
+        cursor = self.connection.cursor()
+        try:
+            # Параметры запроса подставляются заранее: execute_values заполняет только VALUES
+            query = cursor.mogrify('''
+                UPDATE event_photos SET message_id = v.message_id
+                FROM (VALUES %%s) AS v(position, message_id)
+                WHERE event_photos.event_id = %s AND event_photos.position = v.position
+            ''', (event_id,)).decode()
+            execute_values(cursor, query, list(enumerate(message_ids)))
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения сообщений альбома события {event_id}: {e}")
+        finally:
+            cursor.close()
+
+    def get_album_messages(self, event_id: int) -> List[int]:
+        """Сообщения альбома в канале, кроме первого (он хранится в channel_message_id)"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('''
+                SELECT message_id FROM event_photos
+                WHERE event_id = %s AND position > 0 AND message_id IS NOT NULL ORDER BY position
+            ''', (event_id,))
+            return [row[0] for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения сообщений альбома события {event_id}: {e}")
+            return []
+        finally:
+            cursor.close()
+
     def get_event(self, event_id: int) -> Optional[Dict[str, Any]]:
         """Получение события по ID"""
         cursor = self.connection.cursor(cursor_factory=RealDictCursor)
@@ -124,6 +262,15 @@ class DatabaseManager:
         """Обновление события"""
         if not kwargs:
             return True
+        
+        # Координаты места и время начала всегда соответствуют их тексту
+        if 'place' in kwargs:
+            kwargs.update(geo.place_columns(kwargs['place']))
+        if 'event_time' in kwargs and 'starts_at' not in kwargs:
+            kwargs.update(eventtime.time_columns(kwargs['event_time']))
+        # Индексы дубликатов других процессов подтягивают анонс по content_updated_at
+        if 'status' in kwargs or any(field in kwargs for field in duplicates.TEXT_FIELDS):
+            kwargs['content_updated_at'] = time.time()
             
         cursor = self.connection.cursor()
         try:
@@ -135,6 +282,18 @@ class DatabaseManager:
                 set_parts.append(f"{key} = %s")
                 values.append(value)
             
+            # Вектор поиска пересчитывается по новым значениям полей
+            # (в правой части SET колонки еще имеют старые значения)
+            if any(field in kwargs for field, _ in SEARCH_VECTOR_WEIGHTS):
+                parts = []
+                for field, weight in SEARCH_VECTOR_WEIGHTS:
+                    if field in kwargs:
+                        parts.append(f"setweight(to_tsvector('russian', coalesce(%s, '')), '{weight}')")
+                        values.append(kwargs[field])
+                    else:
+                        parts.append(f"setweight(to_tsvector('russian', coalesce({field}, '')), '{weight}')")
+                set_parts.append(f"search_vector = {' || '.join(parts)}")
+            
             set_parts.append("updated_at = CURRENT_TIMESTAMP")
             values.append(event_id)
             
@@ -143,7 +302,7 @@ class DatabaseManager:
             
             success = cursor.rowcount > 0
             if success:
-                logger.info(f"✅ Событие {event_id} обновлено: {kwargs}")
+                logger.info("✅ Событие %s обновлено: %s", event_id, kwargs)
             return success
             
         except Exception as e:
@@ -152,6 +311,25 @@ class DatabaseManager:
         finally:
             cursor.close()
 
+    def transition_event_status(self, event_id: int, from_status: str, to_status: str) -> bool:
+        """
+        Атомарная смена статуса события, только если текущий статус равен from_status.
+        Возвращает True, если статус изменил именно этот вызов.
+        """
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('''
+                UPDATE events SET status = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND status = %s
+            ''', (to_status, event_id, from_status))
+            return cursor.rowcount == 1
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка смены статуса события {event_id}: {e}")
+            return False
+        finally:
+            cursor.close()
+
     def get_user_events(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """Получение событий пользователя"""
         cursor = self.connection.cursor(cursor_factory=RealDictCursor)
@@ -171,6 +349,25 @@ class DatabaseManager:
         finally:
             cursor.close()
 
+    def get_user_current_event(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Получение текущего события пользователя"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT * FROM events 
+                WHERE user_id = %s AND status = 'creating' 
+                ORDER BY created_at DESC 
+                LIMIT 1
+            ''', (user_id,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения текущего события пользователя {user_id}: {e}")
+            return None
+        finally:
+            cursor.close()
+
     def set_user_state(self, user_id: int, state: str, event_id: int = None, data: dict = None):
         """Установка состояния пользователя"""
         cursor = self.connection.cursor()
@@ -187,7 +384,7 @@ class DatabaseManager:
                     updated_at = CURRENT_TIMESTAMP
             ''', (user_id, state, event_id, data_json))
             
-            logger.info(f"✅ Состояние пользователя {user_id} установлено: {state}")
+            logger.info("✅ Состояние пользователя %s установлено: %s", user_id, state)
             
         except Exception as e:
             logger.error(f"❌ Ошибка установки состояния для {user_id}: {e}")
@@ -219,7 +416,7 @@ class DatabaseManager:
         cursor = self.connection.cursor()
         try:
             cursor.execute('DELETE FROM user_states WHERE user_id = %s', (user_id,))
-            logger.info(f"✅ Состояние пользователя {user_id} очищено")
+            logger.info("✅ Состояние пользователя %s очищено", user_id)
             
         except Exception as e:
             logger.error(f"❌ Ошибка очистки состояния для {user_id}: {e}")
@@ -233,7 +430,7 @@ class DatabaseManager:
             cursor.execute('DELETE FROM events WHERE id = %s', (event_id,))
             success = cursor.rowcount > 0
             if success:
-                logger.info(f"✅ Событие {event_id} удалено")
+                logger.info("✅ Событие %s удалено", event_id)
             return success
             
         except Exception as e:
@@ -261,11 +458,702 @@ class DatabaseManager:
         finally:
             cursor.close()
 
+    def get_user_announcements(self, user_id: int, limit: int = 10,
+                               tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Анонсы пользователя в сообществе: на модерации, в очереди дайджеста и опубликованные (без правок)"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT * FROM events
+                WHERE user_id = %s AND status IN ('pending', 'queued', 'published') AND revision_of IS NULL
+                      AND tenant_id = %s
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            ''', (user_id, tenant_id, limit))
+            
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения анонсов пользователя {user_id}: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def get_open_revision(self, event_id: int) -> Optional[Dict[str, Any]]:
+        """Незавершенная правка события (черновик или на модерации)"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT * FROM events
+                WHERE revision_of = %s AND status IN ('creating', 'pending')
+                ORDER BY id DESC
+                LIMIT 1
+            ''', (event_id,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения правки события {event_id}: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def get_expired_events(self, now: float, limit: int = 50) -> List[Dict[str, Any]]:
+        """Опубликованные события, которым пора в архив, самые давние первыми"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT * FROM events
+                WHERE status = 'published' AND expires_at < %s
+                ORDER BY expires_at
+                LIMIT %s
+            ''', (now, limit))
+            
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения прошедших событий: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def get_queued_events(self, limit: int = 10, tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Одобренные анонсы сообщества, ожидающие дайджеста, в порядке одобрения"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT * FROM events
+                WHERE tenant_id = %s AND status = 'queued'
+                ORDER BY updated_at, id
+                LIMIT %s
+            ''', (tenant_id, limit))
+            
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения анонсов для дайджеста: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def count_queued_events(self, tenant_id: int = DEFAULT_TENANT_ID) -> int:
+        """Сколько одобренных анонсов сообщества ожидает дайджеста"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM events WHERE tenant_id = %s AND status = 'queued'", (tenant_id,))
+            return cursor.fetchone()[0]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка подсчета анонсов для дайджеста: {e}")
+            return 0
+        finally:
+            cursor.close()
+
+    def get_events_by_channel_message(self, message_id: int,
+                                      tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Анонсы, опубликованные одним постом канала сообщества (в порядке времени прогулок)"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT * FROM events
+                WHERE tenant_id = %s AND channel_message_id = %s AND revision_of IS NULL
+                ORDER BY starts_at NULLS LAST, id
+            ''', (tenant_id, message_id))
+            
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения анонсов поста {message_id}: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def get_submitted_events(self, after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Порция отправленных на модерацию событий с id > after_id (для построения индексов)"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT id, user_id, theme, place, description, status FROM events
+                WHERE id > %s AND status != 'creating' AND revision_of IS NULL
+                ORDER BY id
+                LIMIT %s
+            ''', (after_id, limit))
+            
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения событий для индекса: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def get_events_content_updated_since(self, since: float) -> List[Dict[str, Any]]:
+        """Отправленные анонсы, у которых с момента since менялись статус или текст (для индекса дубликатов)"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT id, user_id, theme, place, description, status FROM events
+                WHERE content_updated_at >= %s AND status != 'creating' AND revision_of IS NULL
+                ORDER BY id
+            ''', (since,))
+            
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения измененных событий для индекса: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def search_events(self, query: str, limit: int = 10, offset: int = 0,
+                      tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Поиск опубликованных анонсов сообщества, самые релевантные первыми"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT events.* FROM events, websearch_to_tsquery('russian', %s) AS query
+                WHERE status = 'published' AND tenant_id = %s AND search_vector @@ query
+                ORDER BY ts_rank_cd(search_vector, query) DESC, id DESC
+                LIMIT %s OFFSET %s
+            ''', (query, tenant_id, limit, offset))
+            
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска событий: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def get_published_events_by_geohash(self, prefixes: List[str], limit: int = 500,
+                                        tenant_id: int = DEFAULT_TENANT_ID) -> List[Dict[str, Any]]:
+        """Опубликованные события сообщества, geohash которых начинается с одного из префиксов"""
+        if not prefixes:
+            return []
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            # Префикс p - это диапазон [p, p + '{'): '{' следует за 'z' в ASCII
+            conditions = ' OR '.join(
+                ['(geohash COLLATE "C" >= %s AND geohash COLLATE "C" < %s)'] * len(prefixes)
+            )
+            values = [bound for prefix in prefixes for bound in (prefix, prefix + '{')]
+            cursor.execute(
+                f"SELECT * FROM events WHERE tenant_id = %s AND status = 'published' AND ({conditions}) LIMIT %s",
+                (tenant_id, *values, limit)
+            )
+            
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска событий рядом: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def load_rate_limits(self, updated_after: float) -> List[tuple]:
+        """Корзины лимитов, изменявшиеся после updated_after: [(ключ, токены, время)]"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                'SELECT key, tokens, updated_at FROM rate_limits WHERE updated_at > %s', (updated_after,)
+            )
+            return cursor.fetchall()
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки счетчиков лимитов: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def save_rate_limits(self, rows: List[tuple], expired_before: float = None):
+        """Сохранение корзин лимитов одной транзакцией; устаревшие строки удаляются"""
+        try:
+            with self._transaction() as cursor:
+                execute_values(cursor, '''
+                    INSERT INTO rate_limits (key, tokens, updated_at) VALUES %s
+                    ON CONFLICT (key) DO UPDATE SET
+                        tokens = EXCLUDED.tokens,
+                        updated_at = EXCLUDED.updated_at
+                ''', rows)
+                if expired_before is not None:
+                    cursor.execute('DELETE FROM rate_limits WHERE updated_at < %s', (expired_before,))
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения счетчиков лимитов: {e}")
+
+    def get_user_states_after(self, user_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Порция состояний пользователей с user_id больше заданного и статус их события"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                SELECT s.user_id, s.state, s.event_id, e.status AS event_status
+                FROM user_states s LEFT JOIN events e ON e.id = s.event_id
+                WHERE s.user_id > %s
+                ORDER BY s.user_id
+                LIMIT %s
+            ''', (user_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения состояний пользователей: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def clear_user_states(self, user_ids: List[int]):
+        """Очистка состояний нескольких пользователей одной транзакцией"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('DELETE FROM user_states WHERE user_id = ANY(%s)', (list(user_ids),))
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки состояний пользователей: {e}")
+        finally:
+            cursor.close()
+
+    def ensure_default_tenant(self, slug: str, title: str, admin_chat_id: str, channel_id: str):
+        """Сообщество 1 из переменных окружения (обновляется, если они изменились)"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO tenants (id, slug, title, admin_chat_id, channel_id, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (id) DO UPDATE SET
+                    slug = EXCLUDED.slug,
+                    title = EXCLUDED.title,
+                    admin_chat_id = EXCLUDED.admin_chat_id,
+                    channel_id = EXCLUDED.channel_id,
+                    updated_at = EXCLUDED.updated_at
+                WHERE (tenants.slug, tenants.title, tenants.admin_chat_id, tenants.channel_id)
+                      IS DISTINCT FROM (EXCLUDED.slug, EXCLUDED.title, EXCLUDED.admin_chat_id, EXCLUDED.channel_id)
+            ''', (DEFAULT_TENANT_ID, slug, title, str(admin_chat_id), str(channel_id), time.time()))
+            # Следующие сообщества получают id после 1
+            cursor.execute("SELECT setval('tenants_id_seq', GREATEST((SELECT MAX(id) FROM tenants), 1))")
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания сообщества по умолчанию: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def claim_moderation(self, event_id: int, admin_id: int, admin_name: Optional[str],
+                         now: float, lease: float) -> Optional[Dict[str, Any]]:
+        """
+        Захват анонса администратором на lease секунд (продление, если он уже его).
+        Возвращает None при успехе, иначе - текущий захват другого администратора.
+        """
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('''
+                INSERT INTO moderation_claims (event_id, admin_id, admin_name, expires_at)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (event_id) DO UPDATE SET
+                    admin_id = EXCLUDED.admin_id,
+                    admin_name = EXCLUDED.admin_name,
+                    expires_at = EXCLUDED.expires_at
+                WHERE moderation_claims.admin_id = EXCLUDED.admin_id OR moderation_claims.expires_at <= %s
+                RETURNING event_id
+            ''', (event_id, admin_id, admin_name, now + lease, now))
+            if cursor.fetchone():
+                return None
+            cursor.execute(
+                'SELECT admin_id, admin_name, expires_at FROM moderation_claims WHERE event_id = %s', (event_id,)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка захвата анонса {event_id} на модерации: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def release_moderation(self, event_id: int):
+        """Снятие захвата анонса (после решения или неудачной публикации)"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('DELETE FROM moderation_claims WHERE event_id = %s', (event_id,))
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка снятия захвата анонса {event_id}: {e}")
+        finally:
+            cursor.close()
+
+    def get_tenants_updated_since(self, since: float) -> List[Dict[str, Any]]:
+        """Сообщества (в том числе выключенные), изменившиеся после since; since=0 - все"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('SELECT * FROM tenants WHERE updated_at >= %s ORDER BY id', (since,))
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения сообществ: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def create_subscription(self, user_id: int, **columns) -> int:
+        """Создание подписки (колонки: tenant_id, query, keywords, lat, lng, radius_km, days, hour_from, hour_to)"""
+        columns['updated_at'] = time.time()
+        names = ', '.join(columns)
+        placeholders = ', '.join(['%s'] * len(columns))
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                f'INSERT INTO subscriptions (user_id, {names}) VALUES (%s, {placeholders}) RETURNING id',
+                (user_id, *columns.values())
+            )
+            return cursor.fetchone()[0]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания подписки для пользователя {user_id}: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def get_subscription(self, subscription_id: int) -> Optional[Dict[str, Any]]:
+        """Подписка по ID"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('SELECT * FROM subscriptions WHERE id = %s', (subscription_id,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения подписки {subscription_id}: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def get_user_subscriptions(self, user_id: int) -> List[Dict[str, Any]]:
+        """Активные подписки пользователя"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(
+                'SELECT * FROM subscriptions WHERE user_id = %s AND active ORDER BY id', (user_id,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения подписок пользователя {user_id}: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def get_active_subscriptions(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Порция активных подписок с id больше after_id"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(
+                'SELECT * FROM subscriptions WHERE id > %s AND active ORDER BY id LIMIT %s', (after_id, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки подписок: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def get_subscriptions_updated_since(self, since: float) -> List[Dict[str, Any]]:
+        """Подписки (в том числе выключенные), изменившиеся после since"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('SELECT * FROM subscriptions WHERE updated_at >= %s ORDER BY id', (since,))
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка синхронизации подписок: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def deactivate_subscription(self, subscription_id: int, user_id: int) -> bool:
+        """Отписка; False - подписка не найдена или принадлежит другому пользователю"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                'UPDATE subscriptions SET active = FALSE, updated_at = %s '
+                'WHERE id = %s AND user_id = %s AND active',
+                (time.time(), subscription_id, user_id)
+            )
+            return cursor.rowcount == 1
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка отписки {subscription_id}: {e}")
+            return False
+        finally:
+            cursor.close()
+
+    def deactivate_user_subscriptions(self, user_id: int):
+        """Отключение всех подписок пользователя (например, если он заблокировал бота)"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                'UPDATE subscriptions SET active = FALSE, updated_at = %s WHERE user_id = %s AND active',
+                (time.time(), user_id)
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка отключения подписок пользователя {user_id}: {e}")
+        finally:
+            cursor.close()
+
+    def load_persistent_data(self, kind: str) -> Dict[str, str]:
+        """Сохраненные данные PTB одного вида: {ключ: JSON}"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('SELECT key, data FROM persistence WHERE kind = %s', (kind,))
+            return dict(cursor.fetchall())
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки данных {kind}: {e}")
+            return {}
+        finally:
+            cursor.close()
+
+    def save_persistent_data(self, rows: List[tuple]):
+        """Запись данных PTB одной транзакцией: [(вид, ключ, JSON)], JSON None - удаление"""
+        upserts = [row for row in rows if row[2] is not None]
+        deletes = [(kind, key) for kind, key, data in rows if data is None]
+        try:
+            with self._transaction() as cursor:
+                if upserts:
+                    execute_values(cursor, '''
+                        INSERT INTO persistence (kind, key, data) VALUES %s
+                        ON CONFLICT (kind, key) DO UPDATE SET
+                            data = EXCLUDED.data,
+                            updated_at = CURRENT_TIMESTAMP
+                    ''', upserts)
+                if deletes:
+                    execute_values(
+                        cursor, 'DELETE FROM persistence WHERE (kind, key) IN (VALUES %s)', deletes
+                    )
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения данных PTB: {e}")
+            # Несохраненные данные остаются в очереди persistence.py до следующей записи
+            raise
+
+    def get_rsvps(self, event_id: int) -> Dict[int, str]:
+        """Отметки под анонсом: {user_id: статус}"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('SELECT user_id, status FROM rsvps WHERE event_id = %s', (event_id,))
+            return dict(cursor.fetchall())
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения отметок анонса {event_id}: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def get_rsvp_counts(self, event_ids: List[int]) -> Dict[int, Dict[str, int]]:
+        """Число отметок каждого статуса: {event_id: {статус: число}}"""
+        if not event_ids:
+            return {}
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('''
+                SELECT event_id, status, COUNT(*) FROM rsvps
+                WHERE event_id = ANY(%s)
+                GROUP BY event_id, status
+            ''', (list(event_ids),))
+            counts = {event_id: {} for event_id in event_ids}
+            for event_id, status, count in cursor.fetchall():
+                counts[event_id][status] = count
+            return counts
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка подсчета отметок: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def save_rsvps(self, rows: List[tuple], remind_before: float = None):
+        """
+        Запись отметок одной транзакцией: [(event_id, user_id, статус)], статус None - удаление.
+        С remind_before в той же транзакции создаются (удаляются) напоминания за столько секунд
+        до начала прогулки; напоминание, время которого уже прошло, не создается.
+        """
+        now = time.time()
+        upserts = [(event_id, user_id, status, now) for event_id, user_id, status in rows if status is not None]
+        deletes = [(event_id, user_id) for event_id, user_id, status in rows if status is None]
+        try:
+            with self._transaction() as cursor:
+                if upserts:
+                    execute_values(cursor, '''
+                        INSERT INTO rsvps (event_id, user_id, status, updated_at) VALUES %s
+                        ON CONFLICT (event_id, user_id) DO UPDATE SET
+                            status = EXCLUDED.status,
+                            updated_at = EXCLUDED.updated_at
+                    ''', upserts)
+                    if remind_before is not None:
+                        # Параметры запроса подставляются заранее: execute_values заполняет только VALUES
+                        query = cursor.mogrify('''
+                            INSERT INTO reminders (event_id, user_id, due_at)
+                            SELECT e.id, v.user_id, e.starts_at - %s
+                            FROM (VALUES %%s) AS v(event_id, user_id)
+                            JOIN events e ON e.id = v.event_id
+                            WHERE e.starts_at - %s > %s
+                            ON CONFLICT (event_id, user_id) DO UPDATE SET due_at = EXCLUDED.due_at
+                        ''', (remind_before, remind_before, now)).decode()
+                        execute_values(cursor, query, [(event_id, user_id) for event_id, user_id, _, _ in upserts])
+                if deletes:
+                    execute_values(
+                        cursor, 'DELETE FROM rsvps WHERE (event_id, user_id) IN (VALUES %s)', deletes
+                    )
+                    if remind_before is not None:
+                        execute_values(
+                            cursor, 'DELETE FROM reminders WHERE (event_id, user_id) IN (VALUES %s)', deletes
+                        )
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения отметок: {e}")
+            # Несохраненные отметки остаются в очереди rsvp.py до следующей записи
+            raise
+
+    def get_pending_reminders(self, until: float, limit: int) -> List[tuple]:
+        """Напоминания со временем отправки до until: [(время, event_id, user_id)] по времени"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                'SELECT due_at, event_id, user_id FROM reminders WHERE due_at <= %s ORDER BY due_at LIMIT %s',
+                (until, limit)
+            )
+            return cursor.fetchall()
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки напоминаний: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def claim_reminders(self, keys: List[tuple], now: float) -> List[tuple]:
+        """
+        Захват наступивших напоминаний [(event_id, user_id)] удалением строк одним запросом.
+        Возвращает захваченные: отмененные, перенесенные и захваченные другим воркером пропускаются.
+        """
+        if not keys:
+            return []
+        cursor = self.connection.cursor()
+        try:
+            query = cursor.mogrify('''
+                DELETE FROM reminders r
+                USING (VALUES %%s) AS v(event_id, user_id)
+                WHERE r.event_id = v.event_id AND r.user_id = v.user_id AND r.due_at <= %s
+                RETURNING r.event_id, r.user_id
+            ''', (now,)).decode()
+            claimed = execute_values(cursor, query, keys, fetch=True)
+            return [tuple(row) for row in claimed]
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка захвата напоминаний: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def reschedule_reminders(self, event_id: int, starts_at: Optional[float], remind_before: float):
+        """Перенос напоминаний при смене времени прогулки (без времени - отмена)"""
+        cursor = self.connection.cursor()
+        try:
+            if starts_at is None:
+                cursor.execute('DELETE FROM reminders WHERE event_id = %s', (event_id,))
+            else:
+                cursor.execute(
+                    'UPDATE reminders SET due_at = %s WHERE event_id = %s', (starts_at - remind_before, event_id)
+                )
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка переноса напоминаний анонса {event_id}: {e}")
+        finally:
+            cursor.close()
+
+    def cancel_reminders(self, event_id: int):
+        """Отмена напоминаний о снятой прогулке"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('DELETE FROM reminders WHERE event_id = %s', (event_id,))
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка отмены напоминаний анонса {event_id}: {e}")
+        finally:
+            cursor.close()
+
+    def get_cached_photo(self, source_unique_id: str) -> Optional[Dict[str, Any]]:
+        """Поиск обработанного фото по file_unique_id исходного файла"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute('SELECT * FROM photo_cache WHERE source_unique_id = %s', (source_unique_id,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения фото из кэша: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def find_photo_by_hash(self, phash: str) -> Optional[Dict[str, Any]]:
+        """Поиск уже загруженного фото с тем же перцептивным хешем (похожего, не обязательно того же)"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(
+                'SELECT * FROM photo_cache WHERE phash = %s ORDER BY created_at LIMIT 1', (phash,)
+            )
+            result = cursor.fetchone()
+            return dict(result) if result else None
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска фото по хешу: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def find_photo_by_content(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Поиск уже загруженного фото с тем же содержимым (sha256)"""
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(
+                'SELECT * FROM photo_cache WHERE content_hash = %s ORDER BY created_at LIMIT 1', (content_hash,)
+            )
+            result = cursor.fetchone()
+            return dict(result) if result else None
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска фото по содержимому: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def save_cached_photo(self, source_unique_id: str, phash: str, file_id: str,
+                          width: int = None, height: int = None, content_hash: str = None):
+        """Сохранение обработанного фото в кэш"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO photo_cache (source_unique_id, phash, file_id, width, height, content_hash)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (source_unique_id) DO UPDATE SET
+                    phash = EXCLUDED.phash,
+                    file_id = EXCLUDED.file_id,
+                    width = EXCLUDED.width,
+                    height = EXCLUDED.height,
+                    content_hash = EXCLUDED.content_hash
+            ''', (source_unique_id, phash, file_id, width, height, content_hash))
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения фото в кэш: {e}")
+        finally:
+            cursor.close()
+
     def close(self):
         """Закрытие соединения с базой данных"""
+        if self.pool:
+            self.pool.closeall()
         if self.connection:
             self.connection.close()
             logger.info("✅ Соединение с БД закрыто")
 
-# Создаем глобальный экземпляр для использования в модулях
-db = DatabaseManager() 
\ No newline at end of file
+# Глобальный экземпляр для использования в модулях (подключается при первом использовании)
+db = LazyDatabase(DatabaseManager)
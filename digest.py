@@ -0,0 +1,167 @@
+"""
+Режим дайджеста (DIGEST_MODE): одобренные анонсы не публикуются по одному,
+а получают статус queued и выходят в канал пачкой - раз в DIGEST_INTERVAL_SECONDS
+или сразу, как только их набралось DIGEST_MAX_EVENTS.
+
+Анонсы с фото публикуются альбомом (у каждого фото своя подпись), остальные -
+общим текстовым постом; внутри поста анонсы идут по времени прогулки.
+Анонс, текст которого не помещается в подпись к фото (CAPTION_LIMIT), уходит
+в текстовый пост: Telegram отклоняет весь альбом из-за одной длинной подписи.
+Каждый анонс запоминает ID своего поста, поэтому правки и архивирование
+(lifecycle.py) работают и для анонсов из дайджеста.
+
+У каждого сообщества (tenants.py) свой дайджест в своем канале: очередь
+разбирается по сообществам, анонсы разных городов в один пост не попадают.
+"""
+import re
+import html
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List
+
+from config import DEFAULT_TENANT_ID, DIGEST_MAX_EVENTS
+from utils import format_event_announcement, format_digest
+from media import send_photo, send_photo_group
+from eventtime import order_by_time
+import metrics
+import subscriptions
+import tenants
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Telegram на длину текстового сообщения и подписи к фото
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+def caption_length(text: str) -> int:
+    """Длина HTML-текста так, как ее считает Telegram: без тегов, сущности - одним символом"""
+    return len(html.unescape(_TAG_RE.sub('', text)))
+
+def fits_caption(event: Dict[str, Any]) -> bool:
+    return caption_length(format_event_announcement(event)) <= CAPTION_LIMIT
+
+def pack_text_posts(events: List[Dict[str, Any]], limit: int = TEXT_LIMIT) -> List[List[Dict[str, Any]]]:
+    """Разбиение анонсов без фото на посты не длиннее limit символов"""
+    posts, current = [], []
+    for event in events:
+        if current and len(format_digest(current + [event])) > limit:
+            posts.append(current)
+            current = []
+        current.append(event)
+    if current:
+        posts.append(current)
+    return posts
+
+async def _publish(bot, database, channel_id, events: List[Dict[str, Any]]):
+    """Отправка анонсов в канал; каждый анонс отмечается опубликованным сразу после своего поста"""
+    loop = asyncio.get_running_loop()
+
+    async def mark_published(event, message_id, **changes):
+        await loop.run_in_executor(
+            None, lambda: database.update_event(event['id'], status='published', channel_message_id=message_id,
+                                                **changes)
+        )
+        subscriptions.announce(dict(event, channel_message_id=message_id, **changes))
+
+    with_photo, as_text = [], []
+    for event in events:
+        if event['photo_file_id'] and fits_caption(event):
+            with_photo.append(event)
+            continue
+        if event['photo_file_id']:
+            # Длинная подпись сорвала бы отправку всего альбома - анонс идет текстом
+            metrics.counter('digest.long_caption_total').inc()
+        as_text.append(event)
+    if len(with_photo) == 1:
+        event = with_photo[0]
+        message = await send_photo(
+            bot, channel_id, event['photo_file_id'], 'channel',
+            caption=format_event_announcement(event), parse_mode='HTML'
+        )
+        await mark_published(event, message.message_id)
+    elif with_photo:
+        messages = await send_photo_group(
+            bot, channel_id,
+            [(event['photo_file_id'], format_event_announcement(event)) for event in with_photo],
+            'channel', parse_mode='HTML'
+        )
+        for event, message in zip(with_photo, messages):
+            await mark_published(event, message.message_id)
+
+    for post in pack_text_posts(as_text):
+        text = format_event_announcement(post[0]) if len(post) == 1 else format_digest(post)
+        message = await bot.send_message(chat_id=channel_id, text=text, parse_mode='HTML')
+        for event in post:
+            # Анонс с длинной подписью опубликован без фото: правки и архив меняют текст, а не подпись
+            changes = {'photo_file_id': None} if event['photo_file_id'] else {}
+            await mark_published(event, message.message_id, **changes)
+
+async def publish_digest(bot, database, batch_size: int = DIGEST_MAX_EVENTS) -> int:
+    """Публикация накопленных анонсов всех сообществ; возвращает число опубликованных"""
+    published = 0
+    for tenant_id in [tenant.id for tenant in tenants.registry.all()] or [DEFAULT_TENANT_ID]:
+        try:
+            published += await publish_tenant_digest(bot, database, tenant_id, batch_size)
+        except Exception as e:
+            # Ошибка канала одного сообщества не задерживает дайджесты остальных
+            logger.error(f"❌ Ошибка публикации дайджеста сообщества {tenant_id}: {e}")
+    return published
+
+async def publish_tenant_digest(bot, database, tenant_id: int, batch_size: int = DIGEST_MAX_EVENTS) -> int:
+    """Публикация накопленных анонсов сообщества порциями по batch_size; возвращает число опубликованных"""
+    loop = asyncio.get_running_loop()
+    channel_id = tenants.registry.channel(tenant_id)
+    published = 0
+    while True:
+        queued = await loop.run_in_executor(None, database.get_queued_events, batch_size, tenant_id)
+        if not queued:
+            return published
+
+        events = []
+        now = time.time()
+        for event in queued:
+            # В режиме кластера ту же порцию может публиковать другой воркер
+            if not await loop.run_in_executor(
+                None, database.transition_event_status, event['id'], 'queued', 'publishing'
+            ):
+                continue
+            if event['expires_at'] is not None and event['expires_at'] < now:
+                # Прогулка прошла, пока анонс ждал дайджеста
+                await loop.run_in_executor(
+                    None, database.transition_event_status, event['id'], 'publishing', 'archived'
+                )
+                continue
+            events.append(event)
+
+        try:
+            await _publish(bot, database, channel_id, order_by_time(events))
+        except Exception:
+            # Неопубликованные анонсы возвращаются в очередь до следующего дайджеста
+            for event in events:
+                await loop.run_in_executor(
+                    None, database.transition_event_status, event['id'], 'publishing', 'queued'
+                )
+            raise
+
+        published += len(events)
+        metrics.counter('digest.published_total').inc(len(events))
+        if len(queued) < batch_size:
+            return published
+
+async def run_digest(bot, database, wakeup: asyncio.Event, interval: float):
+    """Публикация дайджеста каждые interval секунд или раньше, когда выставлен wakeup"""
+    while True:
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        try:
+            published = await publish_digest(bot, database)
+            if published:
+                logger.info(f"✅ Опубликован дайджест: {published} анонсов")
+        except Exception as e:
+            logger.error(f"❌ Ошибка публикации дайджеста: {e}")
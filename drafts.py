@@ -0,0 +1,45 @@
+"""
+Шаг мастера или правки и черновик, с которым работает пользователь.
+
+Состояние ({'state', 'event_id', 'data'}) лежит в context.user_data и
+сохраняется в БД пачками вместе с остальными user_data (persistence.py),
+поэтому переход между шагами не пишет в базу. Строка user_states пишется,
+только когда пользователь берется за другой черновик, и удаляется вместе
+с состоянием: по ней recovery.py при старте находит незаконченные анонсы,
+а если бот упал, не успев сохранить user_data, resume_draft берет шаг из нее.
+"""
+from typing import Any, Dict, Optional
+
+from telegram.ext import ContextTypes
+
+from database import db
+
+KEY = 'draft'
+
+def current(context: ContextTypes.DEFAULT_TYPE) -> Optional[Dict[str, Any]]:
+    """Состояние пользователя или None, если он ничего не заполняет"""
+    return context.user_data.get(KEY)
+
+def enter(context: ContextTypes.DEFAULT_TYPE, user_id: int, state: str, event_id: int, data: Dict = None):
+    """Переход к шагу state черновика event_id"""
+    previous = context.user_data.get(KEY)
+    context.user_data[KEY] = {'state': state, 'event_id': event_id, 'data': data or {}}
+    # Переход может случиться после обработки апдейта (альбом) - отмечаем данные для записи явно
+    context.application.mark_data_for_update_persistence(user_ids=user_id)
+    if previous is None or previous['event_id'] != event_id:
+        db.set_user_state(user_id, state, event_id, data)
+
+def restore(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> Optional[Dict[str, Any]]:
+    """Состояние из строки user_states (user_data не успели сохранить до остановки)"""
+    row = db.get_user_state(user_id)
+    if not row:
+        return None
+    context.user_data[KEY] = {'state': row['state'], 'event_id': row['event_id'], 'data': row['data'] or {}}
+    context.application.mark_data_for_update_persistence(user_ids=user_id)
+    return context.user_data[KEY]
+
+def clear(context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    """Выход из мастера: черновик отправлен, отменен или устарел"""
+    context.user_data.pop(KEY, None)
+    context.application.mark_data_for_update_persistence(user_ids=user_id)
+    db.clear_user_state(user_id)
@@ -0,0 +1,228 @@
+"""
+Поиск почти одинаковых анонсов (повторная отправка, копирование чужого поста).
+
+Текст анонса (тема, место, описание) разбивается на шинглы из соседних слов,
+по ним считается MinHash-подпись, а подписи раскладываются по LSH-корзинам.
+Поиск похожих анонсов - это несколько обращений к словарям и сравнение
+подписей нескольких кандидатов, без перебора всех событий.
+
+Индекс хранится в памяти процесса: при старте он строится из таблицы events,
+а затем пополняется при каждой отправке на модерацию. Анонсы, отправленные
+или измененные через другие воркеры кластера, подтягиваются из БД по
+content_updated_at раз в DUPLICATE_REFRESH_SECONDS.
+"""
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Union
+
+from config import DUPLICATE_REFRESH_SECONDS
+import metrics
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 32
+BANDS = 8
+SHINGLE_SIZE = 2
+
+_WORD_RE = re.compile(r'\w+')
+# Поля анонса, по тексту которых ищутся дубликаты
+TEXT_FIELDS = ('theme', 'place', 'description')
+
+class Match(NamedTuple):
+    event_id: int
+    user_id: int
+    similarity: float
+
+def announcement_text(event: Dict) -> str:
+    """Текст анонса, по которому сравниваются события"""
+    return ' '.join(event.get(field) or '' for field in TEXT_FIELDS)
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """Множество шинглов из size соседних слов (регистр и ё/е не различаются)"""
+    words = _WORD_RE.findall(text.lower().replace('ё', 'е'))
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def signature(text: str, num_perm: int = NUM_PERM) -> Optional[array]:
+    """
+    MinHash-подпись текста или None, если в тексте нет слов.
+    Вместо num_perm отдельных хеш-функций каждый шингл хешируется один раз
+    через SHAKE-128 с выходом num_perm * 4 байт: на чистом Python это в разы быстрее.
+    """
+    rows = [
+        array('I', hashlib.shake_128(shingle.encode()).digest(num_perm * 4))
+        for shingle in shingles(text)
+    ]
+    if not rows:
+        return None
+    return array('I', map(min, zip(*rows)))
+
+def sign_texts(texts: List[str]) -> List[Optional[bytes]]:
+    """Подписи пачки текстов (выполняется в пуле процессов при построении индекса)"""
+    result = []
+    for text in texts:
+        sig = signature(text)
+        result.append(sig.tobytes() if sig is not None else None)
+    return result
+
+def similarity(first: array, second: array) -> float:
+    """Оценка коэффициента Жаккара по двум подписям"""
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+class DuplicateIndex:
+    """Инкрементальный LSH-индекс подписей анонсов"""
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._signatures: Dict[int, array] = {}
+        self._authors: Dict[int, int] = {}
+        self._buckets: List[Dict[int, Union[int, List[int]]]] = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+        self._synced_at = 0.0
+
+        self.size = metrics.gauge('duplicates.index_size')
+        self.lookup_seconds = metrics.histogram(
+            'duplicates.lookup_seconds', (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+        )
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _band_keys(self, sig: array) -> Iterable[int]:
+        # Коллизии хеша дают лишь лишних кандидатов, которые отсеиваются сравнением подписей
+        rows = self.rows
+        for band in range(self.bands):
+            yield hash(sig[band * rows:(band + 1) * rows].tobytes())
+
+    def _insert(self, event_id: int, user_id: int, signature: array):
+        self._remove(event_id)
+        self._signatures[event_id] = signature
+        self._authors[event_id] = user_id
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            # В большинстве корзин одно событие: храним его ID без списка, это вдвое меньше памяти
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = event_id
+            elif isinstance(bucket, list):
+                bucket.append(event_id)
+            else:
+                buckets[key] = [bucket, event_id]
+
+    def _remove(self, event_id: int):
+        signature = self._signatures.pop(event_id, None)
+        if signature is None:
+            return
+        self._authors.pop(event_id, None)
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            bucket = buckets.get(key)
+            if bucket == event_id:
+                del buckets[key]
+            elif isinstance(bucket, list):
+                bucket.remove(event_id)
+                if len(bucket) == 1:
+                    buckets[key] = bucket[0]
+
+    def add(self, event: Dict):
+        """Добавление (или замена) события в индексе"""
+        sig = signature(announcement_text(event), self.num_perm)
+        with self._lock:
+            if sig is None:
+                self._remove(event['id'])
+            else:
+                self._insert(event['id'], event['user_id'], sig)
+            self.size.set(len(self._signatures))
+
+    def remove(self, event_id: int):
+        with self._lock:
+            self._remove(event_id)
+            self.size.set(len(self._signatures))
+
+    def lookup(self, signature: array, threshold: float, exclude_id: int = None) -> List[Match]:
+        """События с оценкой сходства не ниже threshold, самые похожие первыми"""
+        started_at = time.perf_counter()
+        with self._lock:
+            candidates = set()
+            for buckets, key in zip(self._buckets, self._band_keys(signature)):
+                bucket = buckets.get(key)
+                if isinstance(bucket, list):
+                    candidates.update(bucket)
+                elif bucket is not None:
+                    candidates.add(bucket)
+            candidates.discard(exclude_id)
+
+            matches = []
+            for event_id in candidates:
+                score = similarity(signature, self._signatures[event_id])
+                if score >= threshold:
+                    matches.append(Match(event_id, self._authors[event_id], score))
+        self.lookup_seconds.observe(time.perf_counter() - started_at)
+        matches.sort(key=lambda match: match.similarity, reverse=True)
+        return matches
+
+    def find_similar(self, event: Dict, threshold: float) -> List[Match]:
+        """Похожие на event события (само событие не учитывается)"""
+        sig = signature(announcement_text(event), self.num_perm)
+        if sig is None:
+            return []
+        return self.lookup(sig, threshold, exclude_id=event['id'])
+
+    async def rebuild(self, database, pipeline=None, batch_size: int = 1000):
+        """
+        Построение индекса по таблице events порциями: строки читаются в потоке,
+        подписи считаются в пуле процессов, чтобы не занимать event loop.
+        """
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        self._synced_at = time.time()
+        last_id = 0
+        try:
+            while True:
+                events = await loop.run_in_executor(None, database.get_submitted_events, last_id, batch_size)
+                if not events:
+                    break
+                texts = [announcement_text(event) for event in events]
+                if pipeline is not None:
+                    signatures = await pipeline.run('index', sign_texts, texts)
+                else:
+                    signatures = sign_texts(texts)
+                with self._lock:
+                    for event, packed in zip(events, signatures):
+                        if packed is not None:
+                            self._insert(event['id'], event['user_id'], array('I', packed))
+                    self.size.set(len(self._signatures))
+                last_id = events[-1]['id']
+        except Exception as e:
+            logger.error(f"❌ Ошибка построения индекса дубликатов: {e}")
+            return
+        logger.info(f"✅ Индекс дубликатов построен: {len(self)} событий за {time.perf_counter() - started_at:.1f} с")
+
+    def refresh(self, database) -> int:
+        """Анонсы, отправленные или измененные с прошлой синхронизации (в том числе другими процессами)"""
+        started = time.time()
+        # Перекрытие в секунду: запись, начатая до прошлой синхронизации, могла закоммититься после нее
+        events = database.get_events_content_updated_since(self._synced_at - 1)
+        self._synced_at = started
+        for event in events:
+            self.add(event)
+        return len(events)
+
+    async def run(self, database, pipeline=None, interval: float = DUPLICATE_REFRESH_SECONDS):
+        """Построение индекса и периодическая синхронизация с БД"""
+        await self.rebuild(database, pipeline)
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.refresh, database)
+            except Exception as e:
+                logger.error(f"❌ Ошибка синхронизации индекса дубликатов: {e}")
+
+index = DuplicateIndex()
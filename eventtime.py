@@ -0,0 +1,189 @@
+"""
+Разбор времени прогулки из свободного текста ("Завтра в 18:00", "25 декабря, 12:30",
+"Суббота в 14:00", "25.12 19:30").
+
+Время вводится в часовом поясе города (EVENT_TIMEZONE) и хранится как Unix-время:
+колонка starts_at нужна для архивирования прошедших анонсов и сортировки по времени.
+Относительные даты ("завтра", "в субботу") отсчитываются от момента ввода.
+"Утра/дня/вечера/ночи" после часа учитываются ("в 7 вечера" - 19:00), а час
+без них, уже прошедший сегодня, считается дневным или вечерним ("в 5" - 17:00).
+Если дату разобрать не удалось, starts_at остается пустым.
+"""
+import re
+from datetime import datetime, timedelta, time as dtime
+from typing import Dict, List, NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+from config import EVENT_TIMEZONE, ARCHIVE_GRACE_HOURS, ARCHIVE_UNDATED_DAYS
+
+TIMEZONE = ZoneInfo(EVENT_TIMEZONE)
+# Время для анонсов, где указана только дата
+DEFAULT_TIME = dtime(12, 0)
+# Дата без года, ушедшая в прошлое больше чем на столько дней, относится к следующему году
+PAST_DATE_TOLERANCE_DAYS = 30
+
+_MONTHS = (
+    ('январ', 1), ('феврал', 2), ('март', 3), ('апрел', 4), ('ма', 5), ('июн', 6),
+    ('июл', 7), ('август', 8), ('сентябр', 9), ('октябр', 10), ('ноябр', 11), ('декабр', 12),
+)
+_WEEKDAYS = (
+    ('понедельник', 0), ('вторник', 1), ('сред', 2), ('четверг', 3),
+    ('пятниц', 4), ('суббот', 5), ('воскресень', 6),
+)
+_RELATIVE_DAYS = (('послезавтра', 2), ('завтра', 1), ('сегодня', 0))
+
+_NUMERIC_DATE_RE = re.compile(r'\b(\d{1,2})[./](\d{1,2})(?:[./](\d{2,4}))?\b')
+_TEXT_DATE_RE = re.compile(r'\b(\d{1,2})\s+([а-я]+)(?:\s+(\d{4}))?')
+# "в 7 вечера", "в 8 часов утра", "12 ночи"
+_DAY_PART = r'(?:\s*час(?:а|ов)?)?\s*(утра|дня|вечера|ночи)\b'
+_CLOCK_RE = re.compile(r'\b(\d{1,2})[:.](\d{2})\b(?:' + _DAY_PART + ')?')
+_HOUR_RE = re.compile(r'\b(?:в|к|с)\s+(\d{1,2})\b(?!\s*[./:])(?:' + _DAY_PART + ')?')
+_HOUR_PART_RE = re.compile(r'\b(\d{1,2})' + _DAY_PART)
+
+def _month(word: str) -> Optional[int]:
+    for prefix, month in _MONTHS:
+        if word.startswith(prefix):
+            # "ма" - только май/мая, а не "марта" (проверен раньше) и другие слова
+            if month == 5 and word not in ('май', 'мая'):
+                continue
+            return month
+    return None
+
+def _full_year(year: str) -> int:
+    year = int(year)
+    return year + 2000 if year < 100 else year
+
+def _parse_date(text: str, today):
+    """Дата и позиция найденного фрагмента: (date, (start, end)) или (None, None)"""
+    for match in _TEXT_DATE_RE.finditer(text):
+        month = _month(match.group(2))
+        if month is None:
+            continue
+        year = _full_year(match.group(3)) if match.group(3) else None
+        return _build_date(today, year, month, int(match.group(1))), match.span()
+
+    for match in _NUMERIC_DATE_RE.finditer(text):
+        day, month = int(match.group(1)), int(match.group(2))
+        if not 1 <= month <= 12:
+            # "18.00" - это время, а не дата
+            continue
+        year = _full_year(match.group(3)) if match.group(3) else None
+        return _build_date(today, year, month, day), match.span()
+
+    for word, days in _RELATIVE_DAYS:
+        position = text.find(word)
+        if position != -1:
+            return today + timedelta(days=days), (position, position + len(word))
+
+    for prefix, weekday in _WEEKDAYS:
+        match = re.search(rf'\b{prefix}[а-я]*', text)
+        if match:
+            return today + timedelta(days=(weekday - today.weekday()) % 7), match.span()
+
+    return None, None
+
+def _build_date(today, year: Optional[int], month: int, day: int):
+    try:
+        if year is not None:
+            return today.replace(year=year, month=month, day=day)
+        candidate = today.replace(month=month, day=day)
+        if (today - candidate).days > PAST_DATE_TOLERANCE_DAYS:
+            candidate = candidate.replace(year=today.year + 1)
+        return candidate
+    except ValueError:
+        # 31 апреля и подобные даты
+        return None
+
+class Clock(NamedTuple):
+    time: dtime
+    ambiguous: bool = False   # час без минут и без "утра/вечера": "в 5" может значить и 17:00
+    next_day: bool = False    # "12 ночи" - полночь в конце названного дня
+
+def _clock(hour: int, minute: int, part: Optional[str], bare: bool = False) -> Optional[Clock]:
+    if hour >= 24 or minute >= 60:
+        return None
+    if part == 'ночи' and hour == 12:
+        return Clock(dtime(0, minute), next_day=True)
+    if part in ('дня', 'вечера') and hour < 12:
+        hour += 12
+    return Clock(dtime(hour, minute), ambiguous=bare and part is None and 1 <= hour < 12)
+
+def _parse_clock(text: str) -> Optional[Clock]:
+    for match in _CLOCK_RE.finditer(text):
+        clock = _clock(int(match.group(1)), int(match.group(2)), match.group(3))
+        if clock is not None:
+            return clock
+    match = _HOUR_RE.search(text) or _HOUR_PART_RE.search(text)
+    if match:
+        return _clock(int(match.group(1)), 0, match.group(2), bare=True)
+    return None
+
+def _afternoon(day, clock: Clock, now: datetime):
+    """
+    Прошедший сегодня час без "утра/вечера" - это ближайшие дневные или вечерние
+    часы ("в 5" в полдень - 17:00), а не то же время завтра утром.
+    Возвращает (день, время) или None, если время еще не прошло.
+    """
+    if not clock.ambiguous or datetime.combine(day, clock.time, TIMEZONE) >= now:
+        return None
+    evening = clock.time.replace(hour=clock.time.hour + 12)
+    if datetime.combine(day, evening, TIMEZONE) < now:
+        day += timedelta(days=1)
+    return day, evening
+
+def parse_event_time(text: Optional[str], now: datetime = None) -> Optional[datetime]:
+    """Начало прогулки (aware datetime в EVENT_TIMEZONE) или None, если дату не разобрать"""
+    if not text:
+        return None
+    now = (now or datetime.now(TIMEZONE)).astimezone(TIMEZONE)
+    text = text.lower().replace('ё', 'е')
+
+    day, span = _parse_date(text, now.date())
+    # Время ищется в тексте без фрагмента с датой, чтобы "25.12" не стало "25:12"
+    rest = text[:span[0]] + ' ' + text[span[1]:] if span else text
+    parsed = _parse_clock(rest)
+    clock = parsed.time if parsed else None
+
+    if day is None:
+        if parsed is None:
+            return None
+        # Только время: ближайшее такое время, начиная с сегодняшнего дня
+        day = now.date() + timedelta(days=parsed.next_day)
+        afternoon = _afternoon(day, parsed, now)
+        if afternoon:
+            day, clock = afternoon
+        elif datetime.combine(day, clock, TIMEZONE) < now:
+            day += timedelta(days=1)
+        return datetime.combine(day, clock, TIMEZONE)
+
+    if parsed is not None and parsed.next_day:
+        day += timedelta(days=1)
+    elif day == now.date() and parsed is not None:
+        afternoon = _afternoon(day, parsed, now)
+        if afternoon:
+            day, clock = afternoon
+        elif span and 'сегодня' not in text:
+            # "суббота 10:00", когда суббота сегодня, но 10 утра уже прошло, - следующая неделя
+            if datetime.combine(day, clock, TIMEZONE) < now and _is_weekday(text[span[0]:span[1]]):
+                day += timedelta(days=7)
+
+    return datetime.combine(day, clock or DEFAULT_TIME, TIMEZONE)
+
+def _is_weekday(fragment: str) -> bool:
+    return any(fragment.startswith(prefix) for prefix, _ in _WEEKDAYS)
+
+def time_columns(event_time: Optional[str], now: datetime = None) -> Dict[str, Optional[float]]:
+    """Значение колонки starts_at для текста времени"""
+    starts_at = parse_event_time(event_time, now)
+    return {'starts_at': starts_at.timestamp() if starts_at else None}
+
+def expires_at(starts_at: Optional[float], published_at: float) -> float:
+    """Когда опубликованный анонс уходит в архив"""
+    if starts_at is not None:
+        return starts_at + ARCHIVE_GRACE_HOURS * 3600
+    # Время не разобрано: анонс снимается через ARCHIVE_UNDATED_DAYS после публикации
+    return published_at + ARCHIVE_UNDATED_DAYS * 86400
+
+def order_by_time(events: List[Dict]) -> List[Dict]:
+    """События по времени начала; без разобранного времени - в конце"""
+    return sorted(events, key=lambda event: (event.get('starts_at') is None, event.get('starts_at') or 0, event['id']))
@@ -0,0 +1,155 @@
+"""
+Координаты мест встреч и поиск анонсов рядом с пользователем.
+
+Координаты извлекаются из ссылок Google Maps без обращения к сети
+(формы @lat,lng, !3dlat!4dlng, ?q=, ?query=, ?ll=). Короткие ссылки
+maps.app.goo.gl без перехода по ним не раскрыть, для них координат нет.
+
+Для поиска рядом каждое событие хранит geohash своей точки: клетки,
+близкие к пользователю, - это префиксы geohash, поэтому выборка идет
+по индексу диапазонами строк, а не перебором всей таблицы.
+"""
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_NUMBER = r'(-?\d{1,3}(?:\.\d+)?)'
+_PAIR_RE = re.compile(rf'^\s*{_NUMBER}\s*,\s*{_NUMBER}\s*$')
+# !3d и !4d - точка самого места, @ - центр карты (менее точен)
+_PLACE_RE = re.compile(rf'!3d{_NUMBER}!4d{_NUMBER}')
+_AT_RE = re.compile(rf'@{_NUMBER},{_NUMBER}')
+_URL_RE = re.compile(r'https?://\S+', re.IGNORECASE)
+
+def _valid(lat: float, lng: float) -> Optional[Tuple[float, float]]:
+    if -90 <= lat <= 90 and -180 <= lng <= 180:
+        return lat, lng
+    return None
+
+def parse_maps_coordinates(text: str) -> Optional[Tuple[float, float]]:
+    """Координаты (lat, lng) из первой ссылки Google Maps в тексте или None"""
+    for url in _URL_RE.findall(text or ''):
+        url = unquote(url)
+        for pattern in (_PLACE_RE, _AT_RE):
+            match = pattern.search(url)
+            if match:
+                return _valid(float(match.group(1)), float(match.group(2)))
+
+        params = parse_qs(urlparse(url).query)
+        for key in ('q', 'query', 'll', 'destination'):
+            for value in params.get(key, []):
+                match = _PAIR_RE.match(value)
+                if match:
+                    return _valid(float(match.group(1)), float(match.group(2)))
+    return None
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Geohash точки"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Размер клетки geohash в градусах (по широте, по долготе)"""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Расстояние между точками по поверхности Земли"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def search_prefixes(lat: float, lng: float, radius_km: float) -> List[str]:
+    """
+    Префиксы geohash (клетка точки и 8 соседних), покрывающие круг radius_km:
+    берется самая мелкая точность, при которой клетка не меньше радиуса.
+    """
+    km_per_degree = math.pi * EARTH_RADIUS_KM / 180
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlng = cell_size(candidate)
+        height = dlat * km_per_degree
+        width = dlng * km_per_degree * max(math.cos(math.radians(lat)), 0.01)
+        if min(height, width) >= radius_km:
+            precision = candidate
+            break
+
+    dlat, dlng = cell_size(precision)
+    prefixes = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            neighbor_lat = max(-90.0, min(90.0, lat + i * dlat))
+            neighbor_lng = (lng + j * dlng + 180.0) % 360.0 - 180.0
+            prefixes.add(geohash_encode(neighbor_lat, neighbor_lng, precision))
+    return sorted(prefixes)
+
+def cover_prefixes(lat: float, lng: float, radius_km: float) -> List[str]:
+    """
+    Клетки geohash, пересекающие квадрат вокруг круга radius_km. Клетки мельче,
+    чем в search_prefixes (не меньше половины радиуса), поэтому лишней площади
+    меньше; используется для индекса, где круг хранится долго, а проверяется часто.
+    """
+    km_per_degree = math.pi * EARTH_RADIUS_KM / 180
+    half_lat = radius_km / km_per_degree
+    half_lng = half_lat / max(math.cos(math.radians(lat)), 0.01)
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlng = cell_size(candidate)
+        if dlat >= half_lat / 2 and dlng >= half_lng / 2:
+            precision = candidate
+            break
+
+    # Точки с шагом в клетку и края квадрата: в каждую пересекаемую клетку попадет хотя бы одна
+    dlat, dlng = cell_size(precision)
+    lats = [lat - half_lat + i * dlat for i in range(math.ceil(2 * half_lat / dlat))] + [lat + half_lat]
+    lngs = [lng - half_lng + j * dlng for j in range(math.ceil(2 * half_lng / dlng))] + [lng + half_lng]
+    prefixes = set()
+    for point_lat in lats:
+        for point_lng in lngs:
+            prefixes.add(geohash_encode(
+                max(-90.0, min(90.0, point_lat)), (point_lng + 180.0) % 360.0 - 180.0, precision
+            ))
+    return sorted(prefixes)
+
+def place_columns(place: Optional[str]) -> Dict[str, Optional[float]]:
+    """Значения колонок lat, lng, geohash для текста места"""
+    coordinates = parse_maps_coordinates(place) if place else None
+    if coordinates is None:
+        return {'lat': None, 'lng': None, 'geohash': None}
+    lat, lng = coordinates
+    return {'lat': lat, 'lng': lng, 'geohash': geohash_encode(lat, lng)}
+
+def nearest(events: List[Dict], lat: float, lng: float, radius_km: float, limit: int) -> List[Tuple[float, Dict]]:
+    """Ближайшие события в радиусе: [(расстояние в км, событие)]"""
+    result = []
+    for event in events:
+        distance = haversine_km(lat, lng, event['lat'], event['lng'])
+        if distance <= radius_km:
+            result.append((distance, event))
+    result.sort(key=lambda item: item[0])
+    return result[:limit]
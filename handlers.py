@@ -1,25 +1,50 @@
+import asyncio
 import logging
 from telegram import Update, InputMediaPhoto
 from telegram.ext import ContextTypes
-from telegram.error import TelegramError
+from telegram.error import TelegramError, BadRequest
 
 from database import db
-from config import STATES, ADMIN_CHAT_ID, CHANNEL_ID, MAX_TEXT_LENGTH
+from config import (
+    STATES, MAX_TEXT_LENGTH, MAX_PHOTO_SIZE, SEARCH_PAGE_SIZE,
+    NEARBY_RADIUS_KM, NEARBY_LIMIT, USER_EVENTS_LIMIT, MAX_SUBSCRIPTIONS
+)
 from keyboards import (
     get_main_menu_keyboard, get_preview_keyboard, get_admin_moderation_keyboard,
-    get_skip_photo_keyboard, get_cancel_keyboard
+    get_skip_photo_keyboard, get_search_keyboard, get_user_events_keyboard,
+    get_subscriptions_keyboard, get_area_subscription_keyboard, get_tenants_keyboard
 )
 from utils import (
-    format_event_announcement, format_admin_preview, get_user_info_string,
-    validate_theme, validate_place, validate_contact, validate_time, validate_description, clean_text
+    format_event_announcement, format_admin_preview, format_search_results, format_nearby_events,
+    format_user_announcements, format_subscription, format_subscriptions, get_user_info_string,
+    clean_text
 )
+from media import prepare_photo, send_photo, edit_photo, ImageValidationError
+from pipeline import get_pipeline, render, StageBusy
+import geo
+import metrics
+import wizard
+import drafts
+from ratelimit import limiter, format_retry_after
+from recovery import recovery
+import subscriptions
+import albums
+import tenants
 
 logger = logging.getLogger(__name__)
 
+# Кнопки главного меню
+MENU_BUTTONS = ("📣 Пригласить на прогулку", "📋 Мои анонсы", "ℹ️ Помощь")
+RESUME_NOTICE = "♻️ Бот перезапускался, но твой анонс сохранен. Продолжим с того же места:"
+
 # Команды бота
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
+    # Ссылка t.me/<бот>?start=<slug> сразу выбирает сообщество
+    tenant = tenants.registry.by_slug(context.args[0]) if context.args else None
+    if tenant is not None:
+        context.user_data['tenant_id'] = tenant.id
     welcome_text = f"""
 👋 Привет, {user.first_name}!
 
@@ -33,6 +58,9 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         welcome_text,
         reply_markup=get_main_menu_keyboard()
     )
+    
+    if recovery.take(user.id):
+        await resume_draft(update, context)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /help"""
@@ -49,11 +77,17 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 3. Проверь предпросмотр и отправь на модерацию
 4. Дождись одобрения администратора
 5. Получи уведомление о публикации
+6. В «📋 Мои анонсы» можно изменить или снять опубликованный анонс
 
 **Команды:**
 /start - Начать работу
 /help - Справка
 /cancel - Отменить создание анонса
+/search <запрос> - Поиск по опубликованным анонсам
+/nearby - Прогулки рядом (или отправь геопозицию)
+/subscribe <запрос> - Уведомлять о новых прогулках (например: парк выходные утром)
+/subscriptions - Мои подписки
+/city - Выбрать город
     """
     
     await update.message.reply_text(help_text)
@@ -61,19 +95,155 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /cancel"""
     user_id = update.effective_user.id
-    db.clear_user_state(user_id)
+    drafts.clear(context, user_id)
     
     await update.message.reply_text(
         "❌ Создание анонса отменено.",
         reply_markup=get_main_menu_keyboard()
     )
 
+async def city_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /city"""
+    await ask_tenant(update, context, "🏙 Выбери город - анонсы, поиск и подписки будут в его канале:")
+
+async def ask_tenant(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """Выбор сообщества из списка"""
+    choices = tenants.registry.all()
+    if len(choices) < 2:
+        tenant = tenants.current(context)
+        await update.message.reply_text(
+            f"🏙 Бот работает в одном городе: {tenant.title if tenant else 'выбирать нечего'}.",
+            reply_markup=get_main_menu_keyboard()
+        )
+        return
+    await update.message.reply_text(
+        text, reply_markup=get_tenants_keyboard(choices, context.user_data.get('tenant_id'))
+    )
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /search"""
+    query_text = clean_text(' '.join(context.args or []))
+    if not query_text:
+        await update.message.reply_text(
+            "🔎 Напиши, что искать, после команды.\n\nНапример: /search набережная"
+        )
+        return
+    
+    # Запрос нужен для листания страниц кнопками
+    context.user_data['search_query'] = query_text
+    text, keyboard = build_search_page(context, query_text, 0)
+    await update.message.reply_text(
+        text, parse_mode='HTML', reply_markup=keyboard, disable_web_page_preview=True
+    )
+
+def build_search_page(context: ContextTypes.DEFAULT_TYPE, query_text: str, page: int):
+    """Текст и клавиатура страницы результатов поиска (в сообществе пользователя)"""
+    tenant_id = tenants.current_id(context)
+    # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+    events = db.search_events(
+        query_text, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE, tenant_id=tenant_id
+    )
+    if not events:
+        if page == 0:
+            return "🔎 По этому запросу ничего не нашлось. Попробуй другие слова.", None
+        return "🔎 Больше результатов нет.", get_search_keyboard(page, False)
+    
+    has_next = len(events) > SEARCH_PAGE_SIZE
+    text = format_search_results(
+        events[:SEARCH_PAGE_SIZE], query_text, page, SEARCH_PAGE_SIZE, tenants.registry.channel(tenant_id)
+    )
+    return text, get_search_keyboard(page, has_next)
+
+async def nearby_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /nearby"""
+    await update.message.reply_text(
+        "📍 Отправь свою геопозицию (кнопка «📍 Прогулки рядом» или 📎 → Геопозиция), "
+        "и я покажу ближайшие прогулки.",
+        reply_markup=get_main_menu_keyboard()
+    )
+
+async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск опубликованных прогулок рядом с присланной геопозицией"""
+    location = update.message.location
+    lat, lng = location.latitude, location.longitude
+    
+    tenant_id = tenants.current_id(context)
+    
+    # Кандидаты выбираются по индексу geohash, точное расстояние считается только для них
+    candidates = db.get_published_events_by_geohash(
+        geo.search_prefixes(lat, lng, NEARBY_RADIUS_KM), tenant_id=tenant_id
+    )
+    nearby = geo.nearest(candidates, lat, lng, NEARBY_RADIUS_KM, NEARBY_LIMIT)
+    
+    if not nearby:
+        await update.message.reply_text(
+            f"🤷 В радиусе {NEARBY_RADIUS_KM:g} км пока нет прогулок с точкой на карте.",
+            reply_markup=get_area_subscription_keyboard(lat, lng)
+        )
+        return
+    
+    await update.message.reply_text(
+        format_nearby_events(nearby, NEARBY_RADIUS_KM, tenants.registry.channel(tenant_id)),
+        parse_mode='HTML',
+        disable_web_page_preview=True,
+        reply_markup=get_area_subscription_keyboard(lat, lng)
+    )
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /subscribe"""
+    query_text = clean_text(' '.join(context.args or []))
+    columns = subscriptions.parse_query(query_text)
+    if not query_text or not any(columns.values()):
+        await update.message.reply_text(
+            "🔔 Напиши после команды, о каких прогулках сообщать: слова из анонса, "
+            "дни (выходные, будни, пятница) и время (утром, днем, вечером).\n\n"
+            "Например: /subscribe парк выходные утром\n\n"
+            "Чтобы подписаться на район, отправь геопозицию."
+        )
+        return
+    
+    text = await add_subscription(update, context, query=query_text, **columns)
+    if text:
+        await update.message.reply_text(text, parse_mode='HTML', reply_markup=get_main_menu_keyboard())
+
+async def add_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE, **columns):
+    """Создание подписки и добавление в индекс; возвращает текст ответа (None - сработал лимит)"""
+    user_id = update.effective_user.id
+    if len(db.get_user_subscriptions(user_id)) >= MAX_SUBSCRIPTIONS:
+        return f"🔔 У тебя уже {MAX_SUBSCRIPTIONS} подписок. Удали лишние в /subscriptions."
+    if not await enforce_rate_limit(update, context, 'subscribe'):
+        return None
+    
+    subscription_id = db.create_subscription(user_id, tenant_id=tenants.current_id(context), **columns)
+    subscription = db.get_subscription(subscription_id)
+    subscriptions.index.add(subscriptions.from_row(subscription))
+    logger.info("Subscription %s created by user %s", subscription_id, user_id)
+    return (
+        f"✅ Подписка оформлена: {format_subscription(subscription)}\n\n"
+        "Я напишу, когда в канале появится подходящая прогулка. Все подписки - в /subscriptions."
+    )
+
+async def subscriptions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /subscriptions"""
+    user_subscriptions = db.get_user_subscriptions(update.effective_user.id)
+    await update.message.reply_text(
+        format_subscriptions(user_subscriptions),
+        parse_mode='HTML',
+        reply_markup=get_subscriptions_keyboard(user_subscriptions)
+    )
+
 # Обработчики текстовых сообщений
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Основной обработчик текстовых сообщений"""
     user_id = update.effective_user.id
     text = update.message.text
     
+    if recovery.take(user_id):
+        # Первое сообщение после перезапуска бота, когда у пользователя есть незаконченный анонс.
+        # Ответ на вопрос шага обрабатывается как обычно, на остальное повторяем шаг
+        if await resume_draft(update, context, answer=text not in MENU_BUTTONS):
+            return
+    
     # Проверяем нажатие кнопок главного меню
     if text == "📣 Пригласить на прогулку":
         await start_event_creation(update, context)
@@ -83,7 +253,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         await help_command(update, context)
     else:
         # Обрабатываем состояния пользователя
-        user_state = db.get_user_state(user_id)
+        user_state = drafts.current(context)
         if not user_state:
             await update.message.reply_text(
                 "Используй кнопки меню для взаимодействия с ботом 👇",
@@ -93,234 +263,339 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         await handle_user_input(update, context, user_state)
 
+async def resume_draft(update: Update, context: ContextTypes.DEFAULT_TYPE, answer: bool = False) -> bool:
+    """
+    Повтор текущего шага или предпросмотра незаконченного анонса. Возвращает False,
+    если напоминать не о чем или сообщение (answer) - ответ на вопрос шага.
+    """
+    user_id = update.effective_user.id
+    user_state = drafts.current(context)
+    if not user_state:
+        # Бот упал, не успев сохранить user_data: шаг - из строки восстановления
+        user_state = drafts.restore(context, user_id)
+        if not user_state:
+            return False
+    
+    draft = db.get_user_current_event(user_id)
+    if not draft or draft['id'] != user_state['event_id']:
+        # Состояние указывает не на черновик (анонс уже отправлен или удален)
+        drafts.clear(context, user_id)
+        return False
+    
+    field = wizard.BY_STATE.get(user_state['state'])
+    if answer and (user_state['state'] == STATES['EDITING'] or (field and field.validator)):
+        return False
+    
+    if field is not None:
+        await update.message.reply_text(
+            f"{RESUME_NOTICE}\n\n{wizard.step_message(field)}",
+            reply_markup=field.keyboard()
+        )
+    else:
+        # Предпросмотр или правка поля: показываем предпросмотр заново
+        await show_event_preview(update, context, draft['id'], notice=RESUME_NOTICE)
+    return True
+
+async def enforce_rate_limit(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str) -> bool:
+    """Проверка лимита частоты действия (до записи в БД). False - действие запрещено"""
+    user_id = update.effective_user.id
+    # Корзины и лимиты - в сообществе пользователя
+    retry_after = limiter.acquire(action, user_id, tenants.current_id(context))
+    if not retry_after:
+        return True
+    
+    logger.info("Rate limit hit: action=%s, user_id=%s, retry_after=%.0fs", action, user_id, retry_after)
+    await context.bot.send_message(
+        chat_id=user_id,
+        text=f"⏳ Слишком часто! Попробуй снова через {format_retry_after(retry_after)}."
+    )
+    return False
+
 async def start_event_creation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало создания события"""
     user = update.effective_user
     user_id = user.id
     
+    # Анонс публикуется в канале выбранного сообщества
+    tenant_id = tenants.chosen_id(context)
+    if tenant_id is None:
+        await ask_tenant(update, context, "🏙 Сначала выбери город, в канале которого опубликовать анонс:")
+        return
+    
+    if not await enforce_rate_limit(update, context, 'create'):
+        return
+    
     # Создаем новое событие
-    event_id = db.create_event(user_id, user.username)
+    event_id = db.create_event(user_id, user.username, tenant_id=tenant_id)
     
     # Устанавливаем состояние
-    db.set_user_state(user_id, STATES['WAITING_THEME'], event_id)
+    drafts.enter(context, user_id, STATES['WAITING_THEME'], event_id)
     
     await update.message.reply_text(
-        "🎉 Отлично! Давай создадим анонс события.\n\n"
-        "1️⃣ Какая тема у нашей прогулки? Например:\n"
-        "'Прогулка по центру города' или 'Встреча в парке'",
-        reply_markup=get_cancel_keyboard()
+        f"🎉 Отлично! Давай создадим анонс события.\n\n{wizard.step_message(wizard.FIRST)}",
+        reply_markup=wizard.FIRST.keyboard()
     )
 
 async def handle_user_input(update: Update, context: ContextTypes.DEFAULT_TYPE, user_state):
     """Обработка ввода пользователя в зависимости от состояния"""
-    user_id = update.effective_user.id
     text = clean_text(update.message.text)
     state = user_state['state']
-    event_id = user_state['event_id']
     
-    if state == STATES['WAITING_THEME']:
-        await handle_theme_input(update, context, event_id, text)
-    elif state == STATES['WAITING_PLACE']:
-        await handle_place_input(update, context, event_id, text)
-    elif state == STATES['WAITING_CONTACT']:
-        await handle_contact_input(update, context, event_id, text)
-    elif state == STATES['WAITING_TIME']:
-        await handle_time_input(update, context, event_id, text)
-    elif state == STATES['WAITING_DESCRIPTION']:
-        await handle_description_input(update, context, event_id, text)
-    elif state == STATES['EDITING']:
+    if state == STATES['EDITING']:
         from callbacks import handle_editing_input
         await handle_editing_input(update, context, user_state, text)
-
-async def handle_theme_input(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, text: str):
-    """Обработка ввода темы"""
-    user_id = update.effective_user.id
-    
-    if not validate_theme(text):
-        await update.message.reply_text(
-            "❌ Тема должна содержать от 3 до 100 символов. Попробуй еще раз:"
-        )
         return
     
-    # Сохраняем тему
-    db.update_event(event_id, theme=text)
-    
-    # Переходим к следующему шагу
-    db.set_user_state(user_id, STATES['WAITING_PLACE'], event_id)
-    
-    await update.message.reply_text(
-        f"✅ Тема сохранена: {text}\n\n"
-        "2️⃣ Где встречаемся?\n\n"
-        "🗺 Лучший вариант: Скопируй ссылку из Google Maps\n"
-        "📝 Альтернатива: Напиши адрес текстом\n"
-        "💡 Совет: Можно написать название места и на следующей строке добавить ссылку\n\n"
-        "Примеры:\n"
-        "• https://maps.google.com/...\n"
-        "• Парк Горького, главный вход\n"
-        "• Кафе 'Пушкин'\nhttps://maps.google.com/...",
-        reply_markup=get_cancel_keyboard()
-    )
-
-async def handle_place_input(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, text: str):
-    """Обработка ввода места"""
-    user_id = update.effective_user.id
-    
-    if not validate_place(text):
-        await update.message.reply_text(
-            "❌ Место должно содержать от 3 до 500 символов. Попробуй еще раз:"
-        )
+    field = wizard.BY_STATE.get(state)
+    if field is None:
         return
     
-    # Сохраняем место
-    db.update_event(event_id, place=text)
-    
-    # Переходим к следующему шагу
-    db.set_user_state(user_id, STATES['WAITING_CONTACT'], event_id)
+    result = wizard.accept(field, text)
+    if result.error:
+        await update.message.reply_text(result.error)
+        return
     
-    await update.message.reply_text(
-        f"✅ Место сохранено: {text}\n\n"
-        "3️⃣ Контакт для связи\n\n"
-        "Оставьте контакт для связи (ваш username в Telegram или номер телефона). "
-        "Он будет виден всем в анонсе.\n\n"
-        "Примеры:\n"
-        "• @username\n"
-        "• +7 900 123-45-67\n"
-        "• Анна, @anna_walk",
-        reply_markup=get_cancel_keyboard()
-    )
+    await complete_step(update, context, field, user_state['event_id'], result.value)
 
-async def handle_contact_input(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, text: str):
-    """Обработка ввода контакта"""
+async def complete_step(update: Update, context: ContextTypes.DEFAULT_TYPE, field, event_id: int, value):
+    """Сохранение значения шага мастера и переход к следующему шагу (или к предпросмотру)"""
     user_id = update.effective_user.id
+    db.update_event(event_id, **{field.column: value})
     
-    if not validate_contact(text):
-        await update.message.reply_text(
-            "❌ Контакт должен содержать от 3 до 100 символов. Попробуй еще раз:"
-        )
+    next_field = wizard.NEXT[field.state]
+    if next_field is None:
+        await show_event_preview(update, context, event_id)
         return
     
-    # Сохраняем контакт
-    db.update_event(event_id, contact=text)
-    
-    # Переходим к следующему шагу
-    db.set_user_state(user_id, STATES['WAITING_TIME'], event_id)
-    
+    drafts.enter(context, user_id, next_field.state, event_id)
+    # Пропущенное поле не подтверждаем - сразу задаем следующий вопрос
     await update.message.reply_text(
-        f"✅ Контакт сохранен: {text}\n\n"
-        "4️⃣ Когда встречаемся?\n\n"
-        "Укажите дату и время события.\n\n"
-        "Примеры:\n"
-        "• 25 декабря, 12:30\n"
-        "• Завтра в 18:00\n"
-        "• Суббота, 15 декабря в 14:00",
-        reply_markup=get_cancel_keyboard()
+        wizard.step_message(next_field, value, saved=field if value is not None else None),
+        reply_markup=next_field.keyboard()
     )
 
-async def handle_time_input(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, text: str):
-    """Обработка ввода времени"""
-    user_id = update.effective_user.id
+async def receive_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Прием фото или изображения-документа: проверка, нормализация и дедупликация.
+    Возвращает file_id для сохранения в событии или None, если изображение отклонено.
+    """
+    message = update.message
+    
+    if message.photo:
+        # Фото уже сжато Telegram, берем наилучшее качество
+        source = message.photo[-1]
+        is_document = False
+    elif message.document and message.document.mime_type and message.document.mime_type.startswith('image/'):
+        source = message.document
+        is_document = True
+    else:
+        return None
     
-    if not validate_time(text):
-        await update.message.reply_text(
-            "❌ Время должно содержать от 3 до 100 символов. Попробуй еще раз:"
+    if source.file_size and source.file_size > MAX_PHOTO_SIZE:
+        await message.reply_text(
+            f"❌ Файл слишком большой (максимум {MAX_PHOTO_SIZE // (1024 * 1024)} МБ). "
+            "Попробуй другое изображение."
         )
-        return
-    
-    # Сохраняем время
-    db.update_event(event_id, event_time=text)
+        return None
+    
+    # Этот файл уже обрабатывался - повторно не скачиваем
+    cached = db.get_cached_photo(source.file_unique_id)
+    if cached:
+        return cached['file_id']
+    
+    try:
+        telegram_file = await source.get_file()
+        data = bytes(await telegram_file.download_as_bytearray())
+        processed = await prepare_photo(get_pipeline(context), data, normalize=is_document)
+    except ImageValidationError as e:
+        await message.reply_text(f"❌ {e}. Попробуй другое изображение.")
+        return None
+    except StageBusy:
+        await message.reply_text("⏳ Сейчас обрабатывается слишком много изображений. Попробуй отправить фото через минуту.")
+        return None
+    except TelegramError as e:
+        logger.error(f"Error downloading photo {source.file_unique_id}: {e}")
+        await message.reply_text("❌ Не удалось загрузить изображение. Попробуй еще раз.")
+        return None
+    
+    duplicate = db.find_photo_by_content(processed['content_hash'])
+    if duplicate:
+        # То же изображение байт в байт уже загружалось - переиспользуем его file_id
+        file_id = duplicate['file_id']
+    elif is_document:
+        # Загружаем нормализованный JPEG один раз, дальше работаем только с file_id
+        sent = await message.reply_photo(
+            photo=processed['jpeg'],
+            caption="🖼 Изображение подготовлено для анонса"
+        )
+        file_id = sent.photo[-1].file_id
+    else:
+        file_id = source.file_id
     
-    # Переходим к следующему шагу
-    db.set_user_state(user_id, STATES['WAITING_PHOTO'], event_id)
+    if not duplicate and db.find_photo_by_hash(processed['phash']):
+        # Совпавший dHash - только похожая картинка (однотонная, тот же шаблон афиши):
+        # фото пользователя не подменяем, лишь отмечаем
+        metrics.counter('media.similar_photos_total').inc()
+        logger.info("Photo %s is similar to an already uploaded one", source.file_unique_id)
     
-    await update.message.reply_text(
-        f"✅ Время сохранено: {text}\n\n"
-        "5️⃣ Супер! Теперь загрузите фото или картинку для анонса. Форматы: .png, .jpeg, .jpg\n"
-        "Если хотите продолжить без изображения, нажмите кнопку «Пропустить»",
-        reply_markup=get_skip_photo_keyboard()
+    db.save_cached_photo(
+        source.file_unique_id, processed['phash'], file_id,
+        processed['width'], processed['height'], processed['content_hash']
     )
+    return file_id
 
 async def handle_photo_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка загрузки фото"""
-    user_id = update.effective_user.id
-    user_state = db.get_user_state(user_id)
+    user_state = drafts.current(context)
     
     if not user_state or user_state['state'] != STATES['WAITING_PHOTO']:
         return
     
-    event_id = user_state['event_id']
-    
-    # Получаем фото наилучшего качества
-    photo = update.message.photo[-1]
-    
-    # Проверяем размер фото (Telegram автоматически ограничивает размер)
-    # Дополнительная проверка не требуется, так как Telegram сжимает фото
+    if update.message.media_group_id:
+        # Части альбома приходят отдельными апдейтами - обрабатываем их разом
+        albums.buffer.add(update, lambda updates: handle_album_input(updates, context))
+        return
     
-    # Сохраняем file_id фото
-    db.update_event(event_id, photo_file_id=photo.file_id)
+    event_id = user_state['event_id']
     
-    # Переходим к описанию
-    db.set_user_state(user_id, STATES['WAITING_DESCRIPTION'], event_id)
+    # Проверяем, обрабатываем и дедуплицируем изображение
+    file_id = await receive_photo(update, context)
+    if not file_id:
+        return
     
-    await update.message.reply_text(
-        "✅ Фото сохранено!\n\n"
-        "6️⃣ Добавьте короткое описание прогулки\n"
-        "Расскажите, что планируете делать, что взять с собой (максимум 500 символов):",
-        reply_markup=get_cancel_keyboard()
-    )
+    await complete_step(update, context, wizard.BY_STATE[STATES['WAITING_PHOTO']], event_id, file_id)
 
-async def handle_description_input(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int, text: str):
-    """Обработка ввода описания"""
-    user_id = update.effective_user.id
-    
-    if text == "/skip":
-        description = None
-    else:
-        if not validate_description(text):
-            await update.message.reply_text(
-                f"❌ Ваше описание слишком длинное ({len(text)}/500 символов). Пожалуйста, сократите его и отправьте снова."
-            )
-            return
-        description = text
+async def receive_album(updates: list, context: ContextTypes.DEFAULT_TYPE) -> list:
+    """Прием фото альбома; возвращает file_id принятых фото по порядку (без повторов)"""
+    received = await asyncio.gather(*(receive_photo(update, context) for update in updates))
+    file_ids = []
+    for file_id in received:
+        if file_id and file_id not in file_ids:
+            file_ids.append(file_id)
+    return file_ids
+
+async def handle_album_input(updates: list, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка альбома на шаге фото мастера"""
+    update = updates[0]
+    user_state = drafts.current(context)
+    if not user_state or user_state['state'] != STATES['WAITING_PHOTO']:
+        return
     
-    # Сохраняем описание
-    db.update_event(event_id, description=description)
+    event_id = user_state['event_id']
+    file_ids = await receive_album(updates, context)
+    if not file_ids:
+        return
     
-    # Показываем предпросмотр
-    await show_event_preview(update, context, event_id)
+    # Весь альбом - одной транзакцией; первое фото - обложка анонса
+    db.set_event_photos(event_id, file_ids)
+    await complete_step(update, context, wizard.BY_STATE[STATES['WAITING_PHOTO']], event_id, file_ids[0])
 
-async def show_event_preview(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int):
-    """Показ предпросмотра события"""
+async def show_event_preview(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int,
+                             edit_data: dict = None, notice: str = None):
+    """
+    Показ предпросмотра события.
+    
+    Если в edit_data передан ID уже показанного предпросмотра, сообщение
+    обновляется на месте одним вызовом API вместо отправки нового.
+    """
     user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
     event = db.get_event(event_id)
     
     if not event:
         await update.message.reply_text("❌ Событие не найдено")
         return
     
-    # Очищаем состояние
-    db.set_user_state(user_id, STATES['PREVIEW'], event_id)
-    
     # Формируем предпросмотр
-    preview_text = "🎯 <b>ПРЕДПРОСМОТР АНОНСА</b>\n\n" + format_event_announcement(event)
-    
-    if event['photo_file_id']:
-        await update.message.reply_photo(
-            photo=event['photo_file_id'],
-            caption=preview_text,
-            parse_mode='HTML',
-            reply_markup=get_preview_keyboard(event_id)
-        )
-    else:
-        await update.message.reply_text(
-            preview_text,
-            parse_mode='HTML',
-            reply_markup=get_preview_keyboard(event_id)
-        )
+    preview_text = "🎯 <b>ПРЕДПРОСМОТР АНОНСА</b>\n\n" + await render(context, format_event_announcement, event)
+    if notice:
+        preview_text = f"{notice}\n\n{preview_text}"
+    keyboard = get_preview_keyboard(event_id)
+    # К альбому нельзя прикрепить кнопки: предпросмотр - текст под альбомом
+    album = db.get_event_photos(event_id)
+    photo = None if album else event['photo_file_id']
+    
+    message = None
+    edit_data = edit_data or {}
+    if edit_data.get('preview_message_id'):
+        if album and edit_data.get('field') == 'photo':
+            # Новый альбом показывается над новым предпросмотром
+            await _delete_preview(context, chat_id, edit_data['preview_message_id'])
+        else:
+            message = await _edit_preview_in_place(
+                context, chat_id, edit_data, photo, preview_text, keyboard
+            )
+    
+    if message is None:
+        if album:
+            await albums.send_album(context.bot, chat_id, album, 'preview')
+        if photo:
+            message = await send_photo(
+                context.bot, chat_id, photo, 'preview',
+                caption=preview_text,
+                parse_mode='HTML',
+                reply_markup=keyboard
+            )
+        else:
+            message = await context.bot.send_message(
+                chat_id=chat_id,
+                text=preview_text,
+                parse_mode='HTML',
+                reply_markup=keyboard
+            )
+    
+    # Запоминаем сообщение предпросмотра, чтобы следующие правки обновляли его на месте
+    preview_data = {
+        'preview_message_id': message.message_id if message is not True else edit_data['preview_message_id'],
+        'preview_photo': photo
+    }
+    drafts.enter(context, user_id, STATES['PREVIEW'], event_id, preview_data)
+
+async def _delete_preview(context, chat_id, message_id: int):
+    try:
+        await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+    except TelegramError as e:
+        logger.warning(f"Could not delete preview {message_id} in chat {chat_id}: {e}")
+
+async def _edit_preview_in_place(context, chat_id, edit_data: dict, new_photo, preview_text: str, keyboard):
+    """
+    Обновление существующего предпросмотра. Возвращает сообщение (или True)
+    либо None, если сообщение нельзя отредактировать и нужно отправить новое.
+    """
+    message_id = edit_data['preview_message_id']
+    old_photo = edit_data.get('preview_photo')
+    
+    try:
+        if old_photo and new_photo:
+            if old_photo == new_photo:
+                return await context.bot.edit_message_caption(
+                    chat_id=chat_id, message_id=message_id,
+                    caption=preview_text, parse_mode='HTML', reply_markup=keyboard
+                )
+            return await edit_photo(
+                context.bot, chat_id, message_id, new_photo, 'preview',
+                caption=preview_text, parse_mode='HTML', reply_markup=keyboard
+            )
+        if not old_photo and not new_photo:
+            return await context.bot.edit_message_text(
+                chat_id=chat_id, message_id=message_id,
+                text=preview_text, parse_mode='HTML', reply_markup=keyboard
+            )
+        
+        # Текстовое сообщение нельзя превратить в фото и наоборот - заменяем его
+        await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+        return None
+    
+    except BadRequest as e:
+        if 'not modified' in str(e).lower():
+            return True
+        # Сообщение удалено или слишком старое - отправим новый предпросмотр
+        logger.warning(f"Could not edit preview {message_id} in chat {chat_id}: {e}")
+        return None
 
 async def handle_invalid_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка неподходящих типов медиа при загрузке фото"""
-    user_id = update.effective_user.id
-    user_state = db.get_user_state(user_id)
+    user_state = drafts.current(context)
     
     # Проверяем, ожидает ли бот фото
     if user_state and user_state['state'] == STATES['WAITING_PHOTO']:
@@ -331,12 +606,8 @@ async def handle_invalid_media(update: Update, context: ContextTypes.DEFAULT_TYP
         elif update.message.sticker:
             media_type = "стикер"
         elif update.message.document:
-            # Проверяем, не является ли документ изображением
-            doc = update.message.document
-            if doc.mime_type and doc.mime_type.startswith('image/'):
-                media_type = "документ-изображение (отправьте как фото, а не документ)"
-            else:
-                media_type = "документ"
+            # Изображения-документы принимаются отдельным обработчиком
+            media_type = "документ"
         elif update.message.animation:
             media_type = "GIF"
         elif update.message.voice:
@@ -348,7 +619,7 @@ async def handle_invalid_media(update: Update, context: ContextTypes.DEFAULT_TYP
         
         await update.message.reply_text(
             f"❌ Пожалуйста, отправьте именно фото (не {media_type}).\n\n"
-            "Поддерживаемые форматы: .png, .jpeg, .jpg",
+            "Поддерживаемые форматы: .png, .jpeg, .jpg (можно как фото или как файл)",
             reply_markup=get_skip_photo_keyboard()
         )
     elif user_state and user_state['state'] == STATES['EDITING']:
@@ -361,8 +632,20 @@ async def handle_invalid_media(update: Update, context: ContextTypes.DEFAULT_TYP
             )
 
 async def show_user_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показ событий пользователя"""
+    """Показ анонсов пользователя с кнопками правки и снятия с публикации"""
+    tenant_id = tenants.current_id(context)
+    events = db.get_user_announcements(update.effective_user.id, limit=USER_EVENTS_LIMIT, tenant_id=tenant_id)
+    if not events:
+        await update.message.reply_text(
+            "📋 У тебя пока нет опубликованных анонсов.\n"
+            "Нажми «📣 Пригласить на прогулку», чтобы создать первый!",
+            reply_markup=get_main_menu_keyboard()
+        )
+        return
+    
     await update.message.reply_text(
-        "📋 В разработке...\n"
-        "Скоро здесь будет список твоих анонсов!"
+        format_user_announcements(events, tenants.registry.channel(tenant_id)),
+        parse_mode='HTML',
+        disable_web_page_preview=True,
+        reply_markup=get_user_events_keyboard(events)
     ) 
\ No newline at end of file
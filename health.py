@@ -6,6 +6,8 @@ import threading
 import json
 import logging
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
 class HealthHandler(BaseHTTPRequestHandler):
@@ -22,6 +24,11 @@ class HealthHandler(BaseHTTPRequestHandler):
             }
             
             self.wfile.write(json.dumps(response).encode())
+        elif self.path == '/metrics':
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(metrics.snapshot()).encode())
         else:
             self.send_response(404)
             self.end_headers()
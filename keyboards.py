@@ -4,6 +4,7 @@ def get_main_menu_keyboard():
     """Главное меню бота"""
     keyboard = [
         [KeyboardButton("📣 Пригласить на прогулку")],
+        [KeyboardButton("📍 Прогулки рядом", request_location=True)],
         [KeyboardButton("📋 Мои анонсы"), KeyboardButton("ℹ️ Помощь")]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
@@ -30,12 +31,17 @@ def get_preview_keyboard(event_id: int):
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_admin_moderation_keyboard(event_id: int):
-    """Клавиатура для модерации администратором"""
+def get_admin_moderation_keyboard(event_id: int, claimed_by: str = None):
+    """Клавиатура для модерации администратором (claimed_by - кто рассматривает анонс)"""
     keyboard = [
         [
             InlineKeyboardButton("✅ Опубликовать", callback_data=f"approve_{event_id}"),
             InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_{event_id}")
+        ],
+        [
+            InlineKeyboardButton(
+                f"👀 Рассматривает {claimed_by}" if claimed_by else "👀 Беру", callback_data=f"claim_{event_id}"
+            )
         ]
     ]
     return InlineKeyboardMarkup(keyboard)
@@ -52,4 +58,72 @@ def get_cancel_keyboard():
     keyboard = [
         [InlineKeyboardButton("❌ Отменить создание", callback_data="cancel_creation")]
     ]
-    return InlineKeyboardMarkup(keyboard) 
\ No newline at end of file
+    return InlineKeyboardMarkup(keyboard)
+
+def get_search_keyboard(page: int, has_next: bool):
+    """Клавиатура для листания результатов поиска"""
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"search_page_{page - 1}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("Вперед ▶️", callback_data=f"search_page_{page + 1}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+def get_user_events_keyboard(events):
+    """Кнопки правки и снятия с публикации для опубликованных анонсов автора"""
+    keyboard = []
+    for number, event in enumerate(events, start=1):
+        if event['status'] != 'published':
+            continue
+        keyboard.append([
+            InlineKeyboardButton(f"✏️ Изменить {number}", callback_data=f"revise_{event['id']}"),
+            InlineKeyboardButton(f"🗑 Снять {number}", callback_data=f"unpublish_{event['id']}")
+        ])
+    return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+def get_unpublish_confirm_keyboard(event_id: int):
+    """Подтверждение снятия анонса с публикации"""
+    keyboard = [
+        [
+            InlineKeyboardButton("🗑 Да, снять", callback_data=f"unpublish_confirm_{event_id}"),
+            InlineKeyboardButton("↩️ Оставить", callback_data="unpublish_keep")
+        ]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def get_subscriptions_keyboard(subscriptions):
+    """Кнопки отписки"""
+    keyboard = [
+        [InlineKeyboardButton(f"🔕 Отписаться {number}", callback_data=f"unsubscribe_{subscription['id']}")]
+        for number, subscription in enumerate(subscriptions, start=1)
+    ]
+    return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+def get_area_subscription_keyboard(lat: float, lng: float):
+    """Подписка на новые прогулки рядом с отправленной точкой"""
+    keyboard = [
+        [InlineKeyboardButton("🔔 Подписаться на район", callback_data=f"subscribe_area_{lat:.4f}_{lng:.4f}")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def get_rsvp_keyboard(event_id: int, counts=None):
+    """Кнопки «Иду» / «Может быть» под постом в канале со счетчиками"""
+    counts = counts or {}
+    def label(text, status):
+        return f"{text} · {counts[status]}" if counts.get(status) else text
+    keyboard = [
+        [
+            InlineKeyboardButton(label("🙋 Иду", 'going'), callback_data=f"rsvp_going_{event_id}"),
+            InlineKeyboardButton(label("🤔 Может быть", 'maybe'), callback_data=f"rsvp_maybe_{event_id}")
+        ]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def get_tenants_keyboard(tenants, selected_id: int = None):
+    """Выбор сообщества (города)"""
+    keyboard = [
+        [InlineKeyboardButton(f"{'✅ ' if tenant.id == selected_id else ''}{tenant.title}",
+                              callback_data=f"tenant_{tenant.id}")]
+        for tenant in tenants
+    ]
+    return InlineKeyboardMarkup(keyboard)
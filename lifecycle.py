@@ -0,0 +1,312 @@
+"""
+Жизненный цикл опубликованных анонсов: правки после публикации, снятие
+с публикации автором и архивирование прошедших прогулок.
+
+Правка - это копия анонса (строка events с revision_of), которую автор меняет
+в обычном предпросмотре и отправляет на модерацию. Администратор видит только
+изменившиеся поля; одобренные изменения переносятся в исходный анонс,
+а пост в канале редактируется на месте.
+
+Прошедшие анонсы (expires_at в прошлом) архивируются фоновой задачей порциями,
+с паузой между правками постов, чтобы не упереться в лимиты Telegram на канал.
+
+Пост дайджеста (digest.py) может содержать несколько анонсов: такой пост
+не удаляется и не заменяется, а перерисовывается целиком.
+
+Правка поста без reply_markup убирает кнопки «Иду» / «Может быть» (rsvp.py):
+у архивных и снятых анонсов так и задумано, а при правке анонса кнопки
+передаются заново.
+
+Пост с альбомом (albums.py) - несколько сообщений, текст анонса в подписи
+первого. При правке без смены фото меняется только подпись; новый альбом
+публикуется новым постом, а старый снимается целиком.
+
+Пост живет в канале сообщества анонса (tenants.py), поэтому функции правки
+постов получают канал явно или берут его по tenant_id анонса.
+"""
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config import ARCHIVE_BATCH_SIZE, CHANNEL_EDIT_INTERVAL, DIGEST_MODE
+from utils import format_event_announcement, format_digest
+from media import send_photo, edit_photo
+from albums import send_album
+import eventtime
+from eventtime import order_by_time
+import metrics
+import rsvp
+import tenants
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые автор может менять в опубликованном анонсе
+REVISION_FIELDS = ('theme', 'place', 'contact', 'event_time', 'photo_file_id', 'description')
+
+ARCHIVED_HEADER = "⌛ <b>Прогулка уже прошла</b>"
+UNPUBLISHED_HEADER = "🚫 <b>Прогулка отменена автором</b>"
+REPLACED_HEADER = "♻️ <b>Анонс обновлен</b> - актуальная версия опубликована ниже"
+
+def revision_changes(original: Dict[str, Any], revision: Dict[str, Any],
+                     albums: Tuple[List[str], List[str]] = None) -> Dict[str, Any]:
+    """Поля правки, отличающиеся от опубликованного анонса; albums - (альбом анонса, альбом правки)"""
+    changes = {
+        field: revision.get(field) for field in REVISION_FIELDS
+        if revision.get(field) != original.get(field)
+    }
+    if albums is not None and albums[0] != albums[1]:
+        # Другой альбом с той же обложкой - тоже смена фото
+        changes['photo_file_id'] = revision.get('photo_file_id')
+    return changes
+
+def _is_not_modified(error: BadRequest) -> bool:
+    return 'not modified' in str(error).lower()
+
+async def _with_retry(call):
+    """Вызов Bot API с одним повтором после RetryAfter"""
+    try:
+        return await call()
+    except RetryAfter as e:
+        logger.warning(f"Channel edit throttled by Telegram, retrying in {e.retry_after}s")
+        await asyncio.sleep(e.retry_after)
+        return await call()
+
+async def edit_channel_post(bot, channel_id, message_id: int, old_photo: Optional[str], new_photo: Optional[str],
+                            text: str, reply_markup=None) -> int:
+    """
+    Замена содержимого поста в канале. Возвращает ID поста с актуальной версией:
+    текстовый пост нельзя превратить в фото и наоборот, в этом случае публикуется
+    новый пост, а старый удаляется (или помечается, если удалить уже нельзя).
+    """
+    try:
+        if old_photo and new_photo:
+            if old_photo == new_photo:
+                await _with_retry(lambda: bot.edit_message_caption(
+                    chat_id=channel_id, message_id=message_id, caption=text, parse_mode='HTML',
+                    reply_markup=reply_markup
+                ))
+            else:
+                await _with_retry(lambda: edit_photo(
+                    bot, channel_id, message_id, new_photo, 'channel', caption=text, parse_mode='HTML',
+                    reply_markup=reply_markup
+                ))
+            return message_id
+        if not old_photo and not new_photo:
+            await _with_retry(lambda: bot.edit_message_text(
+                chat_id=channel_id, message_id=message_id, text=text, parse_mode='HTML',
+                reply_markup=reply_markup
+            ))
+            return message_id
+    except BadRequest as e:
+        if _is_not_modified(e):
+            return message_id
+        raise
+
+    if new_photo:
+        message = await send_photo(
+            bot, channel_id, new_photo, 'channel', caption=text, parse_mode='HTML', reply_markup=reply_markup
+        )
+    else:
+        message = await bot.send_message(chat_id=channel_id, text=text, parse_mode='HTML', reply_markup=reply_markup)
+    await remove_channel_post(bot, channel_id, message_id, bool(old_photo), REPLACED_HEADER)
+    return message.message_id
+
+async def send_channel_post(bot, channel_id, photo: Optional[str], album: List[str], text: str,
+                            reply_markup=None) -> List[int]:
+    """
+    Публикация поста анонса в канал. Возвращает ID сообщений поста: у альбома -
+    по сообщению на фото (текст - подпись первого, кнопок у альбома не бывает).
+    """
+    if album:
+        messages = await send_album(bot, channel_id, album, 'channel', caption=text, parse_mode='HTML')
+        return [message.message_id for message in messages]
+    if photo:
+        message = await send_photo(
+            bot, channel_id, photo, 'channel', caption=text, parse_mode='HTML', reply_markup=reply_markup
+        )
+    else:
+        message = await bot.send_message(chat_id=channel_id, text=text, parse_mode='HTML', reply_markup=reply_markup)
+    return [message.message_id]
+
+async def edit_album_post(bot, database, original: Dict[str, Any], updated: Dict[str, Any],
+                          old_album: List[str], album: List[str], text: str, reply_markup=None) -> int:
+    """
+    Правка поста анонса, у которого был или стал альбом. Возвращает ID поста:
+    при смене фото пост публикуется заново (альбом нельзя заменить на месте).
+    """
+    channel_id = tenants.registry.channel_of(original)
+    message_id = original['channel_message_id']
+    if album == old_album:
+        try:
+            await _with_retry(lambda: bot.edit_message_caption(
+                chat_id=channel_id, message_id=message_id, caption=text, parse_mode='HTML'
+            ))
+        except BadRequest as e:
+            if not _is_not_modified(e):
+                raise
+        return message_id
+
+    stale = database.get_album_messages(original['id'])
+    message_ids = await send_channel_post(bot, channel_id, updated['photo_file_id'], album, text, reply_markup)
+    database.set_event_photos(original['id'], album)
+    if album:
+        database.set_album_messages(original['id'], message_ids)
+    await remove_album_messages(bot, channel_id, stale)
+    await remove_channel_post(bot, channel_id, message_id, bool(original['photo_file_id']), REPLACED_HEADER)
+    return message_ids[0]
+
+async def remove_album_messages(bot, channel_id, message_ids: List[int]):
+    """Удаление остальных фото альбома (подпись с текстом - у первого, он снимается отдельно)"""
+    for message_id in message_ids:
+        try:
+            await _with_retry(lambda: bot.delete_message(chat_id=channel_id, message_id=message_id))
+        except TelegramError as e:
+            # Старше 48 часов - остается под помеченной подписью первого фото
+            logger.info(f"Could not delete album message {message_id}: {e}")
+
+async def mark_channel_post(bot, event: Dict[str, Any], header: str):
+    """Пометка поста анонса заголовком (архив, отмена); пост остается в канале"""
+    message_id = event.get('channel_message_id')
+    if not message_id:
+        return
+    text = f"{header}\n\n{format_event_announcement(event)}"
+    await _mark(bot, tenants.registry.channel_of(event), message_id, bool(event.get('photo_file_id')), text)
+
+async def _mark(bot, channel_id, message_id: int, has_photo: bool, text: str):
+    try:
+        if has_photo:
+            await _with_retry(lambda: bot.edit_message_caption(
+                chat_id=channel_id, message_id=message_id, caption=text, parse_mode='HTML'
+            ))
+        else:
+            await _with_retry(lambda: bot.edit_message_text(
+                chat_id=channel_id, message_id=message_id, text=text, parse_mode='HTML'
+            ))
+    except BadRequest as e:
+        # Пост удален из канала вручную или уже помечен - помечать нечего
+        if not _is_not_modified(e):
+            logger.warning(f"Could not mark channel post {message_id}: {e}")
+
+async def refresh_shared_post(bot, database, event: Dict[str, Any], replace: Dict[str, Any] = None) -> bool:
+    """
+    Перерисовка поста дайджеста, в котором опубликован анонс event (replace - новая
+    версия одного из анонсов поста). Возвращает False, если пост принадлежит одному анонсу.
+    """
+    message_id = event['channel_message_id']
+    if not message_id:
+        return False
+    events = database.get_events_by_channel_message(message_id, event['tenant_id'])
+    if len(events) < 2:
+        return False
+    if replace is not None:
+        events = order_by_time([replace if event['id'] == replace['id'] else event for event in events])
+    channel_id = tenants.registry.channel_of(event)
+    try:
+        await _with_retry(lambda: bot.edit_message_text(
+            chat_id=channel_id, message_id=message_id, text=format_digest(events), parse_mode='HTML'
+        ))
+    except BadRequest as e:
+        if not _is_not_modified(e):
+            logger.warning(f"Could not refresh digest post {message_id}: {e}")
+    return True
+
+async def unpublish_post(bot, database, event: Dict[str, Any]):
+    """Снятие анонса из канала (статус события уже изменен)"""
+    rsvp.board.close(event['id'])
+    database.cancel_reminders(event['id'])
+    if not await refresh_shared_post(bot, database, event):
+        channel_id = tenants.registry.channel_of(event)
+        await remove_album_messages(bot, channel_id, database.get_album_messages(event['id']))
+        await remove_channel_post(
+            bot, channel_id, event['channel_message_id'], bool(event['photo_file_id']), UNPUBLISHED_HEADER
+        )
+
+async def remove_channel_post(bot, channel_id, message_id: int, has_photo: bool, header: str):
+    """Удаление поста из канала; старые посты (старше 48 часов) вместо этого помечаются"""
+    if not message_id:
+        return
+    try:
+        await bot.delete_message(chat_id=channel_id, message_id=message_id)
+    except TelegramError as e:
+        logger.info(f"Could not delete channel post {message_id} ({e}), marking it instead")
+        await _mark(bot, channel_id, message_id, has_photo, header)
+
+async def apply_revision(bot, database, revision: Dict[str, Any], render) -> Optional[Dict[str, Any]]:
+    """
+    Перенос одобренной правки в опубликованный анонс и обновление поста в канале.
+    render(func, event) - рендеринг анонса. Возвращает обновленный анонс или None,
+    если исходный анонс уже не опубликован.
+    """
+    original = database.get_event(revision['revision_of'])
+    if not original or original['status'] != 'published':
+        return None
+
+    old_album, album = database.get_event_photos(original['id']), database.get_event_photos(revision['id'])
+    changes = revision_changes(original, revision, (old_album, album))
+    if 'event_time' in changes:
+        # Время начала разобрано при вводе правки - не пересчитываем "завтра" от текущего момента
+        changes['starts_at'] = revision['starts_at']
+        changes['expires_at'] = eventtime.expires_at(revision['starts_at'], time.time())
+    updated = dict(original, **changes)
+
+    # Сначала пост: если Telegram откажет, анонс в БД останется прежним.
+    # В общем текстовом посте дайджеста фото не показывается - меняется только текст
+    channel_message_id = original['channel_message_id']
+    if not await refresh_shared_post(bot, database, original, replace=updated):
+        text = await render(format_event_announcement, updated)
+        # В альбоме дайджеста кнопок нет и быть не может
+        reply_markup = None if DIGEST_MODE else rsvp.board.keyboard(database, original['id'])
+        if old_album or album:
+            channel_message_id = await edit_album_post(
+                bot, database, original, updated, old_album, album, text, reply_markup
+            )
+        else:
+            channel_message_id = await edit_channel_post(
+                bot, tenants.registry.channel_of(original), channel_message_id,
+                original['photo_file_id'], updated['photo_file_id'], text, reply_markup
+            )
+    if channel_message_id != original['channel_message_id']:
+        changes['channel_message_id'] = updated['channel_message_id'] = channel_message_id
+
+    database.update_event(original['id'], **changes)
+    if 'starts_at' in changes and rsvp.REMIND_BEFORE is not None:
+        database.reschedule_reminders(original['id'], changes['starts_at'], rsvp.REMIND_BEFORE)
+    metrics.counter('lifecycle.revisions_applied_total').inc()
+    return updated
+
+async def archive_expired(bot, database, now: float = None, batch_size: int = ARCHIVE_BATCH_SIZE,
+                          pause: float = CHANNEL_EDIT_INTERVAL) -> int:
+    """Архивирование прошедших анонсов порциями; возвращает число архивированных"""
+    loop = asyncio.get_running_loop()
+    archived = 0
+    while True:
+        events = await loop.run_in_executor(None, database.get_expired_events, now or time.time(), batch_size)
+        for event in events:
+            # В режиме кластера тот же анонс может архивировать другой воркер
+            claimed = await loop.run_in_executor(
+                None, database.transition_event_status, event['id'], 'published', 'archived'
+            )
+            if not claimed:
+                continue
+            rsvp.board.close(event['id'])
+            if not await refresh_shared_post(bot, database, event):
+                await mark_channel_post(bot, event, ARCHIVED_HEADER)
+            metrics.counter('lifecycle.archived_total').inc()
+            archived += 1
+            await asyncio.sleep(pause)
+        if len(events) < batch_size:
+            return archived
+
+async def run_archiver(bot, database, interval: float):
+    """Фоновое архивирование прошедших анонсов каждые interval секунд"""
+    while True:
+        try:
+            archived = await archive_expired(bot, database)
+            if archived:
+                logger.info(f"✅ В архив перенесено анонсов: {archived}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка архивирования анонсов: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,140 @@
+"""
+Логирование без задержек для event loop: обработчики только кладут записи
+в очередь (QueueHandler), а оформление (JSON/текст) и вывод в stderr выполняет
+отдельный поток (QueueListener).
+
+- LOG_FORMAT=json - одна JSON-строка на запись с update_id и user_id апдейта,
+  в контексте которого она сделана; LOG_FORMAT=text - прежний текстовый формат.
+- Для logger.info("... %s", value) строка собирается только если запись прошла
+  фильтры, но в вызывающем потоке: аргументы (словари, списки, строки БД)
+  попадают в лог такими, какими были в момент вызова.
+- INFO/DEBUG шумных модулей (LOG_SAMPLED_LOGGERS) пишутся выборочно с долей
+  LOG_SAMPLE_RATE. Решение принимается для апдейта целиком, поэтому
+  в лог попадает либо вся цепочка обработки апдейта, либо ничего.
+  WARNING и выше пишутся всегда.
+"""
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_SAMPLED_LOGGERS
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Апдейт, который обрабатывает текущая задача asyncio
+_update_id = contextvars.ContextVar('update_id', default=None)
+_user_id = contextvars.ContextVar('user_id', default=None)
+
+_listener: Optional[QueueListener] = None
+
+def bind_update(update) -> None:
+    """Привязка ID апдейта и пользователя к записям лога текущей задачи"""
+    _update_id.set(getattr(update, 'update_id', None))
+    user = getattr(update, 'effective_user', None)
+    _user_id.set(user.id if user else None)
+
+async def bind_update_handler(update, context):
+    """Обработчик в группе -1: выполняется до остальных обработчиков апдейта"""
+    bind_update(update)
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи update_id и user_id и прореживает INFO/DEBUG шумных модулей"""
+
+    def __init__(self, sample_rate: float = 1.0, sampled_loggers=()):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.sampled_loggers = frozenset(sampled_loggers)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        update_id = record.update_id = _update_id.get()
+        record.user_id = _user_id.get()
+        if (self.sample_rate >= 1 or record.levelno >= logging.WARNING
+                or record.name not in self.sampled_loggers):
+            return True
+        if update_id is None:
+            return random.random() < self.sample_rate
+        # Мультипликативный хеш: одинаковое решение для всех записей одного апдейта
+        return (update_id * 2654435761 & 0xFFFFFFFF) < self.sample_rate * 0x100000000
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной JSON-строкой"""
+
+    def __init__(self, worker: Optional[int] = None):
+        super().__init__()
+        self.worker = worker
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if self.worker is not None:
+            entry['worker'] = self.worker
+        for field in ('update_id', 'user_id'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class SnapshotQueueHandler(QueueHandler):
+    """
+    QueueHandler, который, как стандартный, подставляет аргументы в сообщение
+    до постановки в очередь: иначе изменяемые аргументы выводились бы в состоянии
+    на момент вывода, а не вызова. В отличие от стандартного prepare() текст
+    исключения не вклеивается в сообщение, а сохраняется в exc_text -
+    JsonFormatter выводит его отдельным полем.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXCEPTIONS.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+# Форматирование traceback в вызывающем потоке (стек к моменту вывода может быть уже другим)
+_EXCEPTIONS = logging.Formatter()
+
+def setup_logging(worker: Optional[int] = None, stream=None) -> QueueListener:
+    """Настройка корневого логгера; повторные вызовы в том же процессе ничего не меняют"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if LOG_FORMAT == 'text':
+        prefix = f'worker{worker} - ' if worker is not None else ''
+        output.setFormatter(logging.Formatter(TEXT_FORMAT.replace('%(name)s', prefix + '%(name)s')))
+    else:
+        output.setFormatter(JsonFormatter(worker))
+
+    records = queue.SimpleQueue()
+    handler = SnapshotQueueHandler(records)
+    handler.addFilter(ContextFilter(LOG_SAMPLE_RATE, LOG_SAMPLED_LOGGERS))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(records, output)
+    _listener.start()
+    # Перед выходом поток вывода дописывает оставшиеся в очереди записи
+    atexit.register(_listener.stop)
+    return _listener
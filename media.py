@@ -0,0 +1,218 @@
+"""
+Обработка фотографий для анонсов: проверка, нормализация, дедупликация
+и повторное использование file_id при отправке.
+
+Тяжелая работа с Pillow выполняется в стадии 'images' пайплайна (pipeline.py),
+чтобы не блокировать event loop. Между процессами передаются только байты и словари.
+"""
+import io
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
+import metrics
+from config import MAX_PHOTO_SIZE, MIN_PHOTO_SIDE, PHOTO_MAX_SIDE, PHOTO_JPEG_QUALITY
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Telegram для sendPhoto
+TELEGRAM_MAX_DIMENSIONS_SUM = 10000
+TELEGRAM_MAX_ASPECT_RATIO = 20
+
+class ImageValidationError(ValueError):
+    """Изображение не подходит для анонса (сообщение показывается пользователю)"""
+
+def _dhash(image, hash_size: int = 8) -> str:
+    """Перцептивный хеш (dHash): устойчив к пережатию и изменению размера"""
+    small = image.convert('L').resize((hash_size + 1, hash_size))
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f'{bits:0{hash_size * hash_size // 4}x}'
+
+def process_image(data: bytes, normalize: bool = True) -> Dict[str, Any]:
+    """
+    Проверка и нормализация изображения (выполняется в дочернем процессе).
+
+    Возвращает словарь с размерами, перцептивным хешем (phash - для поиска похожих),
+    хешем содержимого (content_hash - sha256 JPEG-версии или исходных байтов; file_id
+    переиспользуется только при его совпадении) и, если normalize=True, JPEG-версией,
+    пригодной для отправки в канал.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    if len(data) > MAX_PHOTO_SIZE:
+        raise ImageValidationError(
+            f"Файл слишком большой (максимум {MAX_PHOTO_SIZE // (1024 * 1024)} МБ)"
+        )
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError):
+        raise ImageValidationError("Не удалось прочитать изображение")
+    except Image.DecompressionBombError:
+        # Маленький сжатый файл с огромным числом пикселей: лимит по байтам его пропускает
+        raise ImageValidationError("Изображение слишком большое по размерам")
+
+    image = ImageOps.exif_transpose(image)
+    width, height = image.size
+
+    if min(width, height) < MIN_PHOTO_SIDE:
+        raise ImageValidationError(
+            f"Изображение слишком маленькое ({width}×{height}), нужно минимум {MIN_PHOTO_SIDE} пикселей по каждой стороне"
+        )
+    if max(width, height) / min(width, height) > TELEGRAM_MAX_ASPECT_RATIO:
+        raise ImageValidationError("Изображение слишком вытянутое")
+
+    result = {
+        'width': width, 'height': height, 'phash': _dhash(image),
+        'content_hash': hashlib.sha256(data).hexdigest(), 'jpeg': None
+    }
+
+    if normalize:
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            # Прозрачность кладем на белый фон
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        if max(width, height) > PHOTO_MAX_SIDE or width + height > TELEGRAM_MAX_DIMENSIONS_SUM:
+            image.thumbnail((PHOTO_MAX_SIDE, PHOTO_MAX_SIDE), Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=PHOTO_JPEG_QUALITY, optimize=True, progressive=True)
+        result['jpeg'] = output.getvalue()
+        result['content_hash'] = hashlib.sha256(result['jpeg']).hexdigest()
+        result['width'], result['height'] = image.size
+
+    return result
+
+async def prepare_photo(pipeline, data: bytes, normalize: bool = True) -> Dict[str, Any]:
+    """Асинхронная обработка изображения в стадии 'images' пайплайна (вне event loop)"""
+    return await pipeline.run('images', process_image, data, normalize)
+
+class MediaRegistry:
+    """
+    Реестр file_id, которые Telegram вернул при отправке фото в разные чаты.
+
+    Ключ - file_id, сохраненный в событии. Для каждого чата запоминается
+    file_id из ответа на отправку, а также последний полученный от сервера
+    file_id, который подходит для чатов, куда фото еще не отправлялось.
+    """
+
+    ANY_CHAT = '*'
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+
+    def resolve(self, file_id: str, chat_id) -> str:
+        """Лучший известный file_id для отправки в чат"""
+        entry = self._entries.get(file_id)
+        if not entry:
+            return file_id
+        self._entries.move_to_end(file_id)
+        return entry.get(str(chat_id)) or entry.get(self.ANY_CHAT) or file_id
+
+    def record(self, file_id: str, chat_id, message):
+        """Запоминание file_id из результата отправки"""
+        if not message or not getattr(message, 'photo', None):
+            return
+        returned = message.photo[-1].file_id
+        entry = self._entries.setdefault(file_id, {})
+        entry[str(chat_id)] = returned
+        entry[self.ANY_CHAT] = returned
+        self._entries.move_to_end(file_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def forget(self, file_id: str):
+        self._entries.pop(file_id, None)
+
+registry = MediaRegistry()
+
+async def send_photo(bot, chat_id, photo_file_id: str, destination: str, **kwargs):
+    """
+    Отправка фото с переиспользованием file_id из реестра и замером задержки.
+    destination - вид отправки для метрик: preview, moderation, channel.
+    """
+    file_id = registry.resolve(photo_file_id, chat_id)
+    if file_id != photo_file_id:
+        metrics.counter('photo_file_id_reused_total').inc()
+
+    start = time.perf_counter()
+    try:
+        message = await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+    except BadRequest:
+        if file_id == photo_file_id:
+            raise
+        # Сохраненный в реестре file_id стал недействительным - отправляем исходный
+        logger.warning(f"Cached file_id rejected for chat {chat_id}, falling back to original")
+        registry.forget(photo_file_id)
+        message = await bot.send_photo(chat_id=chat_id, photo=photo_file_id, **kwargs)
+    finally:
+        metrics.histogram(f'photo_send_seconds.{destination}').observe(time.perf_counter() - start)
+
+    registry.record(photo_file_id, chat_id, message)
+    return message
+
+async def send_photo_group(bot, chat_id, items: List[Tuple[str, str]], destination: str,
+                           parse_mode: str = None):
+    """
+    Отправка альбома (send_media_group) из пар (file_id, подпись) с учетом реестра.
+    Возвращает сообщения альбома в порядке items.
+    """
+    def media(resolve: bool):
+        return [
+            InputMediaPhoto(
+                media=registry.resolve(file_id, chat_id) if resolve else file_id,
+                caption=caption, parse_mode=parse_mode
+            )
+            for file_id, caption in items
+        ]
+
+    start = time.perf_counter()
+    try:
+        messages = await bot.send_media_group(chat_id=chat_id, media=media(resolve=True))
+    except BadRequest:
+        # Какой-то из сохраненных file_id стал недействительным - отправляем исходные
+        logger.warning(f"Cached file_id rejected in media group for chat {chat_id}, falling back to originals")
+        for file_id, _ in items:
+            registry.forget(file_id)
+        messages = await bot.send_media_group(chat_id=chat_id, media=media(resolve=False))
+    finally:
+        metrics.histogram(f'photo_send_seconds.{destination}').observe(time.perf_counter() - start)
+
+    for (file_id, _), message in zip(items, messages):
+        registry.record(file_id, chat_id, message)
+    return messages
+
+async def edit_photo(bot, chat_id, message_id: int, photo_file_id: str, destination: str,
+                     caption: str = None, parse_mode: str = None, reply_markup=None):
+    """Замена фото в уже отправленном сообщении (edit_message_media) с учетом реестра"""
+    file_id = registry.resolve(photo_file_id, chat_id)
+    start = time.perf_counter()
+    try:
+        message = await bot.edit_message_media(
+            chat_id=chat_id,
+            message_id=message_id,
+            media=InputMediaPhoto(media=file_id, caption=caption, parse_mode=parse_mode),
+            reply_markup=reply_markup
+        )
+    finally:
+        metrics.histogram(f'photo_send_seconds.{destination}').observe(time.perf_counter() - start)
+
+    if message is not True:
+        registry.record(photo_file_id, chat_id, message)
+    return message
@@ -0,0 +1,136 @@
+"""
+Простые внутрипроцессные метрики: счетчики, gauge и гистограммы.
+
+Снимок всех метрик отдается health check сервером по адресу /metrics.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+# Границы корзин по умолчанию (секунды) - от быстрых вызовов API до медленных загрузок
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Counter:
+    """Монотонный счетчик"""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def snapshot(self) -> Dict:
+        return {'type': 'counter', 'value': self._value}
+
+class Gauge:
+    """Текущее значение (например, глубина очереди)"""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict:
+        return {'type': 'gauge', 'value': self._value}
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и оценкой перцентилей"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets: List[float] = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+            if value > self._max:
+                self._max = value
+
+    @contextmanager
+    def time(self):
+        """Замер длительности блока кода"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Оценка перцентиля по верхней границе корзины"""
+        if not self._count:
+            return None
+        rank = q * self._count
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self._max
+        return self._max
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def snapshot(self) -> Dict:
+        return {
+            'type': 'histogram',
+            'count': self._count,
+            'sum': round(self._sum, 6),
+            'max': round(self._max, 6),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self._counts)),
+        }
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+def _get_or_create(name: str, factory):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.setdefault(name, factory())
+    return metric
+
+def counter(name: str) -> Counter:
+    return _get_or_create(name, Counter)
+
+def gauge(name: str) -> Gauge:
+    return _get_or_create(name, Gauge)
+
+def histogram(name: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(name, lambda: Histogram(buckets))
+
+def snapshot() -> Dict[str, Dict]:
+    """Снимок всех метрик"""
+    return {name: metric.snapshot() for name, metric in sorted(_registry.items())}
@@ -1,35 +1,36 @@
 import sqlite3
 import os
+from contextlib import closing
+
 from config import DATABASE_URL
+import schema
+from database import is_postgres_url
 
 def migrate_database():
-    """Миграция базы данных - добавление поля contact"""
-    
-    # Проверяем, существует ли база данных
-    if not os.path.exists(DATABASE_URL):
-        print("База данных не найдена. Создастся автоматически при первом запуске.")
-        return
-    
+    """Миграция базы данных до последней версии схемы"""
+
     try:
-        with sqlite3.connect(DATABASE_URL) as conn:
-            cursor = conn.cursor()
-            
-            # Проверяем, есть ли уже колонка contact
-            cursor.execute("PRAGMA table_info(events)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'contact' not in columns:
-                # Добавляем колонку contact
-                cursor.execute('ALTER TABLE events ADD COLUMN contact TEXT')
-                print("✅ Добавлена колонка 'contact' в таблицу events")
-            else:
-                print("ℹ️ Колонка 'contact' уже существует")
-                
-            conn.commit()
-            print("✅ Миграция базы данных завершена успешно")
-            
+        if is_postgres_url(DATABASE_URL):
+            import psycopg2
+            with closing(psycopg2.connect(DATABASE_URL)) as conn:
+                conn.autocommit = True
+                before = schema.current_version(conn, 'postgres')
+                after = schema.migrate(conn, 'postgres')
+        else:
+            if not os.path.exists(DATABASE_URL):
+                print("ℹ️ База данных не найдена, будет создана с нуля")
+            with closing(sqlite3.connect(DATABASE_URL, isolation_level=None)) as conn:
+                before = schema.current_version(conn, 'sqlite')
+                after = schema.migrate(conn, 'sqlite')
+
+        if before == after:
+            print(f"ℹ️ Схема уже актуальна (версия {after})")
+        else:
+            print(f"✅ Схема обновлена: версия {before} → {after}")
+        print("✅ Миграция базы данных завершена успешно")
+
     except Exception as e:
         print(f"❌ Ошибка при миграции базы данных: {e}")
 
 if __name__ == "__main__":
-    migrate_database() 
\ No newline at end of file
+    migrate_database()
@@ -0,0 +1,24 @@
+-- Базовая схема: события и состояния пользователей
+CREATE TABLE IF NOT EXISTS events (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    theme VARCHAR(100) NOT NULL,
+    place VARCHAR(500) NOT NULL,
+    contact VARCHAR(100) NOT NULL,
+    event_time VARCHAR(100) NOT NULL,
+    photo_file_id VARCHAR(255),
+    description TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    status VARCHAR(20) DEFAULT 'draft',
+    admin_message_id BIGINT,
+    channel_message_id BIGINT
+);
+
+CREATE TABLE IF NOT EXISTS user_states (
+    user_id BIGINT PRIMARY KEY,
+    state VARCHAR(50) NOT NULL,
+    event_id INTEGER REFERENCES events(id) ON DELETE CASCADE,
+    data TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,7 @@
+-- Выравнивание схемы с SQLite: черновик создается до заполнения полей
+ALTER TABLE events ADD COLUMN IF NOT EXISTS username VARCHAR(100);
+ALTER TABLE events ALTER COLUMN theme DROP NOT NULL;
+ALTER TABLE events ALTER COLUMN place DROP NOT NULL;
+ALTER TABLE events ALTER COLUMN contact DROP NOT NULL;
+ALTER TABLE events ALTER COLUMN event_time DROP NOT NULL;
+ALTER TABLE events ALTER COLUMN status SET DEFAULT 'creating';
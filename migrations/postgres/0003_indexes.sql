@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Индексы строятся без блокировки записи в таблицу
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_user_status ON events(user_id, status, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_status ON events(status);
+DROP INDEX CONCURRENTLY IF EXISTS idx_events_user_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_user_states_user_id;
@@ -0,0 +1,11 @@
+-- Кэш обработанных фотографий: исходный файл -> перцептивный хеш -> file_id в Telegram
+CREATE TABLE IF NOT EXISTS photo_cache (
+    source_unique_id VARCHAR(64) PRIMARY KEY,
+    phash VARCHAR(16) NOT NULL,
+    file_id VARCHAR(255) NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_photo_cache_phash ON photo_cache(phash);
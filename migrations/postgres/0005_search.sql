@@ -0,0 +1,9 @@
+-- Полнотекстовый поиск: вектор с русским стеммингом, поля с весами A/B/C.
+-- Дальше вектор обновляется в update_event при изменении текстовых полей.
+ALTER TABLE events ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+UPDATE events SET search_vector =
+    setweight(to_tsvector('russian', coalesce(theme, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(place, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'C')
+WHERE search_vector IS NULL;
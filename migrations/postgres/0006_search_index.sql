@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- GIN-индекс только по опубликованным анонсам, строится без блокировки записи
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_search ON events USING GIN (search_vector)
+    WHERE status = 'published';
@@ -0,0 +1,4 @@
+-- Координаты места встречи из ссылки Google Maps и их geohash для поиска рядом
+ALTER TABLE events ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION;
+ALTER TABLE events ADD COLUMN IF NOT EXISTS lng DOUBLE PRECISION;
+ALTER TABLE events ADD COLUMN IF NOT EXISTS geohash VARCHAR(12);
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Поиск по префиксам geohash идет диапазонами строк, поэтому сравнение побайтовое (COLLATE "C")
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_geohash ON events (geohash COLLATE "C")
+    WHERE status = 'published';
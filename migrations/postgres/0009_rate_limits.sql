@@ -0,0 +1,8 @@
+-- Сохраненные корзины лимитов частоты действий (ключ "действие:пользователь")
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key VARCHAR(64) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limits_updated_at ON rate_limits(updated_at);
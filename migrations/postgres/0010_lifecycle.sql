@@ -0,0 +1,7 @@
+-- Жизненный цикл опубликованных анонсов:
+-- starts_at - начало прогулки (Unix-время), разобранное из event_time,
+-- expires_at - когда опубликованный анонс уходит в архив,
+-- revision_of - правка опубликованного анонса (ID исходного события)
+ALTER TABLE events ADD COLUMN IF NOT EXISTS starts_at DOUBLE PRECISION;
+ALTER TABLE events ADD COLUMN IF NOT EXISTS expires_at DOUBLE PRECISION;
+ALTER TABLE events ADD COLUMN IF NOT EXISTS revision_of INTEGER REFERENCES events(id) ON DELETE CASCADE;
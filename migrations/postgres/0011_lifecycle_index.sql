@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Архиватор выбирает опубликованные анонсы с истекшим expires_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_expires_at ON events (expires_at)
+    WHERE status = 'published';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_revision_of ON events (revision_of)
+    WHERE revision_of IS NOT NULL;
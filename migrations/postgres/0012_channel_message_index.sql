@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Поиск анонсов, опубликованных одним постом канала (дайджест)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_channel_message_id ON events (channel_message_id)
+    WHERE channel_message_id IS NOT NULL;
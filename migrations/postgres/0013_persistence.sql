@@ -0,0 +1,9 @@
+-- Данные PTB (context.user_data, context.chat_data, состояния ConversationHandler)
+-- kind: user_data, chat_data или conversation:<имя>; data - JSON
+CREATE TABLE IF NOT EXISTS persistence (
+    kind VARCHAR(64) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    data TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (kind, key)
+);
@@ -0,0 +1,21 @@
+-- Подписки на новые прогулки (subscriptions.py).
+-- keywords - основы слов через пробел, days - дни недели строкой ('56' - выходные),
+-- lat/lng/radius_km - район. Отписка выключает подписку (active = FALSE), чтобы
+-- другие процессы кластера увидели ее по updated_at
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    query TEXT,
+    keywords TEXT,
+    lat DOUBLE PRECISION,
+    lng DOUBLE PRECISION,
+    radius_km DOUBLE PRECISION,
+    days VARCHAR(7),
+    hour_from INTEGER,
+    hour_to INTEGER,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    updated_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_subscriptions_user_id ON subscriptions(user_id, active);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_updated_at ON subscriptions(updated_at);
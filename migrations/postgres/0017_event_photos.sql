@@ -0,0 +1,10 @@
+-- Фото альбома анонса (albums.py): position 0 - обложка, она же events.photo_file_id.
+-- Строки есть только у анонсов с альбомом из двух и более фото.
+-- message_id - сообщение альбома в канале (чтобы снять пост целиком)
+CREATE TABLE IF NOT EXISTS event_photos (
+    event_id INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+    position SMALLINT NOT NULL,
+    file_id TEXT NOT NULL,
+    message_id BIGINT,
+    PRIMARY KEY (event_id, position)
+);
@@ -0,0 +1,20 @@
+-- Сообщества (города) одного бота (tenants.py): чат администраторов и канал публикации.
+-- rate_limits - JSON с лимитами сообщества вместо общих:
+-- {"user": {"submit": [3, 3600]}, "global": {"submit": [500, 3600]}}.
+-- Сообщество с id 1 создается при старте из ADMIN_CHAT_ID и CHANNEL_ID
+CREATE TABLE IF NOT EXISTS tenants (
+    id SERIAL PRIMARY KEY,
+    slug VARCHAR(64) NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    admin_chat_id VARCHAR(64) NOT NULL,
+    channel_id VARCHAR(64) NOT NULL,
+    rate_limits TEXT,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    updated_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_tenants_updated_at ON tenants(updated_at);
+
+-- Анонсы и подписки существующей установки относятся к сообществу 1
+ALTER TABLE events ADD COLUMN IF NOT EXISTS tenant_id INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS tenant_id INTEGER NOT NULL DEFAULT 1;
@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Запросы к анонсам идут в пределах сообщества: индексы начинаются с tenant_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_tenant_geohash ON events (tenant_id, geohash COLLATE "C")
+    WHERE status = 'published';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_tenant_queued ON events (tenant_id, updated_at, id)
+    WHERE status = 'queued';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_tenant_channel_message_id ON events (tenant_id, channel_message_id)
+    WHERE channel_message_id IS NOT NULL;
+DROP INDEX CONCURRENTLY IF EXISTS idx_events_geohash;
+DROP INDEX CONCURRENTLY IF EXISTS idx_events_channel_message_id;
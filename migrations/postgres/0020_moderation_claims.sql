@@ -0,0 +1,12 @@
+-- Модерация несколькими администраторами (moderation.py).
+-- submitted_at - когда анонс ушел на модерацию: от него считается время до решения
+ALTER TABLE events ADD COLUMN IF NOT EXISTS submitted_at DOUBLE PRECISION;
+
+-- Анонс, который рассматривает администратор: другие не принимают по нему
+-- решений, пока не истечет аренда expires_at. Строка удаляется после решения
+CREATE TABLE IF NOT EXISTS moderation_claims (
+    event_id INTEGER PRIMARY KEY,
+    admin_id BIGINT NOT NULL,
+    admin_name TEXT,
+    expires_at DOUBLE PRECISION NOT NULL
+);
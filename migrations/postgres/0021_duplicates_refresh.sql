@@ -0,0 +1,4 @@
+-- Индекс дубликатов (duplicates.py) в каждом процессе подтягивает анонсы,
+-- отправленные или измененные другими воркерами кластера.
+-- content_updated_at - когда у анонса последний раз менялись статус или текст
+ALTER TABLE events ADD COLUMN IF NOT EXISTS content_updated_at DOUBLE PRECISION;
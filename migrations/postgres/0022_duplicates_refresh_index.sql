@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_content_updated_at ON events (content_updated_at)
+    WHERE content_updated_at IS NOT NULL;
@@ -0,0 +1,3 @@
+-- Точный хеш содержимого (sha256) обработанного фото: file_id переиспользуется
+-- только для того же изображения байт в байт, а не для похожего по phash
+ALTER TABLE photo_cache ADD COLUMN IF NOT EXISTS content_hash TEXT;
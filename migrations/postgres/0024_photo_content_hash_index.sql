@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_photo_cache_content_hash ON photo_cache (content_hash)
+    WHERE content_hash IS NOT NULL;
@@ -0,0 +1,25 @@
+-- Базовая схема: события и состояния пользователей
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    username TEXT,
+    theme TEXT,
+    place TEXT,
+    contact TEXT,
+    event_time TEXT,
+    photo_file_id TEXT,
+    description TEXT,
+    status TEXT DEFAULT 'creating',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    admin_message_id INTEGER,
+    channel_message_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS user_states (
+    user_id INTEGER PRIMARY KEY,
+    state TEXT,
+    event_id INTEGER,
+    data TEXT,
+    FOREIGN KEY (event_id) REFERENCES events (id)
+);
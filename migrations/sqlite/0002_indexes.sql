@@ -0,0 +1,3 @@
+-- Индексы для выборок по автору и статусу
+CREATE INDEX IF NOT EXISTS idx_events_user_status ON events(user_id, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_events_status ON events(status);
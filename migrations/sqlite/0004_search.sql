@@ -0,0 +1,4 @@
+-- Полнотекстовый поиск по опубликованным анонсам (rowid = events.id).
+-- В колонках хранятся основы слов: русский стемминг выполняется в search.py,
+-- а существующие анонсы индексируются при старте после этой миграции.
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(theme, place, description);
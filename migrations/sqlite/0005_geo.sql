@@ -0,0 +1,7 @@
+-- Координаты места встречи из ссылки Google Maps и их geohash для поиска рядом
+ALTER TABLE events ADD COLUMN lat REAL;
+ALTER TABLE events ADD COLUMN lng REAL;
+ALTER TABLE events ADD COLUMN geohash TEXT;
+
+-- Составной индекс: SQLite не применяет частичные индексы к условиям внутри OR
+CREATE INDEX IF NOT EXISTS idx_events_status_geohash ON events(status, geohash);
@@ -0,0 +1,10 @@
+-- Жизненный цикл опубликованных анонсов:
+-- starts_at - начало прогулки (Unix-время), разобранное из event_time,
+-- expires_at - когда опубликованный анонс уходит в архив,
+-- revision_of - правка опубликованного анонса (ID исходного события)
+ALTER TABLE events ADD COLUMN starts_at REAL;
+ALTER TABLE events ADD COLUMN expires_at REAL;
+ALTER TABLE events ADD COLUMN revision_of INTEGER REFERENCES events(id);
+
+CREATE INDEX IF NOT EXISTS idx_events_status_expires_at ON events(status, expires_at);
+CREATE INDEX IF NOT EXISTS idx_events_revision_of ON events(revision_of);
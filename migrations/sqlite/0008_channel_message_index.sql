@@ -0,0 +1,2 @@
+-- Поиск анонсов, опубликованных одним постом канала (дайджест)
+CREATE INDEX IF NOT EXISTS idx_events_channel_message_id ON events(channel_message_id);
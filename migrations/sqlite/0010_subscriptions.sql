@@ -0,0 +1,21 @@
+-- Подписки на новые прогулки (subscriptions.py).
+-- keywords - основы слов через пробел, days - дни недели строкой ('56' - выходные),
+-- lat/lng/radius_km - район. Отписка выключает подписку (active = 0), чтобы
+-- другие процессы кластера увидели ее по updated_at
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    query TEXT,
+    keywords TEXT,
+    lat REAL,
+    lng REAL,
+    radius_km REAL,
+    days TEXT,
+    hour_from INTEGER,
+    hour_to INTEGER,
+    active INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_subscriptions_user_id ON subscriptions(user_id, active);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_updated_at ON subscriptions(updated_at);
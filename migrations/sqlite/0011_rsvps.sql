@@ -0,0 +1,9 @@
+-- Отметки «Иду» / «Может быть» под постами в канале (rsvp.py).
+-- status: going или maybe; повторное нажатие той же кнопки удаляет строку
+CREATE TABLE IF NOT EXISTS rsvps (
+    event_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (event_id, user_id)
+);
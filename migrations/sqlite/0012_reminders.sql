@@ -0,0 +1,11 @@
+-- Отложенные напоминания о прогулке отметившимся «Иду» / «Может быть» (reminders.py).
+-- Строка создается и удаляется вместе с отметкой; перед отправкой напоминание
+-- захватывается удалением строки, поэтому воркеры кластера не дублируют его
+CREATE TABLE IF NOT EXISTS reminders (
+    event_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    due_at REAL NOT NULL,
+    PRIMARY KEY (event_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_reminders_due_at ON reminders(due_at);
@@ -0,0 +1,27 @@
+-- Сообщества (города) одного бота (tenants.py): чат администраторов и канал публикации.
+-- rate_limits - JSON с лимитами сообщества вместо общих:
+-- {"user": {"submit": [3, 3600]}, "global": {"submit": [500, 3600]}}.
+-- Сообщество с id 1 создается при старте из ADMIN_CHAT_ID и CHANNEL_ID
+CREATE TABLE IF NOT EXISTS tenants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    slug TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    admin_chat_id TEXT NOT NULL,
+    channel_id TEXT NOT NULL,
+    rate_limits TEXT,
+    active INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_tenants_updated_at ON tenants(updated_at);
+
+-- Анонсы и подписки существующей установки относятся к сообществу 1
+ALTER TABLE events ADD COLUMN tenant_id INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE subscriptions ADD COLUMN tenant_id INTEGER NOT NULL DEFAULT 1;
+
+-- Запросы к анонсам идут в пределах сообщества: индексы начинаются с tenant_id
+CREATE INDEX IF NOT EXISTS idx_events_tenant_status_geohash ON events(tenant_id, status, geohash);
+CREATE INDEX IF NOT EXISTS idx_events_tenant_status_updated_at ON events(tenant_id, status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_events_tenant_channel_message_id ON events(tenant_id, channel_message_id);
+DROP INDEX IF EXISTS idx_events_status_geohash;
+DROP INDEX IF EXISTS idx_events_channel_message_id;
@@ -0,0 +1,12 @@
+-- Модерация несколькими администраторами (moderation.py).
+-- submitted_at - когда анонс ушел на модерацию: от него считается время до решения
+ALTER TABLE events ADD COLUMN submitted_at REAL;
+
+-- Анонс, который рассматривает администратор: другие не принимают по нему
+-- решений, пока не истечет аренда expires_at. Строка удаляется после решения
+CREATE TABLE IF NOT EXISTS moderation_claims (
+    event_id INTEGER PRIMARY KEY,
+    admin_id INTEGER NOT NULL,
+    admin_name TEXT,
+    expires_at REAL NOT NULL
+);
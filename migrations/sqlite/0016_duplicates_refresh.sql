@@ -0,0 +1,5 @@
+-- Индекс дубликатов (duplicates.py) в каждом процессе подтягивает анонсы,
+-- отправленные или измененные другими воркерами кластера.
+-- content_updated_at - когда у анонса последний раз менялись статус или текст
+ALTER TABLE events ADD COLUMN content_updated_at REAL;
+CREATE INDEX IF NOT EXISTS idx_events_content_updated_at ON events(content_updated_at);
@@ -0,0 +1,4 @@
+-- Точный хеш содержимого (sha256) обработанного фото: file_id переиспользуется
+-- только для того же изображения байт в байт, а не для похожего по phash
+ALTER TABLE photo_cache ADD COLUMN content_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_photo_cache_content_hash ON photo_cache(content_hash);
@@ -0,0 +1,103 @@
+"""
+Модерация анонсов несколькими администраторами.
+
+Кнопки модерации видят все участники чата администраторов, поэтому решение
+принимается, только если нажавший - администратор этого чата (статус из
+MODERATOR_STATUSES по get_chat_member). Ответ Telegram кэшируется на
+MODERATOR_CACHE_SECONDS, так что проверка не добавляет запрос к API на каждое
+нажатие; снятый администратор теряет права не позже чем через это время.
+
+Администратор захватывает анонс - строку moderation_claims с арендой на
+MODERATION_CLAIM_SECONDS - кнопкой «👀 Беру» или самим решением. Пока аренда
+не истекла, другие администраторы анонс не одобрят и не отклонят; захват
+снимается после решения, а брошенный истекает сам. Захват хранится в БД
+и действует между воркерами кластера.
+
+Время от отправки на модерацию до решения пишется в гистограммы
+moderation.decision_seconds и moderation.<решение>_seconds.
+"""
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from telegram.error import TelegramError
+
+from config import MODERATOR_STATUSES, MODERATOR_CACHE_SECONDS, MODERATION_CLAIM_SECONDS
+from ratelimit import format_retry_after
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Корзины гистограмм времени до решения: от минуты до суток
+SLA_BUCKETS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 24 * 3600)
+
+class AdminRoster:
+    """Статусы участников чатов администраторов с кэшем на ttl секунд"""
+
+    def __init__(self, ttl: float = MODERATOR_CACHE_SECONDS, statuses: Sequence[str] = MODERATOR_STATUSES,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.statuses = frozenset(statuses)
+        self.clock = clock
+        # (чат, пользователь) → (может ли принимать решения, до какого времени верно)
+        self._cache: Dict[Tuple[str, int], Tuple[bool, float]] = {}
+        self._loading: Dict[Tuple[str, int], asyncio.Task] = {}
+
+    async def is_moderator(self, bot, chat_id, user_id: int) -> bool:
+        """Может ли пользователь принимать решения в чате; одновременные проверки ждут один запрос"""
+        key = (str(chat_id), user_id)
+        cached = self._cache.get(key)
+        if cached is not None and cached[1] > self.clock():
+            metrics.counter('moderation.roster_hits_total').inc()
+            return cached[0]
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = asyncio.create_task(self._fetch(bot, key))
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await task
+
+    async def _fetch(self, bot, key: Tuple[str, int]) -> bool:
+        metrics.counter('moderation.roster_lookups_total').inc()
+        chat_id, user_id = key
+        try:
+            member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        except TelegramError as e:
+            # Ошибку не кэшируем: следующее нажатие спросит Telegram снова
+            logger.warning(f"Could not check admin status of {user_id} in chat {chat_id}: {e}")
+            return False
+        allowed = member.status in self.statuses
+        self._cache[key] = (allowed, self.clock() + self.ttl)
+        return allowed
+
+    def invalidate(self, chat_id, user_id: int):
+        self._cache.pop((str(chat_id), user_id), None)
+
+roster = AdminRoster()
+
+def admin_name(user) -> str:
+    return f"@{user.username}" if user.username else user.first_name
+
+def claim(database, event_id: int, user, lease: float = MODERATION_CLAIM_SECONDS) -> Optional[str]:
+    """Захват анонса администратором; возвращает текст отказа или None, если анонс его"""
+    now = time.time()
+    holder = database.claim_moderation(event_id, user.id, admin_name(user), now, lease)
+    if holder is None:
+        return None
+    metrics.counter('moderation.claim_conflicts_total').inc()
+    return (f"👀 Анонс рассматривает {holder['admin_name'] or 'другой администратор'}, "
+            f"захват истечет через {format_retry_after(holder['expires_at'] - now)}")
+
+def release(database, event_id: int):
+    database.release_moderation(event_id)
+
+def decided(database, event: Dict[str, Any], decision: str):
+    """Решение принято: снятие захвата и запись времени от отправки на модерацию"""
+    database.release_moderation(event['id'])
+    metrics.counter(f'moderation.{decision}_total').inc()
+    submitted_at = event.get('submitted_at')
+    if submitted_at is None:
+        return
+    waited = max(0.0, time.time() - submitted_at)
+    metrics.histogram('moderation.decision_seconds', SLA_BUCKETS).observe(waited)
+    metrics.histogram(f'moderation.{decision}_seconds', SLA_BUCKETS).observe(waited)
@@ -0,0 +1,138 @@
+"""
+Хранение context.user_data и context.chat_data (и состояний ConversationHandler)
+в таблице persistence той же базы, с которой работает бот.
+
+PTB раз в update_interval секунд передает адаптеру данные пользователей и чатов,
+обработанных с прошлого раза, и сбрасывает все при остановке (flush). Адаптер
+сравнивает их с уже записанным JSON и пишет только изменившиеся записи - одной
+транзакцией на проход, а не запросом на каждый апдейт.
+
+bot_data не сохраняется: там лежат пул процессов и фоновые задачи.
+"""
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import PERSISTENCE_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CHAT_DATA = 'chat_data'
+CONVERSATION = 'conversation:'
+
+class DatabasePersistence(BasePersistence):
+    """BasePersistence поверх database.py / database_railway.py с пакетной записью"""
+
+    def __init__(self, database, update_interval: float = PERSISTENCE_FLUSH_SECONDS):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.database = database
+        # Последний записанный JSON для каждой записи: неизменившиеся данные не пишутся
+        self._stored: Dict[Tuple[str, str], str] = {}
+        # Записи, ожидающие сохранения (None - удаление)
+        self._pending: Dict[Tuple[str, str], Optional[str]] = {}
+        self._writer: Optional[asyncio.Task] = None
+
+    async def _load(self, kind: str) -> Dict[str, Any]:
+        rows = await asyncio.get_running_loop().run_in_executor(None, self.database.load_persistent_data, kind)
+        result = {}
+        for key, data in rows.items():
+            self._stored[(kind, key)] = data
+            result[key] = json.loads(data)
+        return result
+
+    def _stage(self, kind: str, key: str, data: Any):
+        """Постановка записи в очередь; запись выполняется после текущего прохода PTB"""
+        if data is None or data == {}:
+            # Пустые user_data/chat_data не храним: у большинства пользователей их нет
+            serialized = None
+        else:
+            try:
+                serialized = json.dumps(data, ensure_ascii=False, sort_keys=True)
+            except (TypeError, ValueError) as e:
+                logger.error(f"❌ Данные {kind}:{key} не сериализуются в JSON: {e}")
+                return
+        if self._stored.get((kind, key)) == serialized and (kind, key) not in self._pending:
+            return
+        self._pending[(kind, key)] = serialized
+        if self._writer is None or self._writer.done():
+            # Все update_* одного прохода PTB запускает через gather: задача записи
+            # выполнится после них и сохранит их изменения одной транзакцией
+            self._writer = asyncio.create_task(self._write())
+
+    async def _write(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        rows = [(kind, key, data) for (kind, key), data in batch.items()]
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.database.save_persistent_data, rows)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения данных пользователей: {e}")
+            # Вернем в очередь все, что не изменилось заново за время записи
+            for item, data in batch.items():
+                self._pending.setdefault(item, data)
+            return
+        for item, data in batch.items():
+            if data is None:
+                self._stored.pop(item, None)
+            else:
+                self._stored[item] = data
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {int(key): data for key, data in (await self._load(USER_DATA)).items()}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {int(key): data for key, data in (await self._load(CHAT_DATA)).items()}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        rows = await self._load(CONVERSATION + name)
+        return {tuple(json.loads(key)): state for key, state in rows.items()}
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        self._stage(CONVERSATION + name, json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        self._stage(USER_DATA, str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        self._stage(CHAT_DATA, str(chat_id), data)
+
+    async def update_bot_data(self, data: Dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage(USER_DATA, str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stage(CHAT_DATA, str(chat_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Запись всего, что осталось в очереди (вызывается PTB при остановке)"""
+        if self._writer is not None:
+            await self._writer
+        await self._write()
@@ -0,0 +1,133 @@
+"""
+Стадии обработки апдейтов, вынесенные в пул процессов.
+
+CPU-тяжелые участки обработчиков (нормализация изображений, рендеринг
+длинных анонсов) выполняются в общем ProcessPoolExecutor, чтобы не
+задерживать остальных пользователей в event loop. В процессы передаются
+только простые данные (словари со строками и числами, байты), а не объекты PTB.
+
+У каждой стадии свой лимит одновременных задач и длина очереди ожидания:
+если очередь заполнена, стадия сразу отказывает (StageBusy), и обработчик
+может ответить пользователю или выполнить работу по упрощенному пути.
+"""
+import time
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+from config import CPU_POOL_WORKERS, PIPELINE_STAGES, RENDER_OFFLOAD_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+class StageBusy(RuntimeError):
+    """Стадия перегружена: очередь ожидания заполнена"""
+
+class Stage:
+    """Стадия пайплайна с ограничением параллелизма и очереди"""
+
+    def __init__(self, name: str, executor: ProcessPoolExecutor, concurrency: int, max_queue: int):
+        self.name = name
+        self.executor = executor
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._waiting = 0
+
+        self.queue_depth = metrics.gauge(f'pipeline.{name}.queue_depth')
+        self.in_flight = metrics.gauge(f'pipeline.{name}.in_flight')
+        self.rejected = metrics.counter(f'pipeline.{name}.rejected_total')
+        self.wait_seconds = metrics.histogram(f'pipeline.{name}.wait_seconds')
+        self.run_seconds = metrics.histogram(f'pipeline.{name}.run_seconds')
+
+    @property
+    def saturated(self) -> bool:
+        return self._semaphore.locked() and self._waiting >= self.max_queue
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Выполнение func(*args) в пуле процессов"""
+        if self.saturated:
+            self.rejected.inc()
+            raise StageBusy(f"Stage '{self.name}' is saturated")
+
+        self._waiting += 1
+        self.queue_depth.set(self._waiting)
+        queued_at = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+            self.queue_depth.set(self._waiting)
+
+        started_at = time.perf_counter()
+        self.wait_seconds.observe(started_at - queued_at)
+        self.in_flight.inc()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight.dec()
+            self.run_seconds.observe(time.perf_counter() - started_at)
+            self._semaphore.release()
+
+class Pipeline:
+    """Набор стадий над общим пулом процессов"""
+
+    def __init__(self, workers: int = CPU_POOL_WORKERS, stages: Dict[str, tuple] = PIPELINE_STAGES):
+        self.workers = workers
+        self._stage_config = stages
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._stages: Dict[str, Stage] = {}
+
+    def stage(self, name: str) -> Stage:
+        """Стадия по имени (пул процессов создается при первом использовании)"""
+        stage = self._stages.get(name)
+        if stage is None:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            concurrency, max_queue = self._stage_config[name]
+            stage = self._stages[name] = Stage(name, self._executor, concurrency, max_queue)
+        return stage
+
+    async def run(self, stage_name: str, func: Callable, *args) -> Any:
+        return await self.stage(stage_name).run(func, *args)
+
+    def shutdown(self):
+        """Остановка пула процессов"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._stages.clear()
+
+def get_pipeline(context) -> Optional[Pipeline]:
+    """Пайплайн приложения (создается в bot.create_application)"""
+    application = getattr(context, 'application', None)
+    if application is None:
+        return None
+    return application.bot_data.get('pipeline')
+
+def event_record(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Событие из БД в виде простого словаря для передачи в другой процесс"""
+    record = {}
+    for key, value in event.items():
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        record[key] = value
+    return record
+
+async def render(context, func: Callable, event: Dict[str, Any], *args) -> str:
+    """
+    Рендеринг анонса функцией func(event, *args).
+    Анонсы с длинным описанием рендерятся в пуле процессов, короткие - на месте,
+    так как передача в другой процесс для них дороже самой работы.
+    """
+    record = event_record(event)
+    pipeline = get_pipeline(context)
+    if pipeline is not None and len(record.get('description') or '') >= RENDER_OFFLOAD_THRESHOLD:
+        try:
+            return await pipeline.run('render', func, record, *args)
+        except StageBusy:
+            logger.warning("Render stage is saturated, rendering inline")
+    return func(record, *args)
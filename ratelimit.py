@@ -0,0 +1,198 @@
+"""
+Ограничение частоты действий пользователей (создание, отправка, редактирование анонсов).
+
+Для каждого действия задан лимит "N раз за период" - это token bucket
+емкостью N, который равномерно пополняется за период. Проверка выполняется
+в памяти до любых записей в БД, поэтому спам кнопками не создает строк в events.
+
+Состояние корзин периодически сохраняется в таблицу rate_limits и загружается
+при старте, так что перезапуск бота не обнуляет лимиты. Полностью
+пополнившиеся корзины из памяти удаляются: они ничем не отличаются от новых.
+
+Корзины действий в сообществе (tenants.py) отдельные для каждого сообщества:
+ключ "действие@сообщество:пользователь". Сообщество может задать свои лимиты
+вместо общих (столбец tenants.rate_limits), в том числе свой общий лимит, так что
+наплыв анонсов в одном городе не упирается в лимит другого.
+
+В режиме кластера (cluster.py) у каждого из BOT_WORKERS воркеров своя корзина
+общего лимита ("действие:*w<номер>") емкостью в BOT_WORKERS раз меньше: воркеры
+не перезаписывают корзины друг друга в rate_limits, а в сумме пропускают
+столько же, сколько один процесс.
+"""
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import metrics
+from config import RATE_LIMITS, GLOBAL_RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+# Ключ корзины общего (на всех пользователей) лимита действия
+GLOBAL_KEY = '*'
+
+class Limit(NamedTuple):
+    capacity: int
+    period: float  # секунды
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+class RateLimiter:
+    """Token bucket на пользователя и действие плюс общие лимиты действий"""
+
+    def __init__(self, limits: Dict[str, Tuple[int, float]],
+                 global_limits: Dict[str, Tuple[int, float]] = None, clock=time.time):
+        self.limits = {action: Limit(*limit) for action, limit in limits.items() if limit[0] > 0}
+        self.global_limits = {
+            action: Limit(*limit) for action, limit in (global_limits or {}).items() if limit[0] > 0
+        }
+        # Лимиты сообществ вместо общих: tenant_id → {действие: лимит}
+        self.tenant_limits: Dict[int, Dict[str, Limit]] = {}
+        self.tenant_global_limits: Dict[int, Dict[str, Limit]] = {}
+        self.clock = clock
+        # Доля общего лимита этого процесса в кластере: владелец корзины и число воркеров
+        self.global_owner = GLOBAL_KEY
+        self.shards = 1
+        # ключ -> [токены, время обновления]
+        self._buckets: Dict[str, List[float]] = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bucket_key(action: str, user_id, tenant_id: Optional[int] = None) -> str:
+        if tenant_id is not None:
+            action = f'{action}@{tenant_id}'
+        return f'{action}:{user_id}'
+
+    def set_shard(self, index: int, shards: int):
+        """Воркер index из shards: своя корзина общего лимита емкостью в shards раз меньше"""
+        with self._lock:
+            self.shards = max(1, shards)
+            self.global_owner = f'{GLOBAL_KEY}w{index}' if self.shards > 1 else GLOBAL_KEY
+            self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                             if not key.rsplit(':', 1)[1].startswith(GLOBAL_KEY)}
+
+    def set_tenant_limits(self, tenant_id: int, limits: Dict[str, Tuple[int, float]],
+                          global_limits: Dict[str, Tuple[int, float]] = None):
+        """Лимиты сообщества вместо общих (пустые - общие лимиты)"""
+        with self._lock:
+            self.tenant_limits[tenant_id] = {action: Limit(*limit) for action, limit in limits.items()}
+            self.tenant_global_limits[tenant_id] = {
+                action: Limit(*limit) for action, limit in (global_limits or {}).items()
+            }
+
+    def _resolve(self, action: str, tenant_id: Optional[int], is_global: bool) -> Optional[Limit]:
+        overrides = (self.tenant_global_limits if is_global else self.tenant_limits).get(tenant_id, {})
+        limit = overrides.get(action) or (self.global_limits if is_global else self.limits).get(action)
+        # Лимит 0 в сообществе отключает общий лимит
+        if limit is None or limit.capacity <= 0:
+            return None
+        if is_global and self.shards > 1:
+            limit = Limit(max(1, limit.capacity // self.shards), limit.period)
+        return limit
+
+    def _limit_for(self, key: str) -> Optional[Limit]:
+        action, owner = key.rsplit(':', 1)
+        if owner.startswith(GLOBAL_KEY) and owner != self.global_owner:
+            # Корзина общего лимита другого воркера
+            return None
+        action, _, tenant = action.partition('@')
+        return self._resolve(action, int(tenant) if tenant else None, owner == self.global_owner)
+
+    def _tokens(self, key: str, limit: Limit, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return float(limit.capacity)
+        tokens, updated_at = bucket
+        return min(float(limit.capacity), tokens + (now - updated_at) * limit.rate)
+
+    def acquire(self, action: str, user_id: int, tenant_id: Optional[int] = None) -> float:
+        """
+        Попытка выполнить действие (в сообществе tenant_id). Возвращает 0, если
+        действие разрешено (токен списан), иначе - через сколько секунд стоит повторить.
+        """
+        with self._lock:
+            checks = []
+            for owner, is_global in ((user_id, False), (self.global_owner, True)):
+                limit = self._resolve(action, tenant_id, is_global)
+                if limit is not None:
+                    checks.append((self.bucket_key(action, owner, tenant_id), limit))
+            if not checks:
+                return 0.0
+
+            now = self.clock()
+            current = [(key, limit, self._tokens(key, limit, now)) for key, limit in checks]
+            retry_after = max(
+                ((1 - tokens) / limit.rate for _, limit, tokens in current if tokens < 1),
+                default=0.0
+            )
+            if retry_after:
+                metrics.counter(f'ratelimit.{action}.rejected_total').inc()
+                return retry_after
+
+            # Токен списывается сразу со всех корзин, только если хватило во всех
+            for key, _, tokens in current:
+                self._buckets[key] = [tokens - 1, now]
+                self._dirty.add(key)
+            return 0.0
+
+    def load(self, rows):
+        """Загрузка сохраненных корзин: [(ключ, токены, время обновления)]"""
+        with self._lock:
+            for key, tokens, updated_at in rows:
+                if self._limit_for(key) is not None:
+                    self._buckets[key] = [float(tokens), float(updated_at)]
+
+    def max_period(self) -> float:
+        limits = [*self.limits.values(), *self.global_limits.values()]
+        for overrides in (*self.tenant_limits.values(), *self.tenant_global_limits.values()):
+            limits.extend(overrides.values())
+        return max((limit.period for limit in limits), default=0.0)
+
+    def collect_dirty(self) -> List[Tuple[str, float, float]]:
+        """Корзины, изменившиеся с прошлого сохранения; полные корзины удаляются из памяти"""
+        with self._lock:
+            now = self.clock()
+            rows = []
+            for key in self._dirty:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    rows.append((key, bucket[0], bucket[1]))
+            self._dirty.clear()
+
+            for key in list(self._buckets):
+                limit = self._limit_for(key)
+                if limit is None or self._tokens(key, limit, now) >= limit.capacity:
+                    del self._buckets[key]
+            return rows
+
+    def flush(self, database):
+        """Сохранение изменившихся корзин в БД"""
+        rows = self.collect_dirty()
+        if rows:
+            database.save_rate_limits(rows, expired_before=self.clock() - self.max_period())
+
+    async def run_flusher(self, database, interval: float):
+        """Фоновое сохранение корзин каждые interval секунд"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.flush, database)
+            except Exception as e:
+                logger.error(f"❌ Ошибка сохранения счетчиков лимитов: {e}")
+
+def format_retry_after(seconds: float) -> str:
+    """Человекочитаемое время до снятия ограничения"""
+    if seconds < 60:
+        return "меньше минуты"
+    minutes = int(seconds // 60) + 1
+    if minutes < 60:
+        return f"{minutes} мин"
+    return f"{minutes // 60} ч {minutes % 60} мин"
+
+limiter = RateLimiter(RATE_LIMITS, GLOBAL_RATE_LIMITS)
@@ -0,0 +1,65 @@
+"""
+Продолжение незаконченных анонсов после перезапуска бота.
+
+Если бот перезапустился, пока пользователь заполнял анонс, его шаг
+сохранился в user_data (drafts.py), но вопрос шага мог так и не дойти (или
+потеряться в истории чата). Незаконченные черновики отмечены строками
+user_states; при старте они просматриваются порциями по user_id:
+состояния, чей анонс уже не создается (отправлен, удален), очищаются,
+а остальные пользователи попадают в множество в памяти. Первое сообщение
+такого пользователя проверяется по этому множеству без запросов к БД,
+и бот повторяет вопрос текущего шага или предпросмотр (handlers.resume_draft).
+"""
+import asyncio
+import logging
+from typing import Set, Tuple
+
+from config import RESUME_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+class DraftRecovery:
+    """Пользователи с незаконченными анонсами, которым еще не напомнили о них"""
+
+    def __init__(self):
+        self.pending: Set[int] = set()
+
+    async def scan(self, database, batch_size: int = RESUME_BATCH_SIZE, shard: Tuple[int, int] = (0, 1)) -> int:
+        """
+        Проход по состояниям пользователей порциями; возвращает число незаконченных анонсов.
+        В кластере воркер shard=(номер, число воркеров) берет только своих пользователей.
+        """
+        index, workers = shard
+        loop = asyncio.get_running_loop()
+        last_user_id, found, stale_total = 0, 0, 0
+        while True:
+            states = await loop.run_in_executor(None, database.get_user_states_after, last_user_id, batch_size)
+            if not states:
+                break
+            stale = []
+            for state in states:
+                if state['user_id'] % workers != index:
+                    continue
+                if state['event_status'] == 'creating':
+                    self.pending.add(state['user_id'])
+                    found += 1
+                else:
+                    stale.append(state['user_id'])
+            if stale:
+                await loop.run_in_executor(None, database.clear_user_states, stale)
+                stale_total += len(stale)
+            last_user_id = states[-1]['user_id']
+            if len(states) < batch_size:
+                break
+        if found or stale_total:
+            logger.info(f"✅ Незаконченных анонсов: {found}, устаревших состояний очищено: {stale_total}")
+        return found
+
+    def take(self, user_id: int) -> bool:
+        """True, если пользователю нужно напомнить о незаконченном анонсе (только один раз)"""
+        if user_id not in self.pending:
+            return False
+        self.pending.discard(user_id)
+        return True
+
+recovery = DraftRecovery()
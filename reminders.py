@@ -0,0 +1,127 @@
+"""
+Напоминания о прогулке тем, кто отметился «Иду» / «Может быть» под постом.
+
+Напоминание - строка таблицы reminders со временем отправки (за REMINDER_HOURS
+до starts_at). Строки создаются и удаляются вместе с отметками (rsvp.py пишет
+их одной транзакцией) и переносятся при смене времени прогулки.
+
+Фоновая задача раз в REMINDER_POLL_SECONDS подгружает напоминания ближайшего
+окна (REMINDER_WINDOW_SECONDS) в кучу в памяти и спит до ближайшего из них.
+Наступившие напоминания захватываются порциями удалением строк (в режиме
+кластера каждое отправит только один воркер) и ставятся в очередь рассылки
+broadcast.py, которая держит общий лимит скорости. Следующая порция
+захватывается, только когда очередь рассылки разобрана, поэтому тысячи
+напоминаний к популярной субботней прогулке ждут в БД, а не в памяти;
+при перезапуске теряется не больше одной порции.
+"""
+import time
+import heapq
+import asyncio
+import logging
+from typing import Dict, List, Set, Tuple
+
+from config import (
+    REMINDER_WINDOW_SECONDS, REMINDER_POLL_SECONDS, REMINDER_BATCH_SIZE, REMINDER_WINDOW_LIMIT
+)
+from utils import format_reminder
+from broadcast import sender as default_sender
+import metrics
+import tenants
+
+logger = logging.getLogger(__name__)
+
+# (время отправки, event_id, user_id)
+Entry = Tuple[float, int, int]
+
+class ReminderEngine:
+    """Окно ближайших напоминаний в куче и их отправка порциями через очередь рассылки"""
+
+    def __init__(self, sender=default_sender, window: float = REMINDER_WINDOW_SECONDS,
+                 poll_interval: float = REMINDER_POLL_SECONDS, batch_size: int = REMINDER_BATCH_SIZE,
+                 clock=time.time):
+        self.sender = sender
+        self.window = window
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.clock = clock
+        self._heap: List[Entry] = []
+        self._queued: Set[Entry] = set()
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def load_window(self, database) -> int:
+        """Подгрузка напоминаний ближайшего окна; возвращает число новых"""
+        rows = await asyncio.get_running_loop().run_in_executor(
+            None, database.get_pending_reminders, self.clock() + self.window, REMINDER_WINDOW_LIMIT
+        )
+        added = 0
+        for row in rows:
+            entry = (float(row[0]), row[1], row[2])
+            if entry not in self._queued:
+                heapq.heappush(self._heap, entry)
+                self._queued.add(entry)
+                added += 1
+        metrics.gauge('reminders.window').set(len(self._heap))
+        return added
+
+    def take_due(self, now: float) -> List[Entry]:
+        """Наступившие напоминания из кучи, не больше batch_size"""
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            entry = heapq.heappop(self._heap)
+            self._queued.discard(entry)
+            due.append(entry)
+        return due
+
+    async def deliver(self, database, due: List[Entry]) -> int:
+        """Захват порции напоминаний и постановка в очередь рассылки; возвращает число поставленных"""
+        loop = asyncio.get_running_loop()
+        now = self.clock()
+        claimed = await loop.run_in_executor(
+            None, database.claim_reminders, [(event_id, user_id) for _, event_id, user_id in due], now
+        )
+        # Анонс загружается один раз на порцию: в порции обычно одна-две популярные прогулки
+        texts: Dict[int, str] = {}
+        for event_id in {event_id for event_id, _ in claimed}:
+            event = await loop.run_in_executor(None, database.get_event, event_id)
+            if event and event['status'] == 'published':
+                texts[event_id] = format_reminder(event, tenants.registry.channel_of(event))
+
+        due_at = {(event_id, user_id): at for at, event_id, user_id in due}
+        sent = 0
+        for event_id, user_id in claimed:
+            text = texts.get(event_id)
+            if text is None:
+                continue
+            if self.sender.enqueue(user_id, text, parse_mode='HTML', disable_web_page_preview=True):
+                sent += 1
+                metrics.histogram('reminders.lag_seconds').observe(now - due_at[(event_id, user_id)])
+        metrics.counter('reminders.sent_total').inc(sent)
+        metrics.counter('reminders.skipped_total').inc(len(due) - sent)
+        return sent
+
+    async def run(self, database):
+        """Фоновая отправка напоминаний"""
+        next_poll = 0.0
+        while True:
+            try:
+                now = self.clock()
+                if now >= next_poll:
+                    await self.load_window(database)
+                    next_poll = now + self.poll_interval
+                # Следующая порция - когда очередь рассылки почти разобрана
+                if self._heap and self._heap[0][0] <= now and self.sender.pending() < self.batch_size:
+                    await self.deliver(database, self.take_due(now))
+                    continue
+                if self._heap and self._heap[0][0] <= now:
+                    # Очередь рассылки еще не разобрана: проверим снова, когда часть уйдет
+                    delay = 0.1
+                else:
+                    delay = min(next_poll, self._heap[0][0] if self._heap else next_poll) - now
+                await asyncio.sleep(max(delay, 0.01))
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки напоминаний: {e}", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+
+engine = ReminderEngine()
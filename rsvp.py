@@ -0,0 +1,208 @@
+"""
+Отметки «Иду» / «Может быть» под постами анонсов в канале.
+
+Нажатие кнопки меняет только счетчики в памяти: отметки анонса загружаются
+из БД один раз (при первом нажатии), изменения копятся и записываются
+в таблицу rsvps одной транзакцией раз в RSVP_FLUSH_SECONDS. Так сотни нажатий
+под популярной прогулкой не превращаются в сотни запросов и блокировок строк.
+
+Кнопки поста перерисовываются отдельной задачей не чаще одного раза
+в RSVP_RENDER_SECONDS на пост (все нажатия за это время - одна правка)
+и с паузой CHANNEL_EDIT_INTERVAL между правками разных постов.
+
+В режиме кластера нажатия под одним постом приходят в один воркер (cluster.py
+распределяет их по event_id, а не по user_id): только он держит счетчики поста
+и правит его кнопки, поэтому счетчики не скачут между частичными значениями
+разных воркеров, а лимит правок на пост не умножается на число воркеров.
+"""
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config import CHANNEL_EDIT_INTERVAL, RSVP_RENDER_SECONDS, REMINDER_HOURS
+from keyboards import get_rsvp_keyboard
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('going', 'maybe')
+# Напоминания (reminders.py) пишутся вместе с отметками
+REMIND_BEFORE = REMINDER_HOURS * 3600 if REMINDER_HOURS > 0 else None
+
+class RsvpClosed(Exception):
+    """Анонс уже не опубликован: отметки не принимаются"""
+
+class RsvpBoard:
+    """Счетчики отметок под постами с пакетной записью и отложенной перерисовкой кнопок"""
+
+    def __init__(self, render_interval: float = RSVP_RENDER_SECONDS, edit_pause: float = CHANNEL_EDIT_INTERVAL):
+        self.render_interval = render_interval
+        self.edit_pause = edit_pause
+        # Отметки загруженных анонсов: event_id → {user_id: статус}
+        self._votes: Dict[int, Dict[int, str]] = {}
+        self._counts: Dict[int, Counter] = {}
+        self._loading: Dict[int, asyncio.Task] = {}
+        self._closed: Set[int] = set()
+        # Отметки, ожидающие записи (None - удаление), и их вклад в счетчики
+        self._pending: Dict[Tuple[int, int], Optional[str]] = {}
+        self._deltas: Dict[int, Counter] = defaultdict(Counter)
+        # Посты (канал, сообщение), кнопки которых нужно перерисовать (порядок - порядок изменений)
+        self._posts: Dict[int, Tuple[int, int]] = {}
+        self._dirty: Dict[int, None] = {}
+        self._rendered: Dict[int, Dict[str, int]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def _fetch(self, database, event_id: int):
+        loop = asyncio.get_running_loop()
+        event = await loop.run_in_executor(None, database.get_event, event_id)
+        if not event or event['status'] != 'published':
+            self._closed.add(event_id)
+            return
+        votes = await loop.run_in_executor(None, database.get_rsvps, event_id)
+        self._votes[event_id] = votes
+        # Нажатия, которые еще не записаны, уже учтены в отметках из памяти
+        self._counts[event_id] = Counter(votes.values()) + self._deltas.get(event_id, Counter())
+
+    async def _load(self, database, event_id: int):
+        """Загрузка отметок анонса; одновременные нажатия ждут одну загрузку"""
+        if event_id in self._votes or event_id in self._closed:
+            return
+        task = self._loading.get(event_id)
+        if task is None:
+            task = self._loading[event_id] = asyncio.create_task(self._fetch(database, event_id))
+            task.add_done_callback(lambda _: self._loading.pop(event_id, None))
+        await task
+
+    async def tap(self, database, event_id: int, user_id: int, status: str,
+                  chat_id: int, message_id: int) -> Optional[str]:
+        """Нажатие кнопки; повторное нажатие той же кнопки снимает отметку. Возвращает новый статус"""
+        await self._load(database, event_id)
+        if event_id in self._closed:
+            raise RsvpClosed(event_id)
+
+        votes = self._votes[event_id]
+        previous = votes.get(user_id)
+        current = None if previous == status else status
+        if current is None:
+            votes.pop(user_id, None)
+        else:
+            votes[user_id] = current
+        for changed, delta in ((previous, -1), (current, 1)):
+            if changed is not None:
+                self._counts[event_id][changed] += delta
+                self._deltas[event_id][changed] += delta
+
+        self._pending[(event_id, user_id)] = current
+        self._posts[event_id] = (chat_id, message_id)
+        self._dirty[event_id] = None
+        if self._wakeup is not None:
+            self._wakeup.set()
+        metrics.counter('rsvp.taps_total').inc()
+        return current
+
+    def counts(self, event_id: int) -> Dict[str, int]:
+        counts = self._counts.get(event_id) or Counter()
+        return {status: counts[status] for status in STATUSES if counts[status] > 0}
+
+    def keyboard(self, database, event_id: int):
+        """Кнопки поста с текущими счетчиками (для поста, который публикуется или заменяется заново)"""
+        if event_id in self._counts:
+            counts = self.counts(event_id)
+        else:
+            counts = database.get_rsvp_counts([event_id]).get(event_id, {})
+        return get_rsvp_keyboard(event_id, counts)
+
+    def close(self, event_id: int):
+        """Анонс снят или ушел в архив: кнопки больше не перерисовываются"""
+        self._closed.add(event_id)
+        for state in (self._votes, self._counts, self._posts, self._dirty, self._rendered):
+            state.pop(event_id, None)
+
+    async def flush(self, database):
+        """Запись накопленных отметок одной транзакцией и пересчет счетчиков по БД"""
+        if not self._pending:
+            return
+        loop = asyncio.get_running_loop()
+        batch, self._pending = self._pending, {}
+        deltas, self._deltas = self._deltas, defaultdict(Counter)
+        rows = [(event_id, user_id, status) for (event_id, user_id), status in batch.items()]
+        try:
+            await loop.run_in_executor(None, database.save_rsvps, rows, REMIND_BEFORE)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения отметок: {e}")
+            # Вернем в очередь все, что не изменилось заново за время записи
+            for item, status in batch.items():
+                self._pending.setdefault(item, status)
+            for event_id, delta in deltas.items():
+                self._deltas[event_id].update(delta)
+            return
+        metrics.counter('rsvp.flushed_total').inc(len(rows))
+
+        # Пересчет по БД исправляет расхождение, если запись в БД менялась помимо этого процесса
+        event_ids = [event_id for event_id in deltas if event_id in self._counts]
+        stored = await loop.run_in_executor(None, database.get_rsvp_counts, event_ids)
+        for event_id, counts in stored.items():
+            if event_id not in self._counts:
+                continue
+            fresh = Counter(counts) + self._deltas.get(event_id, Counter())
+            if fresh != +self._counts[event_id]:
+                self._counts[event_id] = fresh
+                self._dirty[event_id] = None
+        if self._dirty and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run_flusher(self, database, interval: float):
+        """Фоновая запись отметок каждые interval секунд"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush(database)
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи отметок: {e}")
+
+    async def run_renderer(self, bot):
+        """Фоновая перерисовка кнопок постов, у которых изменились счетчики"""
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while True:
+            if not self._dirty:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            started = loop.time()
+            dirty, self._dirty = list(self._dirty), {}
+            for event_id in dirty:
+                if await self._render(bot, event_id):
+                    await asyncio.sleep(self.edit_pause)
+            # Каждый пост правится не чаще render_interval: нажатия за это время копятся
+            await asyncio.sleep(max(0.0, self.render_interval - (loop.time() - started)))
+
+    async def _render(self, bot, event_id: int) -> bool:
+        """Правка кнопок одного поста; False - править нечего"""
+        post = self._posts.get(event_id)
+        counts = self.counts(event_id)
+        if post is None or counts == self._rendered.get(event_id):
+            return False
+        chat_id, message_id = post
+        try:
+            await bot.edit_message_reply_markup(
+                chat_id=chat_id, message_id=message_id, reply_markup=get_rsvp_keyboard(event_id, counts)
+            )
+            metrics.counter('rsvp.renders_total').inc()
+        except RetryAfter as e:
+            logger.warning(f"RSVP render throttled by Telegram, pausing for {e.retry_after}s")
+            self._dirty[event_id] = None
+            await asyncio.sleep(e.retry_after)
+            return False
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                logger.warning(f"Could not update RSVP buttons of post {message_id}: {e}")
+        except TelegramError as e:
+            logger.warning(f"Could not update RSVP buttons of post {message_id}: {e}")
+            return True
+        self._rendered[event_id] = counts
+        return True
+
+board = RsvpBoard()
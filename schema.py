@@ -0,0 +1,197 @@
+"""
+Версионированные миграции схемы для SQLite и PostgreSQL.
+
+Миграции лежат в migrations/<backend>/NNNN_name.sql и применяются по порядку.
+Номер последней примененной миграции хранится в таблице schema_version,
+поэтому при совпадении версии старт обходится без единого DDL-запроса.
+"""
+import os
+import re
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Маркер для миграций, которые нельзя выполнять в транзакции
+# (например, CREATE INDEX CONCURRENTLY в PostgreSQL)
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+
+# Ключ advisory-блокировки, чтобы несколько процессов не мигрировали одновременно
+PG_ADVISORY_LOCK_KEY = 72610426
+
+_FILENAME_RE = re.compile(r'^(\d+)_(\w+)\.sql$')
+_CONCURRENT_INDEX_RE = re.compile(
+    r'^CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)', re.IGNORECASE
+)
+_migrations_cache = {}
+
+def load_migrations(backend: str) -> List[Tuple[int, str, str]]:
+    """Загрузка списка миграций (версия, имя, SQL) для бэкенда"""
+    if backend in _migrations_cache:
+        return _migrations_cache[backend]
+
+    directory = os.path.join(MIGRATIONS_DIR, backend)
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME_RE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+
+    _migrations_cache[backend] = migrations
+    return migrations
+
+def latest_version(backend: str) -> int:
+    """Номер последней доступной миграции"""
+    migrations = load_migrations(backend)
+    return migrations[-1][0] if migrations else 0
+
+def split_statements(sql: str) -> List[str]:
+    """Разбиение SQL-скрипта на отдельные выражения"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+def current_version(conn, backend: str) -> int:
+    """Текущая версия схемы (0, если таблицы schema_version нет)"""
+    cursor = conn.cursor()
+    try:
+        if backend == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+            )
+        else:
+            cursor.execute("SELECT to_regclass('schema_version')")
+        row = cursor.fetchone()
+        if not row or row[0] is None:
+            return 0
+
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        row = cursor.fetchone()
+        return row[0] or 0
+    finally:
+        cursor.close()
+
+def _ensure_version_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _upgrade_legacy_sqlite(cursor):
+    """Поддержка баз, созданных до появления колонки contact"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'events'")
+    if not cursor.fetchone():
+        return
+    cursor.execute('PRAGMA table_info(events)')
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'contact' not in columns:
+        cursor.execute('ALTER TABLE events ADD COLUMN contact TEXT')
+        logger.info("✅ Добавлена колонка 'contact' в таблицу events")
+
+def _apply_sqlite(conn, version: int, name: str, sql: str):
+    conn.executescript(
+        'BEGIN;\n'
+        f'{sql}\n;\n'
+        f"INSERT INTO schema_version (version, name) VALUES ({version}, '{name}');\n"
+        'COMMIT;'
+    )
+
+def _index_valid(cursor, index: str):
+    """indisvalid индекса; None, если индекса нет"""
+    cursor.execute(
+        'SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s)',
+        (index,)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def _create_index_concurrently(cursor, index: str, statement: str):
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS с проверкой результата.
+
+    Прерванная сборка оставляет индекс INVALID, а IF NOT EXISTS его пропускает:
+    такой индекс удаляется перед повторной сборкой, а если и новая сборка
+    оставила его невалидным, миграция падает, не записывая версию.
+    """
+    if _index_valid(cursor, index) is False:
+        logger.warning(f"Индекс {index} остался невалидным после прерванной сборки, пересоздаем")
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index}')
+    cursor.execute(statement)
+    if _index_valid(cursor, index) is not True:
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index}')
+        raise RuntimeError(f"Index {index} is invalid after CREATE INDEX CONCURRENTLY")
+
+def _apply_postgres(cursor, version: int, name: str, sql: str):
+    statements = split_statements(sql)
+    transactional = NO_TRANSACTION_MARKER not in sql
+
+    if transactional:
+        cursor.execute('BEGIN')
+    try:
+        for statement in statements:
+            match = None if transactional else _CONCURRENT_INDEX_RE.match(statement)
+            if match:
+                _create_index_concurrently(cursor, match.group(1), statement)
+                continue
+            cursor.execute(statement)
+        cursor.execute(
+            'INSERT INTO schema_version (version, name) VALUES (%s, %s)',
+            (version, name)
+        )
+        if transactional:
+            cursor.execute('COMMIT')
+    except Exception:
+        if transactional:
+            cursor.execute('ROLLBACK')
+        raise
+
+def migrate(conn, backend: str) -> int:
+    """
+    Применение недостающих миграций.
+
+    Для SQLite соединение должно быть открыто с isolation_level=None,
+    для PostgreSQL - в режиме autocommit.
+    Возвращает итоговую версию схемы.
+    """
+    target = latest_version(backend)
+    version = current_version(conn, backend)
+    if version >= target:
+        return version
+
+    cursor = conn.cursor()
+    try:
+        if backend == 'postgres':
+            cursor.execute('SELECT pg_advisory_lock(%s)', (PG_ADVISORY_LOCK_KEY,))
+            # Другой процесс мог применить миграции, пока мы ждали блокировку
+            version = current_version(conn, backend)
+
+        _ensure_version_table(cursor)
+        if backend == 'sqlite' and version == 0:
+            _upgrade_legacy_sqlite(cursor)
+
+        for migration_version, name, sql in load_migrations(backend):
+            if migration_version <= version:
+                continue
+            logger.info(f"⏫ Применяется миграция {backend}/{migration_version:04d}_{name}")
+            if backend == 'sqlite':
+                _apply_sqlite(conn, migration_version, name, sql)
+            else:
+                _apply_postgres(cursor, migration_version, name, sql)
+            version = migration_version
+
+        logger.info(f"✅ Схема базы данных обновлена до версии {version}")
+        return version
+    finally:
+        if backend == 'postgres':
+            cursor.execute('SELECT pg_advisory_unlock(%s)', (PG_ADVISORY_LOCK_KEY,))
+        cursor.close()
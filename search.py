@@ -0,0 +1,158 @@
+"""
+Полнотекстовый поиск по опубликованным анонсам.
+
+В PostgreSQL используется встроенная русская конфигурация to_tsvector('russian').
+В SQLite у FTS5 нет русского стеммера, поэтому тема, место и описание
+приводятся к основам слов здесь (стеммер Snowball для русского языка) и уже
+в таком виде хранятся в таблице events_fts. Поисковый запрос стеммится так же.
+"""
+import re
+from typing import Dict, Optional
+
+# Поля события, по которым идет поиск (в порядке убывания веса)
+SEARCH_FIELDS = ('theme', 'place', 'description')
+# Веса полей для bm25 в SQLite (в PostgreSQL - setweight A/B/C)
+SEARCH_WEIGHTS = (3.0, 2.0, 1.0)
+
+_WORD_RE = re.compile(r'\w+')
+_VOWELS = 'аеиоуыэюя'
+
+# Служебные слова не индексируются (в PostgreSQL их так же отбрасывает конфигурация russian)
+STOP_WORDS = frozenset(
+    'и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только '
+    'ее мне было вот от меня еще нет о из ему когда даже ну ли если уже или ни быть был него '
+    'до вас там потом себя ей может они тут где есть надо ней для мы тебя их чем была сам без '
+    'под будет тогда кто этот того этого какой здесь этом чтобы нее куда при об после над '
+    'через эти нас про них много перед между'.split()
+)
+
+def _endings(*items: str):
+    return sorted(items, key=len, reverse=True)
+
+_PERFECTIVE_GERUND_1 = _endings('в', 'вши', 'вшись')
+_PERFECTIVE_GERUND_2 = _endings('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')
+_ADJECTIVE = _endings(
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'
+)
+_PARTICIPLE_1 = _endings('ем', 'нн', 'вш', 'ющ', 'щ')
+_PARTICIPLE_2 = _endings('ивш', 'ывш', 'ующ')
+_REFLEXIVE = _endings('ся', 'сь')
+_VERB_1 = _endings('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют',
+                   'ны', 'ть', 'ешь', 'нно')
+_VERB_2 = _endings(
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+    'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'
+)
+_NOUN = _endings(
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой',
+    'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь',
+    'ию', 'ью', 'ю', 'ия', 'ья', 'я'
+)
+_SUPERLATIVE = _endings('ейш', 'ейше')
+_DERIVATIONAL = _endings('ост', 'ость')
+
+def _regions(word: str):
+    """Начала областей RV и R2 по правилам Snowball"""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in _VOWELS:
+            rv = i + 1
+            break
+
+    def after_consonant_after_vowel(start: int) -> int:
+        for i in range(start + 1, len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = after_consonant_after_vowel(0)
+    r2 = after_consonant_after_vowel(r1)
+    return rv, r2
+
+def _strip(word: str, start: int, endings, preceded_by: str = '') -> Optional[str]:
+    """Удаление самого длинного окончания из endings, целиком лежащего после start"""
+    for ending in endings:
+        if not word.endswith(ending):
+            continue
+        cut = len(word) - len(ending)
+        if preceded_by:
+            if cut - 1 < start or word[cut - 1] not in preceded_by:
+                continue
+        elif cut < start:
+            continue
+        return word[:cut]
+    return None
+
+def _strip_grouped(word: str, start: int, group1, group2) -> Optional[str]:
+    """Окончания первой группы удаляются, только если перед ними стоит а или я"""
+    candidates = [
+        result for result in (_strip(word, start, group1, 'ая'), _strip(word, start, group2))
+        if result is not None
+    ]
+    # Из двух групп выбираем более длинное окончание
+    return min(candidates, key=len) if candidates else None
+
+def stem(word: str) -> str:
+    """Основа русского слова (стеммер Snowball); другие слова возвращаются в нижнем регистре"""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+
+    # Шаг 1
+    result = _strip_grouped(word, rv, _PERFECTIVE_GERUND_1, _PERFECTIVE_GERUND_2)
+    if result is None:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        result = _strip(word, rv, _ADJECTIVE)
+        if result is not None:
+            result = _strip_grouped(result, rv, _PARTICIPLE_1, _PARTICIPLE_2) or result
+        else:
+            result = _strip_grouped(word, rv, _VERB_1, _VERB_2)
+            if result is None:
+                result = _strip(word, rv, _NOUN)
+    if result is not None:
+        word = result
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word = _strip(word, r2, _DERIVATIONAL) or word
+
+    # Шаг 4
+    if word.endswith('нн'):
+        return word[:-1]
+    result = _strip(word, rv, _SUPERLATIVE)
+    if result is not None:
+        return result[:-1] if result.endswith('нн') else result
+    if word.endswith('ь') and len(word) - 1 >= rv:
+        return word[:-1]
+    return word
+
+def _words(text: Optional[str]):
+    return [
+        word for word in _WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+        if word not in STOP_WORDS
+    ]
+
+def stem_text(text: Optional[str]) -> str:
+    """Текст в виде основ слов через пробел (без служебных слов)"""
+    return ' '.join(stem(word) for word in _words(text))
+
+def fts_document(event: Dict) -> Dict[str, str]:
+    """Строка для таблицы events_fts (SQLite)"""
+    return {field: stem_text(event.get(field)) for field in SEARCH_FIELDS}
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Выражение FTS5 MATCH для запроса пользователя: все слова (в виде основ) должны
+    встретиться, последнее слово может быть недописанным. None - в запросе нет слов.
+    """
+    stems = [stem(word) for word in _words(text)]
+    if not stems:
+        return None
+    terms = [f'"{term}"' for term in stems]
+    terms[-1] += '*'
+    return ' '.join(terms)
@@ -0,0 +1,320 @@
+"""
+Подписки на новые прогулки: ключевые слова, район (точка и радиус) и время
+(дни недели, часть дня). Условия одной подписки объединяются через И,
+ключевые слова - через ИЛИ.
+
+Подписки держатся в памяти в инвертированном индексе: основа слова → подписки,
+клетка geohash → подписки района, (день недели, час) → подписки только на
+время. При публикации анонса кандидаты берутся только из ячеек индекса для
+слов, клетки и времени анонса, поэтому поиск получателей не зависит от общего
+числа подписчиков. Подписки на время подходят по самой ячейке и не проверяются. Индекс обновляется точечно при
+подписке и отписке, а изменения из других процессов кластера подтягиваются
+по updated_at раз в SUBSCRIPTION_REFRESH_SECONDS.
+
+Подписка действует в своем сообществе (tenants.py): ключи индекса начинаются
+с tenant_id, так что анонс одного города не перебирает подписки других.
+"""
+import re
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+from config import DEFAULT_TENANT_ID, SUBSCRIPTION_LOAD_BATCH
+from utils import format_subscription_alert
+from broadcast import sender
+import search
+import geo
+from eventtime import TIMEZONE
+import metrics
+import tenants
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'\w+')
+
+_WEEKEND = frozenset({5, 6})
+_WEEKDAYS = frozenset({0, 1, 2, 3, 4})
+# Слова запроса, задающие дни недели (0 - понедельник)
+DAY_WORDS = {
+    'выходные': _WEEKEND, 'выходным': _WEEKEND, 'выходных': _WEEKEND,
+    'будни': _WEEKDAYS, 'будням': _WEEKDAYS,
+    'понедельник': {0}, 'понедельникам': {0},
+    'вторник': {1}, 'вторникам': {1},
+    'среда': {2}, 'среду': {2}, 'средам': {2},
+    'четверг': {3}, 'четвергам': {3},
+    'пятница': {4}, 'пятницу': {4}, 'пятницам': {4},
+    'суббота': {5}, 'субботу': {5}, 'субботам': {5},
+    'воскресенье': {6}, 'воскресеньям': {6},
+}
+# Слова запроса, задающие часть дня: [с, до) часов
+HOUR_WORDS = {
+    'утро': (6, 12), 'утром': (6, 12), 'утрам': (6, 12),
+    'днем': (12, 17), 'днями': (12, 17),
+    'вечер': (17, 24), 'вечером': (17, 24), 'вечерам': (17, 24),
+}
+
+class Subscription(NamedTuple):
+    id: int
+    user_id: int
+    query: str                        # запрос в том виде, в котором его ввел пользователь
+    terms: FrozenSet[str]             # основы ключевых слов
+    lat: Optional[float] = None       # центр района
+    lng: Optional[float] = None
+    radius_km: Optional[float] = None
+    days: FrozenSet[int] = frozenset()
+    hour_from: Optional[int] = None
+    hour_to: Optional[int] = None
+    tenant_id: int = DEFAULT_TENANT_ID
+
+class EventKey(NamedTuple):
+    """Признаки анонса, по которым подбираются подписки"""
+    tenant_id: int
+    terms: FrozenSet[str]
+    lat: Optional[float]
+    lng: Optional[float]
+    geohash: Optional[str]
+    weekday: Optional[int]
+    hour: Optional[int]
+
+def parse_query(text: str) -> Dict[str, Any]:
+    """Колонки подписки из текста запроса: ключевые слова, дни недели и часы"""
+    days: Set[int] = set()
+    hours = None
+    terms = []
+    for word in _WORD_RE.findall((text or '').lower().replace('ё', 'е')):
+        if word in DAY_WORDS:
+            days |= DAY_WORDS[word]
+        elif word in HOUR_WORDS:
+            hours = HOUR_WORDS[word]
+        elif word not in search.STOP_WORDS:
+            terms.append(search.stem(word))
+    return {
+        'keywords': ' '.join(dict.fromkeys(terms)) or None,
+        'days': ''.join(str(day) for day in sorted(days)) or None,
+        'hour_from': hours[0] if hours else None,
+        'hour_to': hours[1] if hours else None,
+    }
+
+def from_row(row: Dict[str, Any]) -> Subscription:
+    return Subscription(
+        id=row['id'], user_id=row['user_id'], query=row['query'] or '',
+        terms=frozenset((row['keywords'] or '').split()),
+        lat=row['lat'], lng=row['lng'], radius_km=row['radius_km'],
+        days=frozenset(int(day) for day in row['days'] or ''),
+        hour_from=row['hour_from'], hour_to=row['hour_to'],
+        tenant_id=row.get('tenant_id', DEFAULT_TENANT_ID),
+    )
+
+def event_key(event: Dict[str, Any]) -> EventKey:
+    text = ' '.join(event.get(field) or '' for field in search.SEARCH_FIELDS)
+    starts_at = event.get('starts_at')
+    start = datetime.fromtimestamp(starts_at, TIMEZONE) if starts_at is not None else None
+    return EventKey(
+        tenant_id=event.get('tenant_id', DEFAULT_TENANT_ID),
+        terms=frozenset(search.stem_text(text).split()),
+        lat=event.get('lat'), lng=event.get('lng'), geohash=event.get('geohash'),
+        weekday=start.weekday() if start else None,
+        hour=start.hour if start else None,
+    )
+
+def matches(subscription: Subscription, key: EventKey) -> bool:
+    """Подходит ли анонс под все условия подписки"""
+    if subscription.terms and subscription.terms.isdisjoint(key.terms):
+        return False
+    if subscription.lat is not None:
+        if key.lat is None or geo.haversine_km(
+                subscription.lat, subscription.lng, key.lat, key.lng) > subscription.radius_km:
+            return False
+    if subscription.days and key.weekday not in subscription.days:
+        return False
+    if subscription.hour_from is not None:
+        if key.hour is None or not subscription.hour_from <= key.hour < subscription.hour_to:
+            return False
+    return True
+
+def _slots(subscription: Subscription) -> List[Tuple[int, int]]:
+    """(день недели, час), подходящие подписке на время"""
+    days = subscription.days or range(7)
+    if subscription.hour_from is None:
+        hours = range(24)
+    else:
+        hours = range(subscription.hour_from, subscription.hour_to)
+    return [(day, hour) for day in days for hour in hours]
+
+class SubscriptionIndex:
+    """Инвертированный индекс подписок"""
+
+    def __init__(self):
+        self.subscriptions: Dict[int, Subscription] = {}
+        # Ключи индексов начинаются с tenant_id: (сообщество, основа слова) → подписки
+        self.by_term: Dict[Tuple[int, str], Set[int]] = defaultdict(set)
+        self.by_cell: Dict[Tuple[int, str], Set[int]] = defaultdict(set)
+        # Подписки только на время: (сообщество, день недели, час) → подписки, которым подходит это время
+        self.by_slot: Dict[Tuple[int, int, int], Set[int]] = defaultdict(set)
+        # Подписки без условий подходят под любой анонс своего сообщества
+        self.unkeyed: Dict[int, Set[int]] = defaultdict(set)
+        self.by_user: Dict[int, Set[int]] = defaultdict(set)
+        # Длины клеток geohash в индексе: сколько подписок использует каждую
+        self._precisions: Dict[int, int] = defaultdict(int)
+        self._cells: Dict[int, List[str]] = {}
+        self._synced_at = 0.0
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def add(self, subscription: Subscription):
+        self.remove(subscription.id)
+        self.subscriptions[subscription.id] = subscription
+        self.by_user[subscription.user_id].add(subscription.id)
+        tenant_id = subscription.tenant_id
+        if subscription.terms:
+            # Подписка со словами попадает в кандидаты только через слова
+            for term in subscription.terms:
+                self.by_term[(tenant_id, term)].add(subscription.id)
+        elif subscription.lat is not None:
+            cells = geo.cover_prefixes(subscription.lat, subscription.lng, subscription.radius_km)
+            self._cells[subscription.id] = cells
+            self._precisions[len(cells[0])] += 1
+            for cell in cells:
+                self.by_cell[(tenant_id, cell)].add(subscription.id)
+        elif subscription.days or subscription.hour_from is not None:
+            for day, hour in _slots(subscription):
+                self.by_slot[(tenant_id, day, hour)].add(subscription.id)
+        else:
+            self.unkeyed[tenant_id].add(subscription.id)
+
+    def remove(self, subscription_id: int):
+        subscription = self.subscriptions.pop(subscription_id, None)
+        if subscription is None:
+            return
+        self.by_user[subscription.user_id].discard(subscription_id)
+        if not self.by_user[subscription.user_id]:
+            del self.by_user[subscription.user_id]
+        tenant_id = subscription.tenant_id
+        for term in subscription.terms:
+            self._discard(self.by_term, (tenant_id, term), subscription_id)
+        cells = self._cells.pop(subscription_id, None)
+        if cells:
+            precision = len(cells[0])
+            self._precisions[precision] -= 1
+            if not self._precisions[precision]:
+                del self._precisions[precision]
+            for cell in cells:
+                self._discard(self.by_cell, (tenant_id, cell), subscription_id)
+        elif not subscription.terms:
+            for day, hour in _slots(subscription):
+                self._discard(self.by_slot, (tenant_id, day, hour), subscription_id)
+        self._discard(self.unkeyed, tenant_id, subscription_id)
+
+    def remove_user(self, user_id: int):
+        for subscription_id in list(self.by_user.get(user_id, ())):
+            self.remove(subscription_id)
+
+    @staticmethod
+    def _discard(index: Dict[Any, Set[int]], key: Any, subscription_id: int):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(subscription_id)
+            if not ids:
+                del index[key]
+
+    def certain(self, key: EventKey) -> Set[int]:
+        """Подписки, которые подходят под анонс без проверки (только время или без условий)"""
+        result = set(self.unkeyed.get(key.tenant_id, ()))
+        if key.weekday is not None:
+            result |= self.by_slot.get((key.tenant_id, key.weekday, key.hour), set())
+        return result
+
+    def candidates(self, key: EventKey) -> Set[int]:
+        """Подписки со словами или районом, которые нужно проверить по всем условиям"""
+        result = set()
+        for term in key.terms:
+            ids = self.by_term.get((key.tenant_id, term))
+            if ids:
+                result |= ids
+        if key.geohash:
+            for precision in self._precisions:
+                ids = self.by_cell.get((key.tenant_id, key.geohash[:precision]))
+                if ids:
+                    result |= ids
+        return result
+
+    def match(self, event: Dict[str, Any]) -> Set[int]:
+        """ID пользователей, чьи подписки подходят под анонс"""
+        key = event_key(event)
+        by_id = self.subscriptions
+        users = {by_id[subscription_id].user_id for subscription_id in self.certain(key)}
+        for subscription_id in self.candidates(key):
+            subscription = by_id[subscription_id]
+            if subscription.user_id not in users and matches(subscription, key):
+                users.add(subscription.user_id)
+        return users
+
+    async def load(self, database, batch_size: int = SUBSCRIPTION_LOAD_BATCH) -> int:
+        """Загрузка активных подписок порциями по id"""
+        loop = asyncio.get_running_loop()
+        self._synced_at = time.time()
+        last_id = 0
+        while True:
+            rows = await loop.run_in_executor(None, database.get_active_subscriptions, last_id, batch_size)
+            for row in rows:
+                self.add(from_row(row))
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1]['id']
+        metrics.gauge('subscriptions.total').set(len(self))
+        return len(self)
+
+    async def refresh(self, database) -> int:
+        """Применение подписок и отписок, сделанных с прошлой синхронизации (в том числе другими процессами)"""
+        loop = asyncio.get_running_loop()
+        started = time.time()
+        # Перекрытие в секунду: запись, начатая до прошлой синхронизации, могла закоммититься после нее
+        rows = await loop.run_in_executor(None, database.get_subscriptions_updated_since, self._synced_at - 1)
+        self._synced_at = started
+        for row in rows:
+            if row['active']:
+                self.add(from_row(row))
+            else:
+                self.remove(row['id'])
+        metrics.gauge('subscriptions.total').set(len(self))
+        return len(rows)
+
+    async def run(self, database, interval: float):
+        """Первичная загрузка индекса и периодическая синхронизация с БД"""
+        try:
+            loaded = await self.load(database)
+            if loaded:
+                logger.info(f"✅ Загружено подписок: {loaded}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки подписок: {e}")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh(database)
+            except Exception as e:
+                logger.error(f"❌ Ошибка синхронизации подписок: {e}")
+
+index = SubscriptionIndex()
+
+def announce(event: Dict[str, Any]) -> int:
+    """Постановка уведомлений о новом анонсе в очередь рассылки; возвращает число получателей"""
+    try:
+        with metrics.histogram('subscriptions.match_seconds').time():
+            users = index.match(event)
+        users.discard(event['user_id'])
+        if not users:
+            return 0
+        text = format_subscription_alert(event, tenants.registry.channel_of(event))
+        for user_id in users:
+            sender.enqueue(user_id, text, parse_mode='HTML', disable_web_page_preview=True)
+    except Exception as e:
+        # Уведомления не должны мешать публикации
+        logger.error(f"❌ Ошибка рассылки по подпискам для анонса {event.get('id')}: {e}", exc_info=True)
+        return 0
+    metrics.counter('subscriptions.alerts_total').inc(len(users))
+    logger.info("Event %s matched %s subscribers", event.get('id'), len(users))
+    return len(users)
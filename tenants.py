@@ -0,0 +1,174 @@
+"""
+Сообщества (города), которые обслуживает один процесс бота.
+
+Сообщество - строка таблицы tenants: свой чат администраторов, свой канал
+и, при необходимости, свои лимиты частоты. Сообщество 1 создается при старте
+из ADMIN_CHAT_ID и CHANNEL_ID, остальные добавляются в таблицу без перезапуска:
+реестр в памяти подтягивает изменения по updated_at раз в TENANT_REFRESH_SECONDS
+(в режиме кластера - в каждом воркере).
+
+Анонсы и подписки помечены tenant_id; поиск, прогулки рядом, дайджест и
+«Мои анонсы» работают в пределах сообщества. Пользователь выбирает город
+командой /city или ссылкой t.me/<бот>?start=<slug>; пока сообщество одно,
+выбирать нечего.
+"""
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from config import (
+    ADMIN_CHAT_ID, CHANNEL_ID, DEFAULT_TENANT_ID, DEFAULT_TENANT_SLUG, DEFAULT_TENANT_TITLE
+)
+from ratelimit import limiter
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class Tenant(NamedTuple):
+    id: int
+    slug: str
+    title: str
+    admin_chat_id: str
+    channel_id: str
+    # Лимиты сообщества вместо RATE_LIMITS / GLOBAL_RATE_LIMITS: действие → (N, период в секундах)
+    rate_limits: Dict[str, Tuple[int, float]] = {}
+    global_rate_limits: Dict[str, Tuple[int, float]] = {}
+
+def _parse_limits(limits: Dict[str, list]) -> Dict[str, Tuple[int, float]]:
+    return {action: (int(limit[0]), float(limit[1])) for action, limit in (limits or {}).items()}
+
+def from_row(row: Dict[str, Any]) -> Tenant:
+    """Сообщество из строки tenants; rate_limits - JSON вида {"user": {...}, "global": {...}}"""
+    limits = row.get('rate_limits') or {}
+    if isinstance(limits, str):
+        limits = json.loads(limits)
+    return Tenant(
+        id=row['id'], slug=row['slug'], title=row['title'],
+        admin_chat_id=str(row['admin_chat_id']), channel_id=str(row['channel_id']),
+        rate_limits=_parse_limits(limits.get('user')),
+        global_rate_limits=_parse_limits(limits.get('global')),
+    )
+
+class TenantRegistry:
+    """Сообщества в памяти: поиск по id, чату администраторов и slug"""
+
+    def __init__(self):
+        self._by_id: Dict[int, Tenant] = {}
+        self._by_admin_chat: Dict[str, List[Tenant]] = {}
+        self._by_slug: Dict[str, Tenant] = {}
+        self._synced_at = 0.0
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, tenant_id: Optional[int]) -> Optional[Tenant]:
+        return self._by_id.get(tenant_id)
+
+    def by_slug(self, slug: str) -> Optional[Tenant]:
+        return self._by_slug.get((slug or '').lower())
+
+    def by_admin_chat(self, chat_id) -> List[Tenant]:
+        """Сообщества, которые модерируются из этого чата"""
+        return self._by_admin_chat.get(str(chat_id), [])
+
+    def all(self) -> List[Tenant]:
+        return sorted(self._by_id.values(), key=lambda tenant: tenant.title)
+
+    def default(self) -> Optional[Tenant]:
+        """Сообщество по умолчанию: 1 или единственное"""
+        tenant = self._by_id.get(DEFAULT_TENANT_ID)
+        if tenant is None and len(self._by_id) == 1:
+            tenant = next(iter(self._by_id.values()))
+        return tenant
+
+    def channel(self, tenant_id: int) -> Optional[str]:
+        """Канал сообщества"""
+        tenant = self._by_id.get(tenant_id)
+        if tenant is None:
+            # Реестр еще не загружен: сообщество по умолчанию публикуется в CHANNEL_ID
+            return CHANNEL_ID if tenant_id == DEFAULT_TENANT_ID else None
+        return tenant.channel_id
+
+    def admin_chat(self, tenant_id: int) -> Optional[str]:
+        """Чат администраторов сообщества"""
+        tenant = self._by_id.get(tenant_id)
+        if tenant is None:
+            return ADMIN_CHAT_ID if tenant_id == DEFAULT_TENANT_ID else None
+        return tenant.admin_chat_id
+
+    def channel_of(self, event: Dict[str, Any]) -> Optional[str]:
+        """Канал, в котором публикуется анонс"""
+        return self.channel(event.get('tenant_id', DEFAULT_TENANT_ID))
+
+    def admin_chat_of(self, event: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Чат администраторов, который модерирует анонс"""
+        return self.admin_chat((event or {}).get('tenant_id', DEFAULT_TENANT_ID))
+
+    def add(self, tenant: Tenant):
+        self.remove(tenant.id)
+        self._by_id[tenant.id] = tenant
+        self._by_admin_chat.setdefault(tenant.admin_chat_id, []).append(tenant)
+        self._by_slug[tenant.slug.lower()] = tenant
+        limiter.set_tenant_limits(tenant.id, tenant.rate_limits, tenant.global_rate_limits)
+
+    def remove(self, tenant_id: int):
+        tenant = self._by_id.pop(tenant_id, None)
+        if tenant is None:
+            return
+        chats = self._by_admin_chat[tenant.admin_chat_id]
+        chats.remove(tenant)
+        if not chats:
+            del self._by_admin_chat[tenant.admin_chat_id]
+        self._by_slug.pop(tenant.slug.lower(), None)
+        limiter.set_tenant_limits(tenant_id, {})
+
+    def refresh(self, database) -> int:
+        """Применение изменений таблицы tenants с прошлой синхронизации; возвращает число изменений"""
+        started = time.time()
+        # Перекрытие в секунду: запись, начатая до прошлой синхронизации, могла закоммититься после нее
+        rows = database.get_tenants_updated_since(self._synced_at - 1 if self._synced_at else 0)
+        self._synced_at = started
+        for row in rows:
+            if row['active']:
+                self.add(from_row(row))
+            else:
+                self.remove(row['id'])
+        metrics.gauge('tenants.total').set(len(self))
+        return len(rows)
+
+    def load(self, database) -> int:
+        """Создание сообщества по умолчанию из переменных окружения и загрузка всех сообществ"""
+        if ADMIN_CHAT_ID and CHANNEL_ID:
+            database.ensure_default_tenant(DEFAULT_TENANT_SLUG, DEFAULT_TENANT_TITLE, ADMIN_CHAT_ID, CHANNEL_ID)
+        self._synced_at = 0.0
+        self.refresh(database)
+        return len(self)
+
+    async def run(self, database, interval: float):
+        """Периодическая синхронизация с таблицей tenants"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.refresh, database)
+            except Exception as e:
+                logger.error(f"❌ Ошибка синхронизации сообществ: {e}")
+
+registry = TenantRegistry()
+
+def current(context) -> Optional[Tenant]:
+    """Сообщество, выбранное пользователем (или сообщество по умолчанию)"""
+    return registry.get(context.user_data.get('tenant_id')) or registry.default()
+
+def current_id(context) -> int:
+    tenant = current(context)
+    return tenant.id if tenant else DEFAULT_TENANT_ID
+
+def chosen_id(context) -> Optional[int]:
+    """ID сообщества пользователя; None - сообществ несколько, а пользователь еще не выбрал"""
+    tenant = registry.get(context.user_data.get('tenant_id'))
+    if tenant is not None:
+        return tenant.id
+    return current_id(context) if len(registry) <= 1 else None
@@ -0,0 +1,248 @@
+"""
+Фильтр ругательств и рекламных ссылок в тексте анонса.
+
+Запрещенные слова (BANNED_TERMS_FILE) собраны в автомат Ахо-Корасик: поле
+проверяется за один проход по тексту независимо от длины списка. Перед
+проверкой текст и слова нормализуются одинаково: нижний регистр, латинские
+двойники заменяются кириллицей (x → х, o → о, 0 → о), ё → е, убираются
+точки, дефисы и невидимые символы внутри слов, повторы букв схлопываются.
+Так «Kазин0» и «к.а.з.и.и.н.о» ловятся словом «казино».
+
+Строка файла - одно слово; * в начале или конце снимает требование границы
+слова с этой стороны: «казино» - только слово целиком, «казино*» - и «казиному»,
+«*казино*» - любое вхождение. Строки с # - комментарии.
+
+Ссылки разрешены только на домены из LINK_ALLOWLIST_FILE (карты): строка
+«2gis.ru» пропускает домен и его поддомены, «google.com/maps» - только пути,
+начинающиеся с /maps. Адреса почты и @username ссылками не считаются.
+
+Оба файла перечитываются при изменении (раз в TEXT_FILTER_REFRESH_SECONDS,
+в режиме кластера - в каждом воркере); пропавший файл отключает свою проверку.
+"""
+import os
+import re
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from config import BANNED_TERMS_FILE, LINK_ALLOWLIST_FILE
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Латинские буквы и цифры, похожие на кириллические, и символы, которыми разбивают слова.
+# Заменяются цепочкой str.replace: str.translate со словарем на кириллице в разы медленнее
+_HOMOGLYPHS = tuple({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м', 'o': 'о',
+    'p': 'р', 't': 'т', 'u': 'и', 'x': 'х', 'y': 'у', 'ё': 'е',
+    '0': 'о', '3': 'з', '4': 'ч', '6': 'б', '@': 'а',
+    '.': '', '-': '', '_': '', '*': '',
+    '\u00ad': '', '\u200b': '', '\u200c': '', '\u200d': '', '\u2060': '', '\ufeff': '',
+}.items())
+_REPEATS = re.compile(r'(.)\1+')
+
+# Домен без схемы считается ссылкой только с одной из этих зон: «ул.Ленина» и «т.е.» - не ссылки
+LINK_TLDS = frozenset((
+    'com net org info biz io me ru su рф рус ua by kz uz rs срб xyz online site top club shop '
+    'store app dev link ly gl cc co tv pro fun live space website tk ml ga cf gq ws to gg'
+).split())
+_LINK = re.compile(
+    r'(?<![\w@.-])(?P<scheme>https?://)?(?P<host>(?:[\w-]+\.)+[\w-]{2,})(?P<path>/[^\s?#]*)?',
+    re.IGNORECASE
+)
+
+def normalize(text: str) -> str:
+    """Текст в том виде, в котором сравнивается со словами фильтра"""
+    text = text.lower()
+    for char, replacement in _HOMOGLYPHS:
+        if char in text:
+            text = text.replace(char, replacement)
+    return _REPEATS.sub(r'\1', text)
+
+class Term(NamedTuple):
+    text: str           # исходная строка файла
+    length: int         # длина нормализованного слова
+    open_left: bool     # не требуется граница слова слева
+    open_right: bool    # не требуется граница слова справа
+
+def parse_term(line: str) -> Optional[Tuple[str, Term]]:
+    """Строка файла → (нормализованное слово, Term); None для пустых строк и комментариев"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    open_left, open_right = line.startswith('*'), line.endswith('*')
+    key = normalize(line.strip('*').strip())
+    if not key:
+        return None
+    return key, Term(line, len(key), open_left, open_right)
+
+class Automaton:
+    """Автомат Ахо-Корасик над нормализованными словами"""
+
+    def __init__(self, terms: Iterable[Tuple[str, Term]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Слова, которые заканчиваются в состоянии, включая суффиксы по ссылкам неудач
+        self.out: List[Tuple[Term, ...]] = [()]
+        self.size = 0
+        for key, term in terms:
+            self._add(key, term)
+        self._link()
+
+    def _add(self, key: str, term: Term):
+        state = 0
+        for ch in key:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = self.goto[state][ch] = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+            state = nxt
+        self.out[state] += (term,)
+        self.size += 1
+
+    def _link(self):
+        """Ссылки неудач обходом в ширину; выходы состояния дополняются выходами его ссылки"""
+        goto, fail, out = self.goto, self.fail, self.out
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                back = fail[state]
+                while back and ch not in goto[back]:
+                    back = fail[back]
+                target = goto[back].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                out[nxt] += out[fail[nxt]]
+
+    def find(self, text: str) -> Optional[Term]:
+        """Первое слово фильтра в нормализованном тексте с учетом границ слов"""
+        goto, fail, out = self.goto, self.fail, self.out
+        last = len(text) - 1
+        state = 0
+        for end, ch in enumerate(text):
+            nxt = goto[state].get(ch)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto[state].get(ch)
+            state = nxt or 0
+            if not out[state]:
+                continue
+            for term in out[state]:
+                start = end - term.length + 1
+                if not term.open_left and start > 0 and text[start - 1].isalnum():
+                    continue
+                if not term.open_right and end < last and text[end + 1].isalnum():
+                    continue
+                return term
+        return None
+
+def parse_allowlist(lines: Iterable[str]) -> Tuple[Tuple[str, str], ...]:
+    """Строки «домен[/путь]» → пары (домен, префикс пути)"""
+    allowed = []
+    for line in lines:
+        line = line.strip().lower()
+        if not line or line.startswith('#'):
+            continue
+        line = re.sub(r'^https?://', '', line)
+        host, _, path = line.partition('/')
+        allowed.append((host.removeprefix('www.'), '/' + path if path else ''))
+    return tuple(allowed)
+
+def find_link(text: str, allowed: Sequence[Tuple[str, str]]) -> Optional[str]:
+    """Первая ссылка на домен не из списка разрешенных"""
+    for match in _LINK.finditer(text):
+        host = match['host'].lower()
+        if not match['scheme'] and not host.startswith('www.') and host.rsplit('.', 1)[1] not in LINK_TLDS:
+            continue
+        host = host.removeprefix('www.')
+        path = (match['path'] or '').lower()
+        if not any((host == domain or host.endswith('.' + domain)) and path.startswith(prefix)
+                   for domain, prefix in allowed):
+            return host
+    return None
+
+class Hit(NamedTuple):
+    kind: str      # 'term' или 'link'
+    value: str     # строка фильтра или домен ссылки
+
+class TextFilter:
+    """Запрещенные слова и разрешенные ссылки с перечитыванием файлов при изменении"""
+
+    def __init__(self, terms_path: str = BANNED_TERMS_FILE, allowlist_path: str = LINK_ALLOWLIST_FILE):
+        self.terms_path = os.path.join(BASE_DIR, terms_path)
+        self.allowlist_path = os.path.join(BASE_DIR, allowlist_path)
+        # (автомат или None, разрешенные домены или None) - заменяются одним присваиванием
+        self._rules: Optional[Tuple[Optional[Automaton], Optional[Tuple[Tuple[str, str], ...]]]] = None
+        self._stamp = None
+
+    def _mtime(self, path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read(self, path: str) -> Optional[List[str]]:
+        try:
+            with open(path, encoding='utf-8') as file:
+                return file.read().splitlines()
+        except FileNotFoundError:
+            logger.warning(f"Файл фильтра {path} не найден, проверка отключена")
+            return None
+
+    def load(self, terms: Optional[Iterable[str]], allowed: Optional[Iterable[str]]):
+        """Сборка правил из строк файлов; None отключает проверку"""
+        automaton = Automaton(filter(None, map(parse_term, terms))) if terms is not None else None
+        allowlist = parse_allowlist(allowed) if allowed is not None else None
+        self._rules = (automaton, allowlist)
+        metrics.gauge('textfilter.terms').set(automaton.size if automaton else 0)
+        return automaton, allowlist
+
+    def reload(self) -> bool:
+        """Перечитывание файлов, если они изменились; возвращает True, если правила обновлены"""
+        stamp = (self._mtime(self.terms_path), self._mtime(self.allowlist_path))
+        if stamp == self._stamp and self._rules is not None:
+            return False
+        try:
+            automaton, allowlist = self.load(self._read(self.terms_path), self._read(self.allowlist_path))
+        except Exception as e:
+            # Оставляем прежние правила; при первой загрузке проверка отключена до следующей попытки
+            logger.error(f"❌ Ошибка загрузки фильтра текста: {e}")
+            if self._rules is None:
+                self._rules = (None, None)
+            return False
+        self._stamp = stamp
+        logger.info(f"✅ Фильтр текста: запрещенных слов {automaton.size if automaton else 0}, "
+                    f"разрешенных доменов {len(allowlist) if allowlist is not None else 'без проверки'}")
+        return True
+
+    def check(self, text: str) -> Optional[Hit]:
+        """Проверка поля: запрещенное слово или ссылка не из списка; None - текст в порядке"""
+        if self._rules is None:
+            self.reload()
+        automaton, allowlist = self._rules
+        if automaton is not None and automaton.size:
+            term = automaton.find(normalize(text))
+            if term is not None:
+                metrics.counter('textfilter.terms_rejected_total').inc()
+                return Hit('term', term.text)
+        if allowlist is not None:
+            host = find_link(text, allowlist)
+            if host is not None:
+                metrics.counter('textfilter.links_rejected_total').inc()
+                return Hit('link', host)
+        return None
+
+    async def run(self, interval: float):
+        """Периодическая проверка файлов фильтра"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(None, self.reload)
+
+screen = TextFilter()
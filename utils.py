@@ -1,4 +1,5 @@
 import re
+import html
 from typing import Dict, Any, Optional
 from datetime import datetime
 
@@ -37,6 +38,22 @@ def format_event_announcement(event: Dict[str, Any]) -> str:
     
     return "\n".join(lines)
 
+def format_digest(events, title: bool = True) -> str:
+    """
+    Дайджест: несколько анонсов одним постом (в переданном порядке).
+    Прошедшие и отмененные прогулки сворачиваются в одну строку.
+    """
+    parts = ["🗓 <b>ПРОГУЛКИ НА БЛИЖАЙШИЕ ДНИ</b>"] if title else []
+    for event in events:
+        theme = html.escape(event.get('theme') or 'Без темы')
+        if event.get('status') == 'archived':
+            parts.append(f"⌛ <s>{theme}</s> - прогулка уже прошла")
+        elif event.get('status') == 'unpublished':
+            parts.append(f"🚫 <s>{theme}</s> - прогулка отменена автором")
+        else:
+            parts.append(format_event_announcement(event))
+    return "\n\n➖➖➖➖➖\n\n".join(parts)
+
 def format_admin_preview(event: Dict[str, Any], user_info: str = "") -> str:
     """Форматирование превью для администратора"""
     lines = [
@@ -59,6 +76,158 @@ def format_admin_preview(event: Dict[str, Any], user_info: str = "") -> str:
     
     return "\n".join(lines)
 
+# Названия полей анонса в сообщениях о правках
+FIELD_TITLES = {
+    'theme': 'Тема',
+    'place': 'Место',
+    'contact': 'Контакт',
+    'event_time': 'Время',
+    'photo_file_id': 'Фото',
+    'description': 'Описание',
+}
+
+def format_revision_preview(revision: Dict[str, Any], original: Dict[str, Any], changes: Dict[str, Any],
+                            user_info: str = "", channel_id=None) -> str:
+    """Правка опубликованного анонса для администратора: только изменившиеся поля"""
+    lines = [
+        "✏️ <b>ПРАВКА ОПУБЛИКОВАННОГО АНОНСА</b>",
+        "",
+        f"👤 <b>Автор:</b> {user_info}",
+        f"🆔 <b>ID события:</b> {original['id']} (правка #{revision['id']})",
+    ]
+    link = channel_post_link(channel_id, original.get('channel_message_id'))
+    if link:
+        lines.append(f"<a href='{link}'>Пост в канале</a>")
+    lines.extend(["", "📋 <b>ИЗМЕНЕНИЯ:</b>", "=" * 30])
+    
+    for field, new_value in changes.items():
+        old_value = original.get(field)
+        if field == 'photo_file_id':
+            action = "заменено" if old_value and new_value else "добавлено" if new_value else "удалено"
+            lines.append(f"🖼 <b>Фото:</b> {action}")
+            continue
+        lines.append(f"<b>{FIELD_TITLES[field]}:</b>")
+        lines.append(f"<s>{html.escape(old_value or '—')}</s>")
+        lines.append(html.escape(new_value or '—'))
+        lines.append("")
+    
+    lines.extend([
+        "=" * 30,
+        "После одобрения пост в канале обновится.",
+        "⚡ Выберите действие:"
+    ])
+    return "\n".join(lines)
+
+def format_user_announcements(events, channel_id=None) -> str:
+    """Список анонсов автора (раздел «Мои анонсы»)"""
+    lines = ["📋 <b>Твои анонсы</b>", ""]
+    for number, event in enumerate(events, start=1):
+        lines.append(format_event_summary(event, number, channel_id))
+        if event['status'] == 'pending':
+            lines.append("⏳ На модерации")
+        elif event['status'] == 'queued':
+            lines.append("🗓 Одобрен, выйдет в ближайшем дайджесте")
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+def format_duplicate_warning(matches) -> str:
+    """Предупреждение администратору о похожих анонсах"""
+    lines = ["⚠️ <b>ПОХОЖЕ НА ДУБЛИКАТ</b>"]
+    for match in matches[:3]:
+        lines.append(f"• анонс #{match.event_id} (сходство {match.similarity:.0%})")
+    return "\n".join(lines)
+
+def channel_post_link(channel_id, message_id) -> Optional[str]:
+    """Ссылка на пост в канале (для публичного @канала или ID вида -100...)"""
+    if not channel_id or not message_id:
+        return None
+    channel_id = str(channel_id)
+    if channel_id.startswith('@'):
+        return f"https://t.me/{channel_id[1:]}/{message_id}"
+    if channel_id.startswith('-100'):
+        return f"https://t.me/c/{channel_id[4:]}/{message_id}"
+    return None
+
+def format_event_summary(event: Dict[str, Any], number: Optional[int], channel_id=None, distance_km: float = None) -> str:
+    """Краткая карточка анонса для списков (поиск, события рядом)"""
+    prefix = f"{number}. " if number is not None else ""
+    lines = [f"{prefix}<b>{html.escape(event.get('theme') or 'Без темы')}</b>"]
+    details = []
+    if distance_km is not None:
+        details.append(f"🚶 {distance_km:.1f} км")
+    if event.get('place'):
+        # Ссылку на карту не показываем, только адрес
+        place = ' '.join(
+            line.strip() for line in event['place'].split('\n') if not is_google_maps_link(line.strip())
+        ).strip()
+        details.append(f"📍 {html.escape(truncate_text(place, 40))}" if place else "📍 на карте")
+    if event.get('event_time'):
+        details.append(f"🕐 {html.escape(event['event_time'])}")
+    if details:
+        lines.append(" · ".join(details))
+    if event.get('description'):
+        lines.append(html.escape(truncate_text(event['description'], 120)))
+    link = channel_post_link(channel_id, event.get('channel_message_id'))
+    if link:
+        lines.append(f"<a href='{link}'>Открыть анонс</a>")
+    return "\n".join(lines)
+
+def format_search_results(events, query: str, page: int, page_size: int, channel_id=None) -> str:
+    """Страница результатов поиска"""
+    lines = [f"🔎 <b>Результаты поиска:</b> «{html.escape(query)}»", ""]
+    for number, event in enumerate(events, start=page * page_size + 1):
+        lines.append(format_event_summary(event, number, channel_id))
+        lines.append("")
+    lines.append(f"Страница {page + 1}")
+    return "\n".join(lines)
+
+def format_nearby_events(nearby, radius_km: float, channel_id=None) -> str:
+    """Список ближайших анонсов: nearby - [(расстояние в км, событие)]"""
+    lines = [f"📍 <b>Прогулки рядом</b> (в радиусе {radius_km:g} км)", ""]
+    for number, (distance, event) in enumerate(nearby, start=1):
+        lines.append(format_event_summary(event, number, channel_id, distance))
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+def format_subscription_alert(event: Dict[str, Any], channel_id=None) -> str:
+    """Уведомление подписчику о новом анонсе"""
+    return "\n".join([
+        "🔔 <b>Новая прогулка по твоей подписке</b>",
+        "",
+        format_event_summary(event, None, channel_id),
+    ])
+
+def format_reminder(event: Dict[str, Any], channel_id=None) -> str:
+    """Напоминание о прогулке тем, кто отметился под постом"""
+    return "\n".join([
+        "⏰ <b>Скоро прогулка, на которую ты отметился</b>",
+        "",
+        format_event_summary(event, None, channel_id),
+    ])
+
+def format_subscription(subscription: Dict[str, Any]) -> str:
+    """Описание одной подписки: запрос и район"""
+    parts = []
+    if subscription.get('query'):
+        parts.append(f"«{html.escape(subscription['query'])}»")
+    if subscription.get('lat') is not None:
+        parts.append(f"📍 в радиусе {subscription['radius_km']:g} км от точки")
+    return " · ".join(parts) or "все новые прогулки"
+
+def format_subscriptions(subscriptions) -> str:
+    """Список подписок пользователя"""
+    if not subscriptions:
+        return (
+            "🔔 У тебя нет подписок.\n\n"
+            "Подпишись на новые прогулки командой /subscribe, например:\n"
+            "/subscribe парк выходные утром\n\n"
+            "Или отправь геолокацию и нажми «Подписаться на район»."
+        )
+    lines = ["🔔 <b>Твои подписки</b>", ""]
+    for number, subscription in enumerate(subscriptions, start=1):
+        lines.append(f"{number}. {format_subscription(subscription)}")
+    return "\n".join(lines)
+
 def validate_theme(theme: str) -> bool:
     """Валидация темы события"""
     if not theme or len(theme.strip()) < 3:
@@ -0,0 +1,149 @@
+"""
+Таблица шагов мастера создания анонса и правок из предпросмотра.
+
+Каждое поле описано один раз (Field): колонка в events, состояние ожидания
+ввода, проверка значения, вопрос шага и тексты ответов. Мастер и редактирование
+берут поле из словаря по состоянию или по имени из callback_data, поэтому
+обработка ввода не растет с числом полей, а новое поле - это новая строка
+в таблице.
+
+accept() не трогает БД и Telegram: переходы можно проверять и измерять отдельно
+(benchmarks/wizard.py). Принятый проверкой поля текст проходит фильтр
+ругательств и ссылок (textfilter.py) - один проход по тексту на поле.
+"""
+from typing import Callable, Dict, NamedTuple, Optional
+
+from config import STATES
+from keyboards import get_cancel_keyboard, get_skip_photo_keyboard
+from utils import validate_theme, validate_place, validate_contact, validate_time, validate_description
+import textfilter
+
+# Слово, которым в режиме редактирования очищается необязательное поле
+CLEAR_WORD = 'удалить'
+# Ответы на текст, не прошедший фильтр; найденное слово не повторяем
+TERM_ERROR = "❌ В тексте есть недопустимые слова или реклама. Исправь, пожалуйста, и отправь снова:"
+LINK_ERROR = ("❌ Ссылки на {host} в анонсе не разрешены. Можно ссылаться на карты "
+              "(Google Maps, Яндекс Карты, 2ГИС). Исправь, пожалуйста, и отправь снова:")
+
+class Field(NamedTuple):
+    name: str                        # имя поля в callback_data (edit_{name}_{event_id})
+    column: str                      # колонка в таблице events
+    state: str                       # состояние ожидания ввода в мастере
+    prompt: str                      # вопрос шага мастера
+    label: str                       # название поля в запросе нового значения при правке
+    error: str                       # ответ на некорректное значение ({length} - длина текста)
+    saved: str = ''                  # ответ после сохранения ({value} - введенный текст)
+    validator: Optional[Callable[[str], bool]] = None  # None - поле не вводится текстом
+    keyboard: Callable = get_cancel_keyboard
+    optional: bool = False           # можно пропустить в мастере (/skip) и очистить при правке
+    edit_prompt: Optional[str] = None
+
+class Result(NamedTuple):
+    value: Optional[str]             # значение для колонки (None - очистить)
+    error: Optional[str] = None      # текст ответа, если значение не принято
+
+FIELDS = (
+    Field(
+        name='theme', column='theme', state=STATES['WAITING_THEME'],
+        prompt="1️⃣ Какая тема у нашей прогулки? Например:\n"
+               "'Прогулка по центру города' или 'Встреча в парке'",
+        label='тему события',
+        saved="✅ Тема сохранена: {value}",
+        error="❌ Тема должна содержать от 3 до 100 символов. Попробуй еще раз:",
+        validator=validate_theme,
+    ),
+    Field(
+        name='place', column='place', state=STATES['WAITING_PLACE'],
+        prompt="2️⃣ Где встречаемся?\n\n"
+               "🗺 Лучший вариант: Скопируй ссылку из Google Maps\n"
+               "📝 Альтернатива: Напиши адрес текстом\n"
+               "💡 Совет: Можно написать название места и на следующей строке добавить ссылку\n\n"
+               "Примеры:\n"
+               "• https://maps.google.com/...\n"
+               "• Парк Горького, главный вход\n"
+               "• Кафе 'Пушкин'\nhttps://maps.google.com/...",
+        label='место проведения',
+        saved="✅ Место сохранено: {value}",
+        error="❌ Место должно содержать от 3 до 500 символов. Попробуй еще раз:",
+        validator=validate_place,
+    ),
+    Field(
+        name='contact', column='contact', state=STATES['WAITING_CONTACT'],
+        prompt="3️⃣ Контакт для связи\n\n"
+               "Оставьте контакт для связи (ваш username в Telegram или номер телефона). "
+               "Он будет виден всем в анонсе.\n\n"
+               "Примеры:\n"
+               "• @username\n"
+               "• +7 900 123-45-67\n"
+               "• Анна, @anna_walk",
+        label='контакт для связи',
+        saved="✅ Контакт сохранен: {value}",
+        error="❌ Контакт должен содержать от 3 до 100 символов. Попробуй еще раз:",
+        validator=validate_contact,
+    ),
+    Field(
+        name='time', column='event_time', state=STATES['WAITING_TIME'],
+        prompt="4️⃣ Когда встречаемся?\n\n"
+               "Укажите дату и время события.\n\n"
+               "Примеры:\n"
+               "• 25 декабря, 12:30\n"
+               "• Завтра в 18:00\n"
+               "• Суббота, 15 декабря в 14:00",
+        label='время проведения',
+        saved="✅ Время сохранено: {value}",
+        error="❌ Время должно содержать от 3 до 100 символов. Попробуй еще раз:",
+        validator=validate_time,
+    ),
+    Field(
+        name='photo', column='photo_file_id', state=STATES['WAITING_PHOTO'],
+        prompt="5️⃣ Супер! Теперь загрузите фото или картинку для анонса. Форматы: .png, .jpeg, .jpg\n"
+               "Если хотите продолжить без изображения, нажмите кнопку «Пропустить»",
+        label='фото события',
+        saved="✅ Фото сохранено!",
+        error="❌ Пожалуйста, отправьте фото.",
+        keyboard=get_skip_photo_keyboard,
+        optional=True,
+        edit_prompt="📝 Отправь новое фото для события или напиши 'удалить' чтобы убрать фото",
+    ),
+    Field(
+        name='description', column='description', state=STATES['WAITING_DESCRIPTION'],
+        prompt="6️⃣ Добавьте короткое описание прогулки\n"
+               "Расскажите, что планируете делать, что взять с собой (максимум 500 символов):",
+        label='описание события',
+        error="❌ Ваше описание слишком длинное ({length}/500 символов). "
+              "Пожалуйста, сократите его и отправьте снова.",
+        validator=validate_description,
+        optional=True,
+    ),
+)
+
+FIRST = FIELDS[0]
+# Поиск поля по состоянию мастера и по имени из callback_data - O(1)
+BY_STATE: Dict[str, Field] = {field.state: field for field in FIELDS}
+BY_NAME: Dict[str, Field] = {field.name: field for field in FIELDS}
+# Следующий шаг мастера; после последнего поля показывается предпросмотр (None)
+NEXT: Dict[str, Optional[Field]] = {
+    field.state: FIELDS[index + 1] if index + 1 < len(FIELDS) else None
+    for index, field in enumerate(FIELDS)
+}
+
+def accept(field: Field, text: str, editing: bool = False) -> Result:
+    """Проверка введенного текста для поля; в мастере необязательное поле пропускается через /skip"""
+    if field.optional and (text.lower() == CLEAR_WORD if editing else text == '/skip'):
+        return Result(None)
+    if field.validator is None or not field.validator(text):
+        return Result(None, field.error.format(length=len(text)))
+    hit = textfilter.screen.check(text)
+    if hit is not None:
+        return Result(None, TERM_ERROR if hit.kind == 'term' else LINK_ERROR.format(host=hit.value))
+    return Result(text)
+
+def step_message(field: Field, value: Optional[str] = None, saved: Optional[Field] = None) -> str:
+    """Вопрос шага field; saved - поле, сохраненное перед этим шагом"""
+    if saved is None:
+        return field.prompt
+    return f"{saved.saved.format(value=value)}\n\n{field.prompt}"
+
+def edit_prompt(field: Field) -> str:
+    """Запрос нового значения поля при правке из предпросмотра"""
+    return field.edit_prompt or f"📝 Введи новое значение для поля '{field.label}':"